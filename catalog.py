@@ -0,0 +1,299 @@
+"""
+Catalog version and rendered-fragment cache.
+
+Every write that changes what the storefront shows (products, stock,
+reservations) calls bump(). Rendered HTML and hydration JSON are cached
+(cached()) under the content version they were built from and rebuilt lazily
+once it moves on, so placing or accepting orders doesn't empty the cache.
+For that reason the rendered pages carry no stock figures: main.js and
+product.js fetch availability from the API after first paint.
+
+bump() also records which product / variant ids changed, so clients holding
+an older version can ask for just the changes (changes_since). The version
+starts from the clock so it keeps increasing across restarts; a version older
+than the retained log gets a full reload instead.
+
+Reservation changes are bumped as holds: they move the version and the change
+log (available quantities changed) but not content_version(), which only
+follows product and stock changes. Snapshots are built per content version
+and compute availability live, so holds don't rebuild them.
+
+With several worker processes the version and change log live in a small
+memory-mapped file (CATALOG_SHARED_FILE) guarded by flock, so a bump in one
+worker is seen by the next version() read in every other worker and their
+fragments are rebuilt. Where fcntl is unavailable (Windows) or the file can't
+be opened, the log is kept in-process.
+
+Shared files live in PRIVATE_DIR (CATALOG_DIR, default a per-user directory
+under the temp dir), created 0700. open_private() refuses symlinks and files
+that another user owns or could write to, so nobody else on the host can
+plant a catalog.
+"""
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAX_FRAGMENTS = 512
+MAX_CHANGES = 10000
+PRIVATE_DIR = os.getenv("CATALOG_DIR", os.path.join(
+    tempfile.gettempdir(), f"ashhab-{os.getuid()}" if hasattr(os, "getuid") else "ashhab"))
+SHARED_FILE = os.getenv("CATALOG_SHARED_FILE", os.path.join(
+    PRIVATE_DIR, f"catalog-{os.getenv('DB_NAME', 'clothing_store')}.bin"))
+
+KINDS = ("product", "variant")
+
+_lock = threading.Lock()
+_fragments = {}   # key -> (version, value)
+_seen = None      # version the local fragments were last checked against
+
+
+def _ensure_private_dir():
+    os.makedirs(PRIVATE_DIR, mode=0o700, exist_ok=True)
+    st = os.lstat(PRIVATE_DIR)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise OSError(f"{PRIVATE_DIR} must be a directory owned by this user with mode 0700")
+
+
+def open_private(path, flags):
+    """
+    os.open() for a file shared between workers. Creates PRIVATE_DIR when
+    path is in it; refuses a symlink, or a file owned by another user or
+    writable by group / others.
+    """
+    if os.path.dirname(os.path.abspath(path)) == os.path.abspath(PRIVATE_DIR):
+        _ensure_private_dir()
+    fd = os.open(path, flags | os.O_NOFOLLOW, 0o600)
+    st = os.fstat(fd)
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        os.close(fd)
+        raise OSError(f"{path} is not owned by this user or is writable by others")
+    return fd
+
+
+class _LocalLog:
+    """Version counter and change log for a single process"""
+
+    def __init__(self):
+        self._version = int(time.time())
+        self._horizon = self._version   # changes after this version are all retained
+        self._changes = deque(maxlen=MAX_CHANGES)   # (version, kind, id, deleted)
+        self._content = (self._version, time.time())
+
+    def version(self):
+        return self._version
+
+    def content_version(self):
+        return self._content[0]
+
+    def content(self):
+        return self._content
+
+    def append(self, rows, content=True):
+        with _lock:
+            self._version += 1
+            for kind, item_id, deleted in rows:
+                if len(self._changes) == self._changes.maxlen:
+                    self._horizon = self._changes[0][0]
+                self._changes.append((self._version, kind, item_id, deleted))
+            if content:
+                self._content = (self._version, time.time())
+            return self._version
+
+    def entries_since(self, since):
+        """(current version, [(kind, id, deleted), ...]) or (current, None) if too old"""
+        with _lock:
+            current = self._version
+            if since < self._horizon or since > current:
+                return current, None
+            return current, [c[1:] for c in self._changes if c[0] > since]
+
+
+class _SharedLog:
+    """
+    The same log in a memory-mapped file shared by every worker on the host.
+    Layout: header (magic, capacity, version, horizon, head, content version,
+    content bump time in ms) then a ring of `capacity` entries; head counts
+    entries ever written.
+    """
+    MAGIC = b"ASHCAT02"
+    HEADER = struct.Struct("<8sQQQQQQ")
+    ENTRY = struct.Struct("<QQBB6x")   # version, id, kind index, deleted
+    VERSION_OFFSET = 16
+    CONTENT_OFFSET = 40
+
+    def __init__(self, path, capacity=MAX_CHANGES):
+        self.capacity = capacity
+        size = self.HEADER.size + capacity * self.ENTRY.size
+        self._fd = open_private(path, os.O_RDWR | os.O_CREAT)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            magic, stored_capacity = self.HEADER.unpack_from(self._map, 0)[:2]
+            if magic != self.MAGIC or stored_capacity != capacity:
+                now = int(time.time())
+                self.HEADER.pack_into(self._map, 0, self.MAGIC, capacity, now, now, 0,
+                                      now, now * 1000)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def version(self):
+        # Aligned 8-byte field, only written under the lock: read it lock-free
+        return struct.unpack_from("<Q", self._map, self.VERSION_OFFSET)[0]
+
+    def content_version(self):
+        return struct.unpack_from("<Q", self._map, self.CONTENT_OFFSET)[0]
+
+    def content(self):
+        """(content version, time it was bumped), read together under the lock"""
+        with _lock:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                header = self.HEADER.unpack_from(self._map, 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return header[5], header[6] / 1000.0
+
+    def _entry_offset(self, n):
+        return self.HEADER.size + (n % self.capacity) * self.ENTRY.size
+
+    def append(self, rows, content=True):
+        with _lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                _, _, current, horizon, head, content_version, content_at = \
+                    self.HEADER.unpack_from(self._map, 0)
+                current += 1
+                for kind, item_id, deleted in rows:
+                    offset = self._entry_offset(head)
+                    if head >= self.capacity:
+                        horizon = max(horizon, self.ENTRY.unpack_from(self._map, offset)[0])
+                    self.ENTRY.pack_into(self._map, offset, current, item_id,
+                                         KINDS.index(kind), int(deleted))
+                    head += 1
+                if content:
+                    content_version, content_at = current, int(time.time() * 1000)
+                self.HEADER.pack_into(self._map, 0, self.MAGIC, self.capacity,
+                                      current, horizon, head, content_version, content_at)
+                return current
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def entries_since(self, since):
+        with _lock:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                _, _, current, horizon, head = self.HEADER.unpack_from(self._map, 0)[:5]
+                if since < horizon or since > current:
+                    return current, None
+                entries = []
+                for n in range(head - 1, max(head - self.capacity, 0) - 1, -1):
+                    entry_version, item_id, kind, deleted = \
+                        self.ENTRY.unpack_from(self._map, self._entry_offset(n))
+                    if entry_version <= since:
+                        break
+                    entries.append((KINDS[kind], item_id, bool(deleted)))
+                entries.reverse()
+                return current, entries
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+def _open_log():
+    if fcntl is None or not SHARED_FILE:
+        return _LocalLog()
+    try:
+        return _SharedLog(SHARED_FILE)
+    except OSError as e:
+        print(f"Catalog log not shared ({SHARED_FILE}): {e}")
+        return _LocalLog()
+
+
+_log = _open_log()
+
+
+def version():
+    return _log.version()
+
+
+def content_version():
+    """Version of the last product / stock change (holds don't move it)"""
+    return _log.content_version()
+
+
+def content_bumped_at():
+    """time.time() of the last product / stock change"""
+    return _log.content()[1]
+
+
+def bump(products=(), variants=(), deleted_products=(), deleted_variants=(), holds=()):
+    """
+    Mark the catalog as changed; cached fragments become stale. holds: variant
+    ids whose reservations changed - a bump with only holds leaves
+    content_version() where it was.
+    """
+    rows = [("product", int(i), False) for i in products] + \
+           [("variant", int(i), False) for i in variants] + \
+           [("product", int(i), True) for i in deleted_products] + \
+           [("variant", int(i), True) for i in deleted_variants]
+    content = bool(rows)
+    rows += [("variant", int(i), False) for i in holds]
+    current = _log.append(rows, content)
+    if content:
+        with _lock:
+            _fragments.clear()
+    return current
+
+
+def changes_since(since):
+    """
+    Ids changed after version `since`:
+    {"version", "products", "variants", "deleted_products", "deleted_variants"}
+    or None when `since` is outside the retained log (client must reload fully).
+    """
+    current, entries = _log.entries_since(since)
+    if entries is None:
+        return None
+
+    upserts = {"product": set(), "variant": set()}
+    deletes = {"product": set(), "variant": set()}
+    for kind, item_id, deleted in entries:
+        (deletes if deleted else upserts)[kind].add(item_id)
+        (upserts if deleted else deletes)[kind].discard(item_id)
+    return {"version": current,
+            "products": upserts["product"], "variants": upserts["variant"],
+            "deleted_products": deletes["product"], "deleted_variants": deletes["variant"]}
+
+
+def cached(key, build):
+    """Return the fragment for key at the current content version, building it if needed"""
+    global _seen
+    current = content_version()
+    if current != _seen:
+        # Bumped here or in another worker: drop everything built before it
+        with _lock:
+            _fragments.clear()
+            _seen = current
+
+    hit = _fragments.get(key)
+    if hit is not None and hit[0] == current:
+        return hit[1]
+
+    value = build()
+    with _lock:
+        if current == content_version():
+            if len(_fragments) >= MAX_FRAGMENTS:
+                _fragments.clear()
+            _fragments[key] = (current, value)
+    return value
@@ -0,0 +1,294 @@
+"""
+Memory-mapped catalog snapshot file shared by every worker on the host.
+
+One worker exports the catalog (products, variants, stock totals) into a
+compact binary file; every worker maps it read-only, so the strings and
+variant rows sit in the page cache once instead of in each process. Product
+records are decoded once per file (on the first listing) and reused until
+the next file replaces it. A worker that starts while the file matches the
+current catalog version (catalog.py) serves listings and product pages
+without touching the database.
+
+The catalog version only moves when the app itself writes. Edits made
+directly in the database, or a version counter that restarted below the
+file's, are picked up because a file older than MAX_AGE_SECONDS is
+re-exported even when its version still matches.
+
+Layout (little-endian):
+    header     magic, catalog version, export time, counts, section offsets
+    ids        product ids, sorted (position = product record number)
+    products   fixed-size records; strings are ids into the string table
+    variants   fixed-size records, each product's variants contiguous
+    strings    offsets (count + 1), then the UTF-8 blob
+
+When the catalog version moves on, the first worker to notice takes an flock,
+exports to a temporary file and renames it over the old one; the others map
+the new file on their next request. Mappings of the old file stay valid until
+the last request using them is done. Where fcntl is unavailable or the file
+can't be written, current() returns None and callers use catalog_snapshot.
+The file lives in catalog.PRIVATE_DIR and is only mapped if this user owns it
+and nobody else can write to it (catalog.open_private).
+
+Usage:
+    python catalog_file.py export    write the snapshot file now
+    python catalog_file.py info      show the file's version and counts
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+import catalog
+import catalog_snapshot
+import reservations
+from catalog_snapshot import Product
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+PATH = os.getenv("CATALOG_SNAPSHOT_FILE", os.path.join(
+    catalog.PRIVATE_DIR, f"snapshot-{os.getenv('DB_NAME', 'clothing_store')}.bin"))
+ENABLED = fcntl is not None and bool(PATH)
+MAX_AGE_SECONDS = int(os.getenv("CATALOG_SNAPSHOT_MAX_AGE_SECONDS", "300"))
+
+MAGIC = b"ASHSNP02"
+HEADER = struct.Struct("<8sQdIIIIIIII")  # magic, version, export time, products, variants,
+                                         # strings, ids / products / variants / strings / blob offsets
+PRODUCT = struct.Struct("<iIIIIdBxxxII")  # id, name, description, category, image,
+                                          # price, featured, first variant, variant count
+VARIANT = struct.Struct("<iIIi")        # id, size, color, stock quantity
+NULL = 0xFFFFFFFF
+
+_lock = threading.Lock()
+_current = None
+
+
+# ============= WRITER =============
+
+def _pack(snapshot):
+    strings, codes = [], {}
+
+    def sid(value):
+        if value is None:
+            return NULL
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(strings)
+            strings.append(str(value).encode("utf-8"))
+        return code
+
+    size_ids = [sid(s) for s in snapshot.sizes]
+    color_ids = [sid(c) for c in snapshot.colors]
+    products = b"".join(
+        PRODUCT.pack(p.product_id, sid(p.product_name), sid(p.description), sid(p.category),
+                     sid(p.image_url), p.price, p.featured, p.first_variant, p.variant_count)
+        for p in snapshot.products)
+    variants = b"".join(
+        VARIANT.pack(snapshot.variant_ids[j], size_ids[snapshot.variant_sizes[j]],
+                     color_ids[snapshot.variant_colors[j]], snapshot.variant_stock[j])
+        for j in range(len(snapshot.variant_ids)))
+    ids = struct.pack(f"<{len(snapshot.products)}i", *(p.product_id for p in snapshot.products))
+
+    offsets, position = [], 0
+    for s in strings:
+        offsets.append(position)
+        position += len(s)
+    offsets.append(position)
+    string_offsets = struct.pack(f"<{len(offsets)}I", *offsets)
+
+    ids_at = HEADER.size
+    products_at = ids_at + len(ids)
+    variants_at = products_at + len(products)
+    strings_at = variants_at + len(variants)
+    blob_at = strings_at + len(string_offsets)
+    header = HEADER.pack(MAGIC, snapshot.version, time.time(), len(snapshot.products),
+                         len(snapshot.variant_ids), len(strings),
+                         ids_at, products_at, variants_at, strings_at, blob_at)
+    return b"".join([header, ids, products, variants, string_offsets, *strings])
+
+
+def write(snapshot, path=PATH):
+    """Write a snapshot file next to path and rename it into place"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with os.fdopen(catalog.open_private(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC), "wb") as f:
+        f.write(_pack(snapshot))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def export(conn, version=None, path=PATH):
+    """Load the catalog from conn and write it to the snapshot file"""
+    snapshot = catalog_snapshot.load(conn, catalog.content_version() if version is None else version)
+    write(snapshot, path)
+    return snapshot
+
+
+# ============= READER =============
+
+class SnapshotFile:
+    """Read-only view of a snapshot file; same lookups as catalog_snapshot.Snapshot"""
+
+    def __init__(self, path=PATH):
+        with os.fdopen(catalog.open_private(path, os.O_RDONLY), "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.version, self.exported_at, self.product_count, self.variant_count,
+         string_count, ids_at, self._products_at, self._variants_at, strings_at, self._blob_at) = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        view = memoryview(self._map)
+        self._ids = view[ids_at:ids_at + 4 * self.product_count].cast("i")
+        self._string_offsets = view[strings_at:strings_at + 4 * (string_count + 1)].cast("I")
+        self._records = None
+        self._categories = None
+
+    def __len__(self):
+        return self.product_count
+
+    def _string(self, code):
+        if code == NULL:
+            return None
+        start = self._blob_at + self._string_offsets[code]
+        end = self._blob_at + self._string_offsets[code + 1]
+        return self._map[start:end].decode("utf-8")
+
+    def _product_at(self, i):
+        (product_id, name, description, category, image, price, featured,
+         first, count) = PRODUCT.unpack_from(self._map, self._products_at + i * PRODUCT.size)
+        return Product(product_id, self._string(name), self._string(description), price,
+                       self._string(category), self._string(image), featured,
+                       first, first + count)
+
+    def product(self, product_id):
+        """Product record by id (binary search over the id index), or None"""
+        i = bisect_left(self._ids, product_id)
+        if i == self.product_count or self._ids[i] != product_id:
+            return None
+        return self._records[i] if self._records is not None else self._product_at(i)
+
+    def records(self):
+        # The file never changes under a reader: decode once, share the list
+        if self._records is None:
+            self._records = [self._product_at(i) for i in range(self.product_count)]
+        return self._records
+
+    def categories(self):
+        if self._categories is None:
+            self._categories = sorted({p.category for p in self.records() if p.category is not None},
+                                      key=str.casefold)
+        return self._categories
+
+    def variants(self, product):
+        result = []
+        for j in range(product.first_variant, product.end_variant):
+            variant_id, size, color, stock = \
+                VARIANT.unpack_from(self._map, self._variants_at + j * VARIANT.size)
+            result.append({
+                "variant_id": variant_id,
+                "size": self._string(size),
+                "color": self._string(color),
+                "stock_quantity": stock,
+                "available_quantity": reservations.available_quantity(variant_id, stock),
+            })
+        return result
+
+    to_dict = catalog_snapshot.Snapshot.to_dict
+
+    def to_dicts(self, fields=None, include_variants=True, products=None):
+        return [self.to_dict(p, fields, include_variants)
+                for p in (self.records() if products is None else products)]
+
+
+def _open(path):
+    try:
+        return SnapshotFile(path)
+    except (OSError, ValueError):
+        return None
+
+
+def _fresh(reader, version):
+    """File at the catalog content version and younger than MAX_AGE_SECONDS"""
+    return reader is not None and reader.version == version and \
+        time.time() - reader.exported_at < MAX_AGE_SECONDS
+
+
+def current(connect, replica_delay=None, path=PATH):
+    """
+    Mapped snapshot at the current catalog content version and at most
+    MAX_AGE_SECONDS old, exporting a new file with a connection from
+    connect(intent) if there is none (see catalog_snapshot.current for
+    replica_delay). None when disabled or the file can't be written.
+    """
+    global _current
+    if not ENABLED:
+        return None
+    reader = _current
+    if _fresh(reader, catalog.content_version()):
+        return reader
+    if reader is not None and reader.version == catalog.content_version():
+        # Only too old: the database may have been edited directly
+        intent = "write" if replica_delay is None else "read"
+    else:
+        intent = catalog_snapshot.rebuild_intent(replica_delay)
+        if intent is None and reader is not None:
+            return reader
+
+    with _lock:
+        reader = _current
+        if _fresh(reader, catalog.content_version()):
+            return reader
+        try:
+            reader = _open(path)
+            if not _fresh(reader, catalog.content_version()):
+                # One exporter per host; the rest wait and map its file
+                with os.fdopen(catalog.open_private(f"{path}.lock", os.O_RDWR | os.O_CREAT)) as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    version = catalog.content_version()
+                    reader = _open(path)
+                    if not _fresh(reader, version):
+                        conn = connect(intent or "write")
+                        try:
+                            export(conn, version, path)
+                        finally:
+                            conn.close()
+                        reader = _open(path)
+        except OSError as e:
+            print(f"Catalog snapshot file unavailable ({path}): {e}")
+            return None
+        _current = reader
+    return reader
+
+
+def main(argv):
+    command = argv[0] if argv else ""
+    if command == "export":
+        from db import get_conn
+        conn = get_conn()
+        try:
+            snapshot = export(conn)
+        finally:
+            conn.close()
+        print(f"✓ Wrote {len(snapshot)} products at version {snapshot.version} to {PATH}")
+    elif command == "info":
+        reader = _open(PATH)
+        if reader is None:
+            print(f"✗ No snapshot at {PATH}")
+            return 1
+        age = time.time() - reader.exported_at
+        print(f"{PATH}: version {reader.version}, exported {age:.0f}s ago, "
+              f"{reader.product_count} products, {reader.variant_count} variants, "
+              f"{os.path.getsize(PATH)} bytes")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,334 @@
+"""
+Bulk product / variant / stock import for Ashhab Sport.
+
+Reads CSV or NDJSON rows with the columns
+
+    product_id (optional), product_name, description, price, category,
+    image_url, featured, size, color, quantity
+
+Products are matched by product_id when the row has one (so a feed can
+rename a product; an unknown id creates the product with that id) and by
+product_name otherwise (ignoring case, like MySQL); variants are matched by
+(product, size, color).
+Rows are validated and written in chunks; each chunk is one transaction using
+multi-row inserts/upserts. If a chunk fails its rows are retried one by one,
+so only the rows that fail on their own are reported. Stock quantities are
+absolute and the difference is logged to the inventory ledger as an
+ADJUSTMENT.
+
+Usage:
+    python catalog_import.py catalog.csv
+    python catalog_import.py catalog.ndjson --format ndjson
+"""
+import csv
+import io
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+import catalog
+import inventory
+from db import in_clause
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+DEFAULT_WAREHOUSE_ID = 1
+PLACEHOLDER_IMAGE = "/assets/img/products/placeholder.jpg"
+
+
+def read_rows(stream, fmt):
+    """Yield dict rows from a text stream in csv or ndjson format"""
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            yield row
+    elif fmt == "ndjson":
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield {"__error__": f"Invalid JSON: {e}"}
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+def _text(row, key):
+    v = row.get(key)
+    return str(v).strip() if v is not None else ""
+
+
+def validate_row(row):
+    """Return (clean_row, None) or (None, error message)"""
+    if "__error__" in row:
+        return None, row["__error__"]
+
+    name = _text(row, "product_name")
+    if not name:
+        return None, "product_name is required"
+
+    product_id = _text(row, "product_id")
+    if product_id:
+        try:
+            product_id = int(product_id)
+        except ValueError:
+            return None, "product_id must be an integer"
+        if product_id <= 0:
+            return None, "product_id must be positive"
+
+    clean = {
+        "product_id": product_id or None,
+        "product_name": name,
+        "description": _text(row, "description"),
+        "category": _text(row, "category"),
+        "image_url": _text(row, "image_url") or PLACEHOLDER_IMAGE,
+        "size": _text(row, "size"),
+        "color": _text(row, "color"),
+    }
+
+    try:
+        clean["price"] = Decimal(_text(row, "price"))
+        if clean["price"] < 0:
+            return None, "price must be >= 0"
+    except InvalidOperation:
+        return None, "price must be a number"
+    if not clean["category"]:
+        return None, "category is required"
+
+    featured = _text(row, "featured").lower()
+    clean["featured"] = 1 if featured in ("1", "true", "yes", "y") else 0
+
+    quantity = _text(row, "quantity")
+    if quantity:
+        if not (clean["size"] or clean["color"]):
+            return None, "quantity needs a size or color"
+        try:
+            clean["quantity"] = int(quantity)
+        except ValueError:
+            return None, "quantity must be an integer"
+        if clean["quantity"] < 0:
+            return None, "quantity must be >= 0"
+    else:
+        clean["quantity"] = None
+
+    return clean, None
+
+
+def _name_key(name):
+    """Product names compare case-insensitively, as the column's collation does"""
+    return name.casefold()
+
+
+def _product_ids(cur, names):
+    """{name key: product_id} for the products with any of the names (lowest id wins)"""
+    cur.execute(f"""
+        SELECT product_id, product_name FROM product
+        WHERE product_name IN ({in_clause(names)})
+        ORDER BY product_id
+    """, list(names))
+    ids = {}
+    for product_id, name in cur.fetchall():
+        ids.setdefault(_name_key(name), product_id)
+    return ids
+
+
+def _existing_ids(cur, product_ids):
+    cur.execute(f"SELECT product_id FROM product WHERE product_id IN ({in_clause(product_ids)})",
+                list(product_ids))
+    return {row[0] for row in cur.fetchall()}
+
+
+def _key(row):
+    """How a row finds its product: by id when given, else by name"""
+    if row["product_id"]:
+        return ("id", row["product_id"])
+    return ("name", _name_key(row["product_name"]))
+
+
+def _variant_ids(cur, product_ids):
+    cur.execute(f"""
+        SELECT variant_id, product_id, size, color FROM product_variant
+        WHERE product_id IN ({in_clause(product_ids)})
+    """, list(product_ids))
+    return {(p, s or "", c or ""): v for v, p, s, c in cur.fetchall()}
+
+
+def write_chunk(conn, rows, employee_id=None):
+    """Write one validated chunk in a single transaction. Returns counters."""
+    stats = {"products_created": 0, "products_updated": 0,
+             "variants_created": 0, "stock_updated": 0}
+    cur = conn.cursor()
+
+    # Products: last row wins for product fields within a chunk
+    products = {}
+    for r in rows:
+        products[_key(r)] = r
+    by_id = [key[1] for key in products if key[0] == "id"]
+    by_name = [r["product_name"] for key, r in products.items() if key[0] == "name"]
+    existing_ids = _existing_ids(cur, by_id) if by_id else set()
+    existing_names = _product_ids(cur, by_name) if by_name else {}
+
+    product_ids = {}   # key -> product_id
+    for key in products:
+        if key[0] == "id":
+            product_ids[key] = key[1]
+        elif key[1] in existing_names:
+            product_ids[key] = existing_names[key[1]]
+
+    cur.executemany("""
+        INSERT INTO product (product_id, product_name, description, price, category, image_url, featured)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE product_name = VALUES(product_name),
+            description = VALUES(description), price = VALUES(price), category = VALUES(category),
+            image_url = VALUES(image_url), featured = VALUES(featured)
+    """, [(product_ids.get(key), r["product_name"], r["description"], r["price"], r["category"],
+           r["image_url"], r["featured"]) for key, r in products.items()])
+    stats["products_updated"] = len(existing_ids) + len(existing_names)
+    stats["products_created"] = len(products) - stats["products_updated"]
+
+    created = [r["product_name"] for key, r in products.items() if key not in product_ids]
+    if created:
+        product_ids.update((("name", name), product_id)
+                           for name, product_id in _product_ids(cur, created).items())
+
+    # Variants
+    wanted = {}
+    for r in rows:
+        if r["size"] or r["color"]:
+            wanted[(product_ids[_key(r)], r["size"], r["color"])] = r
+    if wanted:
+        variant_ids = _variant_ids(cur, {k[0] for k in wanted})
+        missing = [k for k in wanted if k not in variant_ids]
+        if missing:
+            cur.executemany("""
+                INSERT INTO product_variant (product_id, size, color)
+                VALUES (%s, %s, %s)
+            """, missing)
+            stats["variants_created"] = len(missing)
+            variant_ids = _variant_ids(cur, {k[0] for k in wanted})
+
+        # Stock (absolute quantities, delta logged to the ledger)
+        levels = {}
+        for key, r in wanted.items():
+            if r["quantity"] is not None:
+                levels[variant_ids[key]] = r["quantity"]
+        if levels:
+            cur.execute(f"""
+                SELECT variant_id, quantity FROM stock
+                WHERE warehouse_id = %s AND variant_id IN ({in_clause(levels)})
+                FOR UPDATE
+            """, [DEFAULT_WAREHOUSE_ID, *levels])
+            previous = {v: int(q) for v, q in cur.fetchall()}
+
+            cur.executemany("""
+                INSERT INTO stock (warehouse_id, variant_id, quantity)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)
+            """, [(DEFAULT_WAREHOUSE_ID, v, q) for v, q in levels.items()])
+            inventory.record_movements(cur, [
+                (DEFAULT_WAREHOUSE_ID, v, 'ADJUSTMENT', q - previous.get(v, 0),
+                 employee_id, 'IMPORT', None, 'Bulk catalog import')
+                for v, q in levels.items() if q != previous.get(v, 0)
+            ])
+            stats["stock_updated"] = len(levels)
+
+    conn.commit()
+    cur.close()
+    catalog.bump(products=set(product_ids.values()),
+                 variants=variant_ids.values() if wanted else ())
+    return stats
+
+
+def import_rows(conn, rows, employee_id=None, chunk_size=CHUNK_SIZE):
+    """
+    Validate and write an iterable of raw rows chunk by chunk.
+    Returns a report with counters and per-row errors (1-based row numbers).
+    """
+    report = {"rows": 0, "imported": 0, "products_created": 0, "products_updated": 0,
+              "variants_created": 0, "stock_updated": 0, "error_count": 0, "errors": []}
+
+    def add_error(row_no, message):
+        report["error_count"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_no, "error": message})
+
+    def write(chunk):
+        stats = write_chunk(conn, [r for _, r in chunk], employee_id)
+        report["imported"] += len(chunk)
+        for k, v in stats.items():
+            report[k] += v
+
+    def flush(chunk):
+        if not chunk:
+            return
+        try:
+            write(chunk)
+        except Exception:
+            conn.rollback()
+            # Find the bad rows: retry each on its own
+            for row_no, row in chunk:
+                try:
+                    write([(row_no, row)])
+                except Exception as e:
+                    conn.rollback()
+                    add_error(row_no, str(e))
+
+    chunk = []
+    for row_no, raw in enumerate(rows, start=1):
+        report["rows"] += 1
+        clean, error = validate_row(raw)
+        if error:
+            add_error(row_no, error)
+            continue
+        chunk.append((row_no, clean))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+    return report
+
+
+def open_text(binary_stream):
+    """Wrap an uploaded binary stream for read_rows"""
+    return io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+
+
+def detect_format(filename, content_type=None):
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in (content_type or ""):
+        return "ndjson"
+    return "csv"
+
+
+def main(argv):
+    from db import get_conn
+
+    if not argv:
+        print(__doc__)
+        return 1
+
+    path = argv[0]
+    fmt = argv[argv.index("--format") + 1] if "--format" in argv else detect_format(path)
+
+    conn = get_conn()
+    started = time.time()
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            report = import_rows(conn, read_rows(f, fmt))
+    finally:
+        conn.close()
+
+    print(f"✓ {report['imported']}/{report['rows']} rows imported in {time.time() - started:.2f}s")
+    print(f"  products: +{report['products_created']} new, {report['products_updated']} updated")
+    print(f"  variants: +{report['variants_created']} new, stock rows: {report['stock_updated']}")
+    if report["error_count"]:
+        print(f"✗ {report['error_count']} rows rejected:")
+        for err in report["errors"][:50]:
+            print(f"  row {err['row']}: {err['error']}")
+    return 0 if not report["error_count"] else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,350 @@
+"""
+Compact, immutable in-memory catalog snapshot.
+
+The full catalog as list-of-dicts (what cursor(dictionary=True) returns) costs
+a dict per product and per variant. A Snapshot keeps products as __slots__
+records and variants as parallel typed arrays, with each product owning a
+contiguous range of them, plus prebuilt indexes:
+
+    by_category / by_size / by_color   value -> array of product positions
+    featured                           array of product positions
+
+A snapshot is never modified. current() rebuilds it when the catalog content
+version (catalog.py) has moved on and swaps the module reference in one
+assignment, so readers see either the old or the new catalog, never a mix.
+Available quantities depend on live reservations and are computed when
+serialized, not stored.
+
+Usage:
+    python catalog_snapshot.py bench [products] [variants per product]
+"""
+import sys
+import threading
+import time
+from array import array
+
+import catalog
+import reservations
+
+PRODUCT_FIELDS = ("product_id", "product_name", "description", "price",
+                  "category", "image_url", "featured")
+DEFAULT_FIELDS = list(PRODUCT_FIELDS)
+
+_build_lock = threading.Lock()
+_current = None
+
+
+class Product:
+    __slots__ = PRODUCT_FIELDS + ("first_variant", "end_variant")
+
+    def __init__(self, product_id, product_name, description, price, category,
+                 image_url, featured, first_variant, end_variant):
+        self.product_id = product_id
+        self.product_name = product_name
+        self.description = description
+        self.price = price
+        self.category = category
+        self.image_url = image_url
+        self.featured = featured
+        self.first_variant = first_variant
+        self.end_variant = end_variant
+
+    @property
+    def variant_count(self):
+        return self.end_variant - self.first_variant
+
+
+class Snapshot:
+    """Products, variants and stock at one catalog version"""
+
+    def __init__(self, version, products, variants):
+        """
+        products: rows with PRODUCT_FIELDS; variants: rows with product_id,
+        variant_id, size, color, stock_quantity (any order).
+        """
+        self.version = version
+        products = sorted(products, key=lambda p: p['product_id'])
+        position = {p['product_id']: i for i, p in enumerate(products)}
+        variants = sorted((v for v in variants if v['product_id'] in position),
+                          key=lambda v: (position[v['product_id']], v['variant_id']))
+
+        # Sizes and colors are stored once; variants hold their code
+        self.sizes, self.colors = [], []
+        size_codes, color_codes = {}, {}
+        self.variant_ids = array("i")
+        self.variant_sizes = array("I")
+        self.variant_colors = array("I")
+        self.variant_stock = array("i")
+        ranges = {}
+        for i, v in enumerate(variants):
+            first, _ = ranges.get(v['product_id'], (i, i))
+            ranges[v['product_id']] = (first, i + 1)
+            self.variant_ids.append(v['variant_id'])
+            self.variant_sizes.append(_code(v['size'], self.sizes, size_codes))
+            self.variant_colors.append(_code(v['color'], self.colors, color_codes))
+            self.variant_stock.append(int(v['stock_quantity']))
+
+        self.products = tuple(
+            Product(p['product_id'], p['product_name'], p['description'], float(p['price']),
+                    p['category'], p['image_url'], int(p['featured'] or 0),
+                    *ranges.get(p['product_id'], (0, 0)))
+            for p in products)
+        self.by_id = position
+
+        by_category, by_size, by_color = {}, {}, {}
+        self.featured = array("i")
+        for i, p in enumerate(self.products):
+            by_category.setdefault(p.category, array("i")).append(i)
+            if p.featured:
+                self.featured.append(i)
+            for code in set(self.variant_sizes[p.first_variant:p.end_variant]):
+                by_size.setdefault(self.sizes[code], array("i")).append(i)
+            for code in set(self.variant_colors[p.first_variant:p.end_variant]):
+                by_color.setdefault(self.colors[code], array("i")).append(i)
+        self.by_category, self.by_size, self.by_color = by_category, by_size, by_color
+
+    def __len__(self):
+        return len(self.products)
+
+    def records(self):
+        return self.products
+
+    def categories(self):
+        """Distinct categories, case-insensitive order; products without one are left out"""
+        return sorted((c for c in self.by_category if c is not None), key=str.casefold)
+
+    def product(self, product_id):
+        """Product record by id, or None"""
+        i = self.by_id.get(product_id)
+        return None if i is None else self.products[i]
+
+    def filter(self, category=None, featured=False, size=None, color=None, in_stock=False):
+        """
+        Product records matching every given criterion, in product_id order.
+        size / color / in_stock must hold for the same variant; in_stock means
+        available (on hand minus held), like the API's available_quantity.
+        """
+        candidates = []
+        if category is not None:
+            candidates.append(self.by_category.get(category, ()))
+        if featured:
+            candidates.append(self.featured)
+        if size is not None:
+            candidates.append(self.by_size.get(size, ()))
+        if color is not None:
+            candidates.append(self.by_color.get(color, ()))
+        if not candidates:
+            positions = range(len(self.products))
+        else:
+            candidates.sort(key=len)
+            positions = candidates[0]
+            for other in candidates[1:]:
+                keep = set(other)
+                positions = [i for i in positions if i in keep]
+
+        if (size is not None and color is not None) or in_stock:
+            size_code = _find(self.sizes, size)
+            color_code = _find(self.colors, color)
+            positions = [i for i in positions
+                         if self._has_variant(self.products[i], size_code, color_code, in_stock)]
+        return [self.products[i] for i in positions]
+
+    def _has_variant(self, product, size_code, color_code, in_stock):
+        for j in range(product.first_variant, product.end_variant):
+            if size_code is not None and self.variant_sizes[j] != size_code:
+                continue
+            if color_code is not None and self.variant_colors[j] != color_code:
+                continue
+            if in_stock and reservations.available_quantity(self.variant_ids[j],
+                                                            self.variant_stock[j]) <= 0:
+                continue
+            return True
+        return False
+
+    def variants(self, product):
+        """Variant dicts for a product, as served by the API"""
+        result = []
+        for j in range(product.first_variant, product.end_variant):
+            variant_id, stock = self.variant_ids[j], self.variant_stock[j]
+            result.append({
+                "variant_id": variant_id,
+                "size": self.sizes[self.variant_sizes[j]],
+                "color": self.colors[self.variant_colors[j]],
+                "stock_quantity": stock,
+                "available_quantity": reservations.available_quantity(variant_id, stock),
+            })
+        return result
+
+    def to_dict(self, product, fields=None, include_variants=True):
+        data = {f: getattr(product, f) for f in fields or DEFAULT_FIELDS}
+        if include_variants:
+            data['variants'] = self.variants(product)
+        return data
+
+    def to_dicts(self, fields=None, include_variants=True, products=None):
+        """Same shape as the /api/products listing"""
+        return [self.to_dict(p, fields, include_variants)
+                for p in (self.products if products is None else products)]
+
+
+def _code(value, values, codes):
+    code = codes.get(value)
+    if code is None:
+        code = codes[value] = len(values)
+        values.append(value)
+    return code
+
+
+def _find(values, value):
+    """Code of value, -1 if absent, None when not filtering on it"""
+    if value is None:
+        return None
+    return values.index(value) if value in values else -1
+
+
+def load(conn, version):
+    """Build a snapshot from the database"""
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("SELECT " + ", ".join(PRODUCT_FIELDS) + " FROM product")
+        products = cur.fetchall()
+        cur.execute("""
+            SELECT v.product_id, v.variant_id, v.size, v.color,
+                   COALESCE(SUM(s.quantity), 0) as stock_quantity
+            FROM product_variant v
+            LEFT JOIN stock s ON s.variant_id = v.variant_id
+            GROUP BY v.product_id, v.variant_id, v.size, v.color
+        """)
+        variants = cur.fetchall()
+    finally:
+        cur.close()
+    return Snapshot(version, products, variants)
+
+
+def rebuild_intent(replica_delay):
+    """
+    Where to rebuild a stale snapshot from: "read" (a replica) once the last
+    content change is replica_delay seconds old, by when every usable replica
+    has it; "write" (the primary) when replica_delay is None; None while the
+    change is younger than that - keep serving the previous snapshot, which is
+    no staler than a replica read would be.
+    """
+    if replica_delay is None:
+        return "write"
+    if time.time() - catalog.content_bumped_at() >= replica_delay:
+        return "read"
+    return None
+
+
+def current(connect, replica_delay=None):
+    """
+    Snapshot at the current catalog content version, rebuilt with a
+    connection from connect(intent) when stale. Reservation changes don't
+    make it stale: available quantities are computed on lookup. With
+    replica_delay, rebuilds wait for the change to reach the replicas and
+    read from one (see rebuild_intent); a worker with no snapshot yet builds
+    from the primary. Concurrent callers wait for the one rebuild.
+    """
+    global _current
+    snapshot = _current
+    if snapshot is not None and snapshot.version == catalog.content_version():
+        return snapshot
+    intent = rebuild_intent(replica_delay)
+    if intent is None and snapshot is not None:
+        return snapshot
+
+    with _build_lock:
+        snapshot = _current
+        version = catalog.content_version()
+        if snapshot is None or snapshot.version != version:
+            conn = connect(intent or "write")
+            try:
+                snapshot = load(conn, version)
+            finally:
+                conn.close()
+            _current = snapshot
+    return snapshot
+
+
+# ============= BENCHMARK =============
+# Synthetic catalog, compared with the list-of-dicts _fetch_products returns.
+
+def _synthetic_rows(count, per_product):
+    sizes = ["XS", "S", "M", "L", "XL", "XXL", "40", "41", "42", "43", "44"]
+    colors = ["Black", "White", "Red", "Blue", "Green", "Grey", "Navy", "Beige"]
+    categories = ["Shoes", "T-Shirts", "Hoodies", "Pants", "Jackets", "Accessories"]
+    products, variants = [], []
+    for pid in range(1, count + 1):
+        products.append({"product_id": pid, "product_name": f"Product {pid}",
+                         "description": f"Description of product {pid}", "price": 50.0 + pid % 400,
+                         "category": categories[pid % len(categories)],
+                         "image_url": f"/static/img/products/p{pid}.jpg", "featured": int(pid % 17 == 0)})
+        for k in range(per_product):
+            variants.append({"product_id": pid, "variant_id": pid * per_product + k,
+                             "size": sizes[(pid + k) % len(sizes)],
+                             "color": colors[(pid * 3 + k) % len(colors)],
+                             "stock_quantity": (pid * 7 + k) % 25})
+    return products, variants
+
+
+def _as_dicts(products, variants):
+    """The representation built by _fetch_products"""
+    by_product = {}
+    for v in variants:
+        v = dict(v)
+        by_product.setdefault(v.pop('product_id'), []).append(v)
+    return [{**p, "variants": by_product.get(p['product_id'], [])} for p in products]
+
+
+def bench(count=5000, per_product=6, rounds=50):
+    import tracemalloc
+
+    def measure(build):
+        tracemalloc.start()
+        value = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return value, size
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            result = fn()
+        return (time.perf_counter() - start) / rounds * 1000, len(result)
+
+    products, variants = _synthetic_rows(count, per_product)
+    dicts, dict_bytes = measure(lambda: _as_dicts(products, variants))
+    snapshot, snap_bytes = measure(lambda: Snapshot(0, products, variants))
+
+    queries = [
+        ("category", dict(category="Shoes"),
+         lambda p: p['category'] == "Shoes"),
+        ("featured", dict(featured=True),
+         lambda p: p['featured']),
+        ("category+size in stock", dict(category="Hoodies", size="M", in_stock=True),
+         lambda p: p['category'] == "Hoodies" and
+         any(v['size'] == "M" and v['stock_quantity'] > 0 for v in p['variants'])),
+        ("size+color", dict(size="L", color="Black"),
+         lambda p: any(v['size'] == "L" and v['color'] == "Black" for v in p['variants'])),
+    ]
+
+    print(f"{count} products x {per_product} variants")
+    print(f"  memory   dicts {dict_bytes / count:8.0f} B/product   "
+          f"snapshot {snap_bytes / count:8.0f} B/product")
+    for name, kwargs, predicate in queries:
+        dict_ms, dict_n = timed(lambda: [p for p in dicts if predicate(p)])
+        snap_ms, snap_n = timed(lambda: snapshot.filter(**kwargs))
+        assert dict_n == snap_n, (name, dict_n, snap_n)
+        print(f"  {name:<24} dicts {dict_ms:7.3f} ms   snapshot {snap_ms:7.3f} ms   ({snap_n} hits)")
+
+
+def main(argv):
+    if not argv or argv[0] != "bench":
+        print(__doc__)
+        return 1
+    bench(*(int(a) for a in argv[1:3]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
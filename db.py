@@ -1,6 +1,10 @@
 import os
 from pathlib import Path
+import threading
+import time
 import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
 
 def _load_env_file():
     root = Path(__file__).resolve().parents[1]
@@ -16,12 +20,184 @@ def _load_env_file():
 
 _load_env_file()
 
-def get_conn():
-    return mysql.connector.connect(
-        host=os.getenv("DB_HOST", "127.0.0.1"),
-        port=int(os.getenv("DB_PORT", "3306")),
-        user=os.getenv("DB_USER", "root"),
-        password=os.getenv("DB_PASS", "root1234"),
-        database=os.getenv("DB_NAME", "clothing_store"),
-        autocommit=False,
-    )
+DB_CONFIG = dict(
+    host=os.getenv("DB_HOST", "127.0.0.1"),
+    port=int(os.getenv("DB_PORT", "3306")),
+    user=os.getenv("DB_USER", "root"),
+    password=os.getenv("DB_PASS", "root1234"),
+    database=os.getenv("DB_NAME", "clothing_store"),
+    autocommit=False,
+)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+
+# Read replicas: DB_REPLICAS=host:port,host:port (same user/password/database).
+# Reads go round-robin to healthy replicas whose lag is within
+# DB_MAX_REPLICA_LAG seconds; a session that wrote in the last DB_PIN_SECONDS
+# reads from the primary (keep it above the max lag for read-your-writes).
+REPLICAS = [r.strip() for r in os.getenv("DB_REPLICAS", "").split(",") if r.strip()]
+MAX_REPLICA_LAG = float(os.getenv("DB_MAX_REPLICA_LAG", "2"))
+PIN_SECONDS = float(os.getenv("DB_PIN_SECONDS", "5"))
+HEALTH_CHECK_SECONDS = float(os.getenv("DB_HEALTH_CHECK_SECONDS", "5"))
+
+
+class _Connection:
+    """
+    Connection handle returned by get_conn(). The pools don't reset the session
+    on return (that would drop the prepared statements cached on it - see
+    statements.py), so close() rolls back whatever the caller left open instead.
+    """
+
+    def __init__(self, cnx, raw):
+        self.__dict__["_cnx"] = cnx
+        self.__dict__["raw"] = raw   # the underlying MySQL connection
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cnx, name, value)
+
+    def close(self):
+        try:
+            self._cnx.rollback()
+        except mysql.connector.Error:
+            pass
+        self._cnx.close()
+
+
+class _Node:
+    """One MySQL server with its own connection pool and health state"""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.healthy = True
+        self.lag = None   # seconds behind the primary (replicas only)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pooling.MySQLConnectionPool(
+                        pool_name=self.name, pool_size=POOL_SIZE,
+                        pool_reset_session=False, **self.config)
+        return self._pool
+
+    def connect(self):
+        """
+        Pooled connection (close() hands it back to the pool). When the pool is
+        exhausted, or DB_POOL_SIZE=0, a dedicated connection is opened instead.
+        """
+        if POOL_SIZE > 0:
+            try:
+                pooled = self._get_pool().get_connection()
+                return _Connection(pooled, pooled._cnx)
+            except PoolError:
+                pass
+        cnx = mysql.connector.connect(**self.config)
+        return _Connection(cnx, cnx)
+
+    def usable(self):
+        return self.healthy and self.lag is not None and self.lag <= MAX_REPLICA_LAG
+
+
+def _replica_config(address):
+    host, _, port = address.partition(":")
+    return {**DB_CONFIG, "host": host, "port": int(port or 3306)}
+
+
+_primary = _Node("ashhab", DB_CONFIG)
+_replicas = [_Node(f"ashhab-replica-{i}", _replica_config(a)) for i, a in enumerate(REPLICAS, 1)]
+_next_replica = 0
+_monitor_started = False
+_route_lock = threading.Lock()
+
+
+def replica_lag(conn):
+    """Seconds the server behind conn lags its source, or None if it isn't replicating"""
+    cur = conn.cursor(dictionary=True)
+    try:
+        try:
+            cur.execute("SHOW REPLICA STATUS")
+        except mysql.connector.Error:
+            cur.execute("SHOW SLAVE STATUS")   # MySQL < 8.0.22
+        status = cur.fetchone()
+    finally:
+        cur.close()
+    if not status:
+        return None
+    lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+    return None if lag is None else float(lag)
+
+
+def check_replicas():
+    """Refresh health and lag of every replica (run periodically by the monitor)"""
+    for node in _replicas:
+        try:
+            conn = mysql.connector.connect(**node.config, connection_timeout=3)
+            try:
+                node.lag = replica_lag(conn)
+            finally:
+                conn.close()
+            node.healthy = node.lag is not None
+        except Exception as e:
+            if node.healthy:
+                print(f"Replica {node.config['host']}:{node.config['port']} unavailable: {e}")
+            node.healthy = False
+
+
+def _monitor():
+    while True:
+        check_replicas()
+        time.sleep(HEALTH_CHECK_SECONDS)
+
+
+def _start_monitor():
+    global _monitor_started
+    with _route_lock:
+        if _monitor_started:
+            return
+        _monitor_started = True
+    check_replicas()
+    threading.Thread(target=_monitor, name="replica-monitor", daemon=True).start()
+
+
+def in_clause(values):
+    """Placeholders for `col IN (...)` with one %s per value"""
+    return ", ".join(["%s"] * len(values))
+
+
+def is_pinned(last_write):
+    """True while a session's own recent write may not have reached the replicas"""
+    return bool(last_write) and time.time() - float(last_write) < PIN_SECONDS
+
+
+def get_conn(intent="write", last_write=None):
+    """
+    Connection for a write (primary) or a read. Reads use the next healthy,
+    caught-up replica unless the caller wrote within PIN_SECONDS (pass the
+    session's last write time); with no usable replica they use the primary.
+    """
+    global _next_replica
+    if intent == "read" and _replicas and not is_pinned(last_write):
+        _start_monitor()
+        for _ in range(len(_replicas)):
+            with _route_lock:
+                node = _replicas[_next_replica % len(_replicas)]
+                _next_replica += 1
+            if not node.usable():
+                continue
+            try:
+                return node.connect()
+            except mysql.connector.Error as e:
+                print(f"Replica {node.name} failed, using primary: {e}")
+                node.healthy = False
+    return _primary.connect()
+
+
+def replica_status():
+    """[{host, healthy, lag}] for monitoring"""
+    return [{"host": f"{n.config['host']}:{n.config['port']}", "healthy": n.healthy, "lag": n.lag}
+            for n in _replicas]
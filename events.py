@@ -0,0 +1,223 @@
+"""
+Pub/sub for order queue events, delivered to browsers as Server-Sent Events.
+
+Writers call publish() after committing; each open /api/orders/stream
+connection owns a bounded queue. A subscriber that falls too far behind gets
+a single "resync" event telling it to reload instead of a partial history.
+
+With several worker processes an event must reach streams held by the other
+workers too, so publish() also appends it to a ring in a memory-mapped file
+(EVENTS_SHARED_FILE, in catalog.PRIVATE_DIR, guarded by flock). Every worker
+with subscribers polls the ring every POLL_SECONDS and delivers the events
+written by other processes; its own are delivered at once. Ring positions are
+the event ids, so they agree across workers. Where fcntl is unavailable or
+the file can't be opened, events stay in-process (run a single worker then).
+"""
+import itertools
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+import catalog
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAX_PENDING_EVENTS = 200
+HEARTBEAT_SECONDS = 15
+POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "0.5"))
+RING_CAPACITY = 1024
+SHARED_FILE = os.getenv("EVENTS_SHARED_FILE", os.path.join(
+    catalog.PRIVATE_DIR, f"events-{os.getenv('DB_NAME', 'clothing_store')}.bin"))
+
+_lock = threading.Lock()
+_subscribers = set()
+_ids = itertools.count(1)
+_poller = None
+
+
+def subscribe():
+    q = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+    with _lock:
+        _subscribers.add(q)
+    _start_poller()
+    return q
+
+
+def unsubscribe(q):
+    with _lock:
+        _subscribers.discard(q)
+
+
+def subscriber_count():
+    return len(_subscribers)
+
+
+def _deliver(message):
+    """
+    Put a message in every local queue. Puts are made under _lock, so no
+    other publisher can refill a queue between _reset()'s drain and its
+    resync (the reader only ever takes from it).
+    """
+    with _lock:
+        for q in _subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                _reset(q)
+
+
+def _reset(q):
+    """Replace a full queue's backlog with one resync event (call under _lock)"""
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
+    q.put_nowait((_ring.head() if _ring is not None else next(_ids), "resync", {}))
+
+
+def publish(event, data):
+    """Send an event to every subscriber, in this worker and the others, without blocking"""
+    event_id = _ring.append(event, data) if _ring is not None else next(_ids)
+    _deliver((event_id, event, data))
+
+
+# ============= SHARED RING =============
+
+class _Ring:
+    """
+    Events in a memory-mapped file. Layout: header (magic, capacity, head)
+    then `capacity` slots of (event id, writer pid, payload length, JSON
+    payload); head is the id of the last event written.
+    """
+    MAGIC = b"ASHEVT01"
+    HEADER = struct.Struct("<8sQQ")
+    SLOT = struct.Struct("<QQI")
+    SLOT_SIZE = 1024
+    HEAD_OFFSET = 16
+
+    def __init__(self, path, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        size = self.HEADER.size + capacity * self.SLOT_SIZE
+        self._fd = catalog.open_private(path, os.O_RDWR | os.O_CREAT)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            magic, stored_capacity, _ = self.HEADER.unpack_from(self._map, 0)
+            if magic != self.MAGIC or stored_capacity != capacity:
+                self.HEADER.pack_into(self._map, 0, self.MAGIC, capacity, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def head(self):
+        # Aligned 8-byte field, only written under the lock: read it lock-free
+        return struct.unpack_from("<Q", self._map, self.HEAD_OFFSET)[0]
+
+    def _offset(self, event_id):
+        return self.HEADER.size + (event_id % self.capacity) * self.SLOT_SIZE
+
+    def append(self, event, data):
+        payload = json.dumps([event, data], default=str).encode("utf-8")
+        if len(payload) > self.SLOT_SIZE - self.SLOT.size:
+            payload = json.dumps(["resync", {}]).encode("utf-8")
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            event_id = self.head() + 1
+            offset = self._offset(event_id)
+            self.SLOT.pack_into(self._map, offset, event_id, os.getpid(), len(payload))
+            self._map[offset + self.SLOT.size:offset + self.SLOT.size + len(payload)] = payload
+            struct.pack_into("<Q", self._map, self.HEAD_OFFSET, event_id)
+            return event_id
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def since(self, last):
+        """(head, [(event id, event, data)] written by other processes after `last`, or None if overwritten)"""
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        try:
+            head = self.head()
+            if head - last > self.capacity:
+                return head, None
+            messages = []
+            for event_id in range(last + 1, head + 1):
+                offset = self._offset(event_id)
+                stored_id, pid, length = self.SLOT.unpack_from(self._map, offset)
+                if stored_id != event_id or pid == os.getpid():
+                    continue
+                start = offset + self.SLOT.size
+                event, data = json.loads(self._map[start:start + length])
+                messages.append((event_id, event, data))
+            return head, messages
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+def _poll():
+    last = _ring.head()
+    while True:
+        time.sleep(POLL_SECONDS)
+        try:
+            if _ring.head() == last:
+                continue
+            last, messages = _ring.since(last)
+            if messages is None:
+                messages = [(last, "resync", {})]   # fell a whole ring behind
+            for message in messages:
+                _deliver(message)
+        except Exception as e:
+            print(f"Event poller error: {e}")
+
+
+def _start_poller():
+    global _poller
+    if _ring is None or _poller is not None:
+        return
+    with _lock:
+        if _poller is not None:
+            return
+        _poller = threading.Thread(target=_poll, name="events-poller", daemon=True)
+    _poller.start()
+
+
+def _open_ring():
+    if fcntl is None or not SHARED_FILE:
+        return None
+    try:
+        return _Ring(SHARED_FILE)
+    except OSError as e:
+        print(f"Order events not shared between workers ({SHARED_FILE}): {e}")
+        return None
+
+
+_ring = _open_ring()
+
+
+# ============= SSE =============
+
+def format_sse(event_id, event, data):
+    payload = json.dumps(data, default=str)
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+
+
+def stream(q):
+    """Generator of SSE frames for one subscriber; unsubscribes when closed"""
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event_id, event, data = q.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event_id, event, data)
+    finally:
+        unsubscribe(q)
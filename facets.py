@@ -0,0 +1,251 @@
+"""
+Faceted navigation over the catalog snapshot with bitmap indexes.
+
+Every facet value has a product bitmap (bit i: the snapshot's i-th product
+has a variant with that size / color / available stock, or that category /
+price band), and size, color and in_stock also have a variant bitmap. In the
+variant bitmaps each product owns a slot of `width` bits (a power of two at
+least its variant count; a product without variants gets one empty row), so
+"does the product have a matching variant" is a few shift-and-OR folds of
+the slot onto its first bit.
+
+Values selected within one facet are OR'ed and facets are AND'ed. While at
+most one of size / color / in_stock takes part, product bitmaps give the
+exact answer; with two or more they are AND'ed at the variant level first -
+so size=M&color=Blue&in_stock=1 means a blue M that is in stock, not an M,
+a blue and an in-stock variant that happen to share a product. Counts are
+int.bit_count() of the result.
+
+The count shown next to each value is the number of products the search
+would return with that facet's own selection swapped for the value. The
+index is rebuilt when the snapshot changes (content version). Reservations
+move the catalog version without a new snapshot: then only the in_stock
+bitmaps are patched, for the variants the change log names.
+"""
+import threading
+from array import array
+
+import catalog
+import reservations
+
+FACETS = ("category", "size", "color", "price", "in_stock")
+VARIANT_FACETS = ("size", "color", "in_stock")
+PRICE_BANDS = ((0, 100), (100, 250), (250, 500), (500, None))
+MAX_PATCH_VARIANTS = 1000   # more held variants changed than this: recompute in_stock
+
+_lock = threading.Lock()
+_index = None
+
+
+def price_band(price):
+    for low, high in PRICE_BANDS:
+        if high is None or price < high:
+            return f"{low}+" if high is None else f"{low}-{high}"
+
+
+def _bits(bitmap):
+    """Positions of the set bits, lowest first"""
+    digits = bin(bitmap)[:1:-1]
+    positions = []
+    i = digits.find("1")
+    while i != -1:
+        positions.append(i)
+        i = digits.find("1", i + 1)
+    return positions
+
+
+def _bitmap(positions, size):
+    """Int with the given bit positions set, built in one pass"""
+    buf = bytearray((size + 7) // 8)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, "little")
+
+
+class FacetIndex:
+    def __init__(self, snapshot, version):
+        self.key = snapshot.version
+        self.version = version
+        records = snapshot.records()
+        self.product_ids = [p.product_id for p in records]
+        variants = [snapshot.variants(p) for p in records]
+        n = len(records)
+
+        most = max((len(vs) for vs in variants), default=1) or 1
+        self.width = 1 << (most - 1).bit_length()
+        rows = n * self.width
+        self.shifts = [1 << k for k in range(self.width.bit_length() - 1)]
+        self.first = _bitmap(range(0, rows, self.width), rows)
+
+        # facet -> {value: [positions]}, values in display order
+        products = {facet: {} for facet in FACETS}
+        variant_rows = {facet: {} for facet in ("size", "color")}
+        for low, high in PRICE_BANDS:
+            products["price"][price_band(low)] = []
+        real_rows = []
+        self.rows = {}        # variant_id -> (row, product position)
+        self.on_hand = {}     # variant_id -> stock on hand
+        for i, (p, vs) in enumerate(zip(records, variants)):
+            base = i * self.width
+            real_rows.extend(range(base, base + (len(vs) or 1)))
+            for facet, value in (("category", p.category), ("price", price_band(p.price))):
+                if value is not None:
+                    products[facet].setdefault(value, []).append(i)
+            for j, v in enumerate(vs):
+                self.rows[v['variant_id']] = (base + j, i)
+                self.on_hand[v['variant_id']] = v['stock_quantity']
+                for facet in ("size", "color"):
+                    value = v[facet]
+                    if value is not None:
+                        variant_rows[facet].setdefault(value, []).append(base + j)
+                        positions = products[facet].setdefault(value, [])
+                        if not positions or positions[-1] != i:
+                            positions.append(i)
+
+        # Stable order across workers (price bands and in_stock are fixed)
+        for facet in ("category", "size", "color"):
+            products[facet] = dict(sorted(products[facet].items(),
+                                          key=lambda item: str(item[0]).casefold()))
+
+        self.products = {facet: {value: _bitmap(positions, n) for value, positions in values.items()}
+                         for facet, values in products.items()}
+        self.variants = {facet: {value: _bitmap(positions, rows) for value, positions in values.items()}
+                         for facet, values in variant_rows.items()}
+        # Category / price at each product's first row, to combine with folded variant results
+        self.slots = {facet: {value: _bitmap([i * self.width for i in positions], rows)
+                              for value, positions in products[facet].items()}
+                      for facet in ("category", "price")}
+        self.all = (1 << n) - 1
+        self.all_rows = _bitmap(real_rows, rows)
+        self.rows_size = rows
+        self._recompute_in_stock(variants)
+
+    # ---- in_stock ----
+
+    def _recompute_in_stock(self, variants=None):
+        """in_stock bitmaps from available quantities (variants: the snapshot's, already computed)"""
+        rows, counts = [], array("i", bytes(4 * len(self.product_ids)))
+        if variants is not None:
+            available = {v['variant_id']: v['available_quantity'] for vs in variants for v in vs}
+        for variant_id, (row, i) in self.rows.items():
+            if variants is not None:
+                quantity = available[variant_id]
+            else:
+                quantity = reservations.available_quantity(variant_id, self.on_hand[variant_id])
+            if quantity > 0:
+                rows.append(row)
+                counts[i] += 1
+        self.in_stock_count = counts
+        self.variants["in_stock"] = {"1": _bitmap(rows, self.rows_size)}
+        self.products["in_stock"] = {"1": _bitmap([i for i, c in enumerate(counts) if c], len(counts))}
+
+    def patch_in_stock(self, version):
+        """Bring in_stock up to a catalog version that only changed reservations"""
+        changes = catalog.changes_since(self.version)
+        if changes is None or len(changes["variants"]) > MAX_PATCH_VARIANTS:
+            self._recompute_in_stock()
+        else:
+            row_bits = self.variants["in_stock"]["1"]
+            product_bits = self.products["in_stock"]["1"]
+            for variant_id in changes["variants"]:
+                if variant_id not in self.rows:
+                    continue
+                row, i = self.rows[variant_id]
+                was = bool(row_bits >> row & 1)
+                now = reservations.available_quantity(variant_id, self.on_hand[variant_id]) > 0
+                if was == now:
+                    continue
+                row_bits ^= 1 << row
+                self.in_stock_count[i] += 1 if now else -1
+                if bool(product_bits >> i & 1) != bool(self.in_stock_count[i]):
+                    product_bits ^= 1 << i
+            self.variants["in_stock"] = {"1": row_bits}
+            self.products["in_stock"] = {"1": product_bits}
+        self.version = version
+
+    # ---- search ----
+
+    def _fold(self, rows):
+        """Bit i*width set when any row of product i is set"""
+        for shift in self.shifts:
+            rows |= rows >> shift
+        return rows & self.first
+
+    def _union(self, bitmaps, values):
+        mask = 0
+        for value in values:
+            mask |= bitmaps.get(value, 0)
+        return mask
+
+    def search(self, selected):
+        """
+        selected: {facet: [values]}. Returns the matching product ids and,
+        for every facet value, how many products it would match.
+        """
+        # facet -> (product mask, variant or slot mask)
+        masks = {}
+        for facet, values in selected.items():
+            if facet not in self.products or not values:
+                continue
+            detail = self.variants if facet in VARIANT_FACETS else self.slots
+            masks[facet] = (self._union(self.products[facet], values),
+                            self._union(detail[facet], values))
+
+        def match(facets, extra=None):
+            """Product bitmap, and whether it is in slot space (bit i*width)"""
+            items = [masks[f] for f in facets] + ([extra[1]] if extra else [])
+            names = list(facets) + ([extra[0]] if extra else [])
+            if sum(f in VARIANT_FACETS for f in names) <= 1:
+                result = self.all
+                for product_mask, _ in items:
+                    result &= product_mask
+                return result, False
+            rows, slots = self.all_rows, self.first
+            for f, (_, detail) in zip(names, items):
+                if f in VARIANT_FACETS:
+                    rows &= detail
+                else:
+                    slots &= detail
+            return self._fold(rows) & slots, True
+
+        counts = {}
+        for facet, bitmaps in self.products.items():
+            others = [f for f in masks if f != facet]
+            detail = self.variants if facet in VARIANT_FACETS else self.slots
+            values = []
+            for value, bitmap in bitmaps.items():
+                result, _ = match(others, (facet, (bitmap, detail[facet][value])))
+                values.append({"value": value, "count": result.bit_count()})
+            counts[facet] = values
+
+        if not masks:
+            ids = list(self.product_ids)
+        else:
+            result, slotted = match(list(masks))
+            positions = _bits(result)
+            if slotted:
+                positions = [p // self.width for p in positions]
+            ids = [self.product_ids[i] for i in positions]
+        return {"version": self.version, "total": len(ids), "product_ids": ids, "facets": counts}
+
+
+def index(snapshot):
+    """
+    Facet index for a snapshot: rebuilt when the snapshot changes, in_stock
+    patched when only the catalog version (reservations) moved
+    """
+    global _index
+    version = catalog.version()
+    current = _index
+    if current is not None and current.key == snapshot.version and current.version == version:
+        return current
+    with _lock:
+        if _index is None or _index.key != snapshot.version:
+            _index = FacetIndex(snapshot, version)
+        elif _index.version != version:
+            _index.patch_in_stock(version)
+        return _index
+
+
+def search(snapshot, selected):
+    return index(snapshot).search(selected)
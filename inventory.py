@@ -0,0 +1,265 @@
+"""
+Append-only inventory ledger for Ashhab Sport.
+
+Every stock change is written to inventory_movement as a signed delta.
+Periodic snapshots fold the ledger into per-variant quantities so that
+"stock as of date X" and a full rebuild of the stock table only need the
+nearest snapshot plus the movements after it.
+
+Usage:
+    python inventory.py snapshot
+    python inventory.py rebuild
+    python inventory.py as-of "2025-01-31 23:59:59" [variant_id]
+"""
+import os
+import sys
+import threading
+import time
+
+SNAPSHOT_EVERY_MOVEMENTS = int(os.getenv("INVENTORY_SNAPSHOT_EVERY", "5000"))
+SNAPSHOT_CHECK_SECONDS = int(os.getenv("INVENTORY_SNAPSHOT_CHECK_SECONDS", "600"))
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def record_movement(cur, warehouse_id, variant_id, movement_type, qty_change,
+                    employee_id=None, ref_type=None, ref_id=None, note=None):
+    """Append one signed stock delta to the ledger"""
+    cur.execute("""
+        INSERT INTO inventory_movement
+        (warehouse_id, variant_id, movement_type, qty_change, employee_id, ref_type, ref_id, note)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, (warehouse_id, variant_id, movement_type, qty_change, employee_id, ref_type, ref_id, note))
+
+
+def record_movements(cur, rows):
+    """
+    Append many deltas with one multi-row INSERT.
+    rows: (warehouse_id, variant_id, movement_type, qty_change, employee_id, ref_type, ref_id, note)
+    """
+    if not rows:
+        return
+    cur.executemany("""
+        INSERT INTO inventory_movement
+        (warehouse_id, variant_id, movement_type, qty_change, employee_id, ref_type, ref_id, note)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, rows)
+
+
+def _latest_snapshot(cur, before=None):
+    if before is None:
+        cur.execute("""
+            SELECT snapshot_id, taken_at, last_movement_id FROM inventory_snapshot
+            ORDER BY snapshot_id DESC LIMIT 1
+        """)
+    else:
+        cur.execute("""
+            SELECT snapshot_id, taken_at, last_movement_id FROM inventory_snapshot
+            WHERE taken_at <= %s
+            ORDER BY taken_at DESC, snapshot_id DESC LIMIT 1
+        """, (before,))
+    return cur.fetchone()
+
+
+def _snapshot_quantities(cur, snapshot_id, variant_id=None):
+    sql = "SELECT warehouse_id, variant_id, quantity FROM inventory_snapshot_item WHERE snapshot_id = %s"
+    params = [snapshot_id]
+    if variant_id is not None:
+        sql += " AND variant_id = %s"
+        params.append(variant_id)
+    cur.execute(sql, params)
+    return {(r['warehouse_id'], r['variant_id']): int(r['quantity']) for r in cur.fetchall()}
+
+
+def _fold_tail(cur, quantities, after_id, upto_id=None, upto_time=None, variant_id=None):
+    """Add the summed movements in a ledger range"""
+    sql = """
+        SELECT warehouse_id, variant_id, SUM(qty_change) AS delta
+        FROM inventory_movement
+        WHERE movement_id > %s
+    """
+    params = [after_id]
+    if upto_id is not None:
+        sql += " AND movement_id <= %s"
+        params.append(upto_id)
+    if upto_time is not None:
+        sql += " AND created <= %s"
+        params.append(upto_time)
+    if variant_id is not None:
+        sql += " AND variant_id = %s"
+        params.append(variant_id)
+    sql += " GROUP BY warehouse_id, variant_id"
+    cur.execute(sql, params)
+    for r in cur.fetchall():
+        key = (r['warehouse_id'], r['variant_id'])
+        quantities[key] = quantities.get(key, 0) + int(r['delta'])
+    return quantities
+
+
+def take_snapshot(conn):
+    """
+    Compact the ledger into a new snapshot.
+    The first snapshot is seeded from the stock table; later ones fold the
+    previous snapshot with the movements recorded since.
+    """
+    cur = conn.cursor(dictionary=True)
+    conn.start_transaction(consistent_snapshot=True)
+
+    cur.execute("SELECT COALESCE(MAX(movement_id), 0) AS last_id FROM inventory_movement")
+    last_id = int(cur.fetchone()['last_id'])
+
+    prev = _latest_snapshot(cur)
+    if prev is None:
+        cur.execute("SELECT warehouse_id, variant_id, quantity FROM stock")
+        quantities = {(r['warehouse_id'], r['variant_id']): int(r['quantity']) for r in cur.fetchall()}
+    elif prev['last_movement_id'] >= last_id:
+        conn.rollback()
+        cur.close()
+        return prev['snapshot_id']
+    else:
+        quantities = _snapshot_quantities(cur, prev['snapshot_id'])
+        _fold_tail(cur, quantities, prev['last_movement_id'], upto_id=last_id)
+
+    cur.execute("""
+        INSERT INTO inventory_snapshot (taken_at, last_movement_id)
+        VALUES (NOW(), %s)
+    """, (last_id,))
+    snapshot_id = cur.lastrowid
+
+    cur.executemany("""
+        INSERT INTO inventory_snapshot_item (snapshot_id, warehouse_id, variant_id, quantity)
+        VALUES (%s, %s, %s, %s)
+    """, [(snapshot_id, w, v, q) for (w, v), q in quantities.items()])
+
+    conn.commit()
+    cur.close()
+    return snapshot_id
+
+
+def stock_as_of(conn, when, variant_id=None):
+    """
+    Stock per (warehouse_id, variant_id) at a point in time, rolled forward
+    from the newest snapshot taken at or before `when`. Returns None if
+    `when` predates every snapshot: movements from before the first one
+    (e.g. imports logged as absolute ADJUSTMENT quantities) can't be trusted
+    to roll it backwards.
+    """
+    cur = conn.cursor(dictionary=True)
+    snap = _latest_snapshot(cur, before=when)
+    if snap is None:
+        cur.close()
+        return None
+    quantities = _snapshot_quantities(cur, snap['snapshot_id'], variant_id)
+    _fold_tail(cur, quantities, snap['last_movement_id'], upto_time=when, variant_id=variant_id)
+    cur.close()
+    return quantities
+
+
+def current_from_ledger(conn):
+    """Latest snapshot plus tail: what the stock table should contain"""
+    cur = conn.cursor(dictionary=True)
+    snap = _latest_snapshot(cur)
+    if snap is None:
+        cur.close()
+        return None
+    quantities = _snapshot_quantities(cur, snap['snapshot_id'])
+    _fold_tail(cur, quantities, snap['last_movement_id'])
+    cur.close()
+    return quantities
+
+
+def rebuild_stock(conn):
+    """Overwrite the stock table from snapshot plus tail. Returns rows written."""
+    conn.start_transaction()
+    quantities = current_from_ledger(conn)
+    if quantities is None:
+        conn.rollback()
+        raise RuntimeError("No inventory snapshot yet - run 'python inventory.py snapshot' first")
+
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO stock (warehouse_id, variant_id, quantity)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)
+    """, [(w, v, q) for (w, v), q in quantities.items()])
+    conn.commit()
+    cur.close()
+    return len(quantities)
+
+
+def maybe_snapshot(conn):
+    """Take a snapshot once the un-snapshotted tail grows past the threshold"""
+    cur = conn.cursor(dictionary=True)
+    snap = _latest_snapshot(cur)
+    after = snap['last_movement_id'] if snap else 0
+    cur.execute("SELECT COUNT(*) AS n FROM inventory_movement WHERE movement_id > %s", (after,))
+    tail = cur.fetchone()['n']
+    cur.close()
+    conn.commit()
+    if snap is None or tail >= SNAPSHOT_EVERY_MOVEMENTS:
+        return take_snapshot(conn)
+    return None
+
+
+def _snapshotter(get_conn):
+    while True:
+        conn = None
+        try:
+            conn = get_conn()
+            maybe_snapshot(conn)
+        except Exception as e:
+            print(f"Inventory snapshot error: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+        time.sleep(SNAPSHOT_CHECK_SECONDS)
+
+
+def start(get_conn):
+    """Start the periodic snapshot thread (tables come from migrations.py)."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    threading.Thread(target=_snapshotter, args=(get_conn,),
+                     name="inventory-snapshotter", daemon=True).start()
+
+
+def main(argv):
+    from db import get_conn
+    import migrations
+
+    if not argv or argv[0] not in ("snapshot", "rebuild", "as-of"):
+        print(__doc__)
+        return 1
+
+    conn = get_conn()
+    try:
+        migrations.migrate(conn)
+        if argv[0] == "snapshot":
+            print(f"✓ Snapshot {take_snapshot(conn)} written")
+        elif argv[0] == "rebuild":
+            started = time.time()
+            n = rebuild_stock(conn)
+            print(f"✓ Rebuilt {n} stock rows in {time.time() - started:.2f}s")
+        else:
+            if len(argv) < 2:
+                print("as-of needs a date")
+                return 1
+            variant_id = int(argv[2]) if len(argv) > 2 else None
+            quantities = stock_as_of(conn, argv[1], variant_id)
+            if quantities is None:
+                print("✗ No snapshot at or before that date")
+                return 1
+            for (w, v), q in sorted(quantities.items()):
+                print(f"warehouse {w}  variant {v}  qty {q}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
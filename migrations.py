@@ -0,0 +1,334 @@
+"""
+Versioned schema migrations for Ashhab Sport.
+
+The base tables come from database_schema.sql; everything added on top of it
+(ledger snapshot tables, triggers, indexes for the hot queries) is a numbered
+migration here. Applied versions are recorded in schema_migrations, and every
+step checks information_schema first, so running migrate() again - or on a
+database where an index already exists under another name - is a no-op.
+
+Usage:
+    python migrations.py migrate     apply pending migrations
+    python migrations.py status      list applied / pending versions
+    python migrations.py explain     EXPLAIN the hot queries, flag full scans
+"""
+import sys
+
+import reservations
+
+LOCK_NAME = "ashhab_schema_migrations"
+LOCK_TIMEOUT_SECONDS = 30
+
+
+# ============= STEP HELPERS =============
+
+def _index_columns(cur, table):
+    """{index name: [columns in order]} for a table"""
+    cur.execute("""
+        SELECT INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """, (table,))
+    indexes = {}
+    for name, column in cur.fetchall():
+        indexes.setdefault(name, []).append(column.lower())
+    return indexes
+
+
+def create_index(table, name, columns):
+    """
+    Step that adds an index unless one with the same name, or one whose leading
+    columns already cover `columns` (e.g. a foreign key index), exists.
+    """
+    wanted = [c.strip().lower() for c in columns.split(",")]
+
+    def step(cur):
+        existing = _index_columns(cur, table)
+        if name in existing or any(cols[:len(wanted)] == wanted for cols in existing.values()):
+            return
+        cur.execute(f"CREATE INDEX {name} ON `{table}` ({columns})")
+        print(f"  + index {name} on {table}({columns})")
+    return step
+
+
+def execute(sql):
+    """Step that runs an idempotent statement (CREATE TABLE IF NOT EXISTS ...)"""
+    def step(cur):
+        cur.execute(sql)
+    return step
+
+
+def create_trigger(name, table, sql):
+    """
+    Step that creates a trigger unless it already exists. Triggers are a
+    safeguard, not something later migrations rely on, so a failure (typically
+    binary logging without SUPER or log_bin_trust_function_creators) is
+    reported and the migration carries on; create the trigger by hand later.
+    """
+    def step(cur):
+        cur.execute("""
+            SELECT 1 FROM information_schema.TRIGGERS
+            WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = %s
+        """, (name,))
+        if cur.fetchall():
+            return
+        try:
+            cur.execute(sql)
+        except Exception as e:
+            print(f"  ! could not create trigger {name} on {table}, skipped: {e}")
+            return
+        print(f"  + trigger {name} on {table}")
+    return step
+
+
+# ============= MIGRATIONS =============
+# (version, name, [steps]). Append new ones; never renumber or edit applied ones.
+
+MIGRATIONS = [
+    (1, "inventory snapshot tables", [
+        execute("""
+            CREATE TABLE IF NOT EXISTS inventory_snapshot (
+                snapshot_id INT AUTO_INCREMENT PRIMARY KEY,
+                taken_at DATETIME NOT NULL,
+                last_movement_id BIGINT NOT NULL,
+                KEY idx_snapshot_taken (taken_at),
+                KEY idx_snapshot_movement (last_movement_id)
+            )
+        """),
+        execute("""
+            CREATE TABLE IF NOT EXISTS inventory_snapshot_item (
+                snapshot_id INT NOT NULL,
+                warehouse_id INT NOT NULL,
+                variant_id INT NOT NULL,
+                quantity INT NOT NULL,
+                PRIMARY KEY (snapshot_id, warehouse_id, variant_id),
+                FOREIGN KEY (snapshot_id) REFERENCES inventory_snapshot(snapshot_id) ON DELETE CASCADE
+            )
+        """),
+    ]),
+    # The ledger only grows; corrections are new ADJUSTMENT rows.
+    (2, "append-only inventory ledger", [
+        create_trigger("inventory_movement_no_update", "inventory_movement", """
+            CREATE TRIGGER inventory_movement_no_update BEFORE UPDATE ON inventory_movement
+            FOR EACH ROW SIGNAL SQLSTATE '45000'
+                SET MESSAGE_TEXT = 'inventory_movement is append-only'
+        """),
+        create_trigger("inventory_movement_no_delete", "inventory_movement", """
+            CREATE TRIGGER inventory_movement_no_delete BEFORE DELETE ON inventory_movement
+            FOR EACH ROW SIGNAL SQLSTATE '45000'
+                SET MESSAGE_TEXT = 'inventory_movement is append-only'
+        """),
+    ]),
+    # Order queues: status / assignee / customer / date filters, paginated by order_id DESC
+    (3, "order queue indexes", [
+        create_index("order", "idx_order_status_id", "status, order_id"),
+        create_index("order", "idx_order_employee_id", "employee_id, order_id"),
+        create_index("order", "idx_order_customer_id", "customer_id, order_id"),
+        create_index("order", "idx_order_date", "order_date"),
+    ]),
+    # Lookups done on nearly every request
+    (4, "hot path indexes", [
+        create_index("cart", "idx_cart_customer", "customer_id"),
+        create_index("cart_item", "idx_cart_item_cart", "cart_id"),
+        create_index("stock", "idx_stock_variant", "variant_id"),
+        create_index("product_variant", "idx_variant_product", "product_id"),
+        create_index("order_detail", "idx_order_detail_order", "order_id"),
+        create_index("inventory_movement", "idx_movement_variant_created", "variant_id, created"),
+    ]),
+    # Hourly ('h') / daily ('d') buckets kept by rollups.py, filled from history by 6
+    (5, "sales rollups", [
+        execute("""
+            CREATE TABLE IF NOT EXISTS sales_rollup (
+                grain CHAR(1) NOT NULL,
+                bucket DATETIME NOT NULL,
+                product_id INT NOT NULL,
+                category VARCHAR(100),
+                revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+                units INT NOT NULL DEFAULT 0,
+                cost DECIMAL(14, 2) NOT NULL DEFAULT 0,
+                purchased_units INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (grain, bucket, product_id),
+                KEY idx_sales_rollup_category (grain, category, bucket),
+                KEY idx_sales_rollup_bucket (bucket)
+            )
+        """),
+        execute("""
+            CREATE TABLE IF NOT EXISTS order_status_rollup (
+                grain CHAR(1) NOT NULL,
+                bucket DATETIME NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                orders INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (grain, bucket, status),
+                KEY idx_status_rollup_bucket (bucket)
+            )
+        """),
+        create_index("purchase_order", "idx_purchase_order_date", "order_date"),
+    ]),
+    # Progress of the full-history backfill, which rollups.start() runs in the background
+    (6, "sales rollup backfill progress", [
+        execute("""
+            CREATE TABLE IF NOT EXISTS rollup_backfill (
+                id TINYINT PRIMARY KEY,
+                through DATETIME NOT NULL,
+                finished_at DATETIME NULL
+            )
+        """),
+    ]),
+    # Holds shared by every worker (they used to live in each process)
+    (7, "stock reservations", [
+        execute("""
+            CREATE TABLE IF NOT EXISTS stock_reservation (
+                order_id INT NOT NULL,
+                warehouse_id INT NOT NULL,
+                variant_id INT NOT NULL,
+                quantity INT NOT NULL,
+                expires_at DATETIME NOT NULL,
+                PRIMARY KEY (order_id, variant_id),
+                KEY idx_reservation_variant (warehouse_id, variant_id, expires_at),
+                KEY idx_reservation_expires (expires_at)
+            )
+        """),
+        reservations.hold_pending_step,
+    ]),
+]
+
+
+# ============= RUNNER =============
+
+def _ensure_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(conn):
+    cur = conn.cursor()
+    _ensure_table(cur)
+    cur.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cur.fetchall()}
+    cur.close()
+    return versions
+
+
+def migrate(conn):
+    """
+    Apply pending migrations in order. A named MySQL lock keeps concurrent
+    workers from racing; each version is recorded only after all its steps ran.
+    Returns the versions applied.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT_SECONDS))
+    if cur.fetchall()[0][0] != 1:
+        cur.close()
+        raise RuntimeError("Timed out waiting for the migration lock")
+
+    applied = []
+    try:
+        done = applied_versions(conn)
+        for version, name, steps in MIGRATIONS:
+            if version in done:
+                continue
+            print(f"Applying migration {version}: {name}")
+            for step in steps:
+                step(cur)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name))
+            conn.commit()
+            applied.append(version)
+    finally:
+        cur.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cur.fetchall()
+        cur.close()
+    return applied
+
+
+# ============= EXPLAIN CHECKER =============
+# Representative queries from the hot routes, with sample parameters. The
+# full catalog listing reads every product by design and is not included.
+# Run against realistic data: on tiny tables MySQL may prefer a scan anyway.
+
+HOT_QUERIES = [
+    ("cart lookup", "SELECT cart_id FROM cart WHERE customer_id = %s", (1,)),
+    ("cart items", """
+        SELECT ci.variant_id, ci.quantity
+        FROM cart_item ci JOIN product_variant v ON v.variant_id = ci.variant_id
+        WHERE ci.cart_id = %s
+    """, (1,)),
+    ("stock for variant", "SELECT quantity FROM stock WHERE warehouse_id = %s AND variant_id = %s", (1, 1)),
+    ("pending queue", """
+        SELECT o.order_id FROM `order` o
+        WHERE o.status = %s ORDER BY o.order_id DESC LIMIT 50
+    """, ("Pending",)),
+    ("customer orders", """
+        SELECT o.order_id FROM `order` o
+        WHERE o.customer_id = %s ORDER BY o.order_id DESC LIMIT 50
+    """, (1,)),
+    ("order detail", """
+        SELECT od.variant_id, od.quantity, od.price
+        FROM order_detail od JOIN product_variant v ON v.variant_id = od.variant_id
+        WHERE od.order_id = %s
+    """, (1,)),
+    ("variant ledger", """
+        SELECT SUM(qty_change) FROM inventory_movement
+        WHERE variant_id = %s AND created <= NOW()
+    """, (1,)),
+    ("product variants", """
+        SELECT v.variant_id, COALESCE(SUM(s.quantity), 0)
+        FROM product_variant v LEFT JOIN stock s ON s.variant_id = v.variant_id
+        WHERE v.product_id = %s GROUP BY v.variant_id
+    """, (1,)),
+]
+
+
+def explain_hot_queries(conn):
+    """
+    EXPLAIN each hot query. Returns [(query name, table, access type, rows)]
+    for every full table scan (type ALL) or full index scan (type index).
+    """
+    cur = conn.cursor(dictionary=True)
+    findings = []
+    for name, sql, params in HOT_QUERIES:
+        cur.execute("EXPLAIN " + sql, params)
+        for row in cur.fetchall():
+            table, access = row.get("table"), (row.get("type") or "").upper()
+            if access in ("ALL", "INDEX"):
+                findings.append((name, table, access, row.get("rows")))
+    cur.close()
+    return findings
+
+
+def main(argv):
+    from db import get_conn
+
+    command = argv[0] if argv else ""
+    if command not in ("migrate", "status", "explain"):
+        print(__doc__)
+        return 1
+
+    conn = get_conn()
+    try:
+        if command == "migrate":
+            applied = migrate(conn)
+            print(f"✓ Applied {applied}" if applied else "✓ Schema is up to date")
+        elif command == "status":
+            done = applied_versions(conn)
+            for version, name, _ in MIGRATIONS:
+                print(f"  {'✓' if version in done else '·'} {version:>3}  {name}")
+        else:
+            findings = explain_hot_queries(conn)
+            for name, table, access, rows in findings:
+                print(f"✗ {name}: {access} scan on {table} (~{rows} rows)")
+            if not findings:
+                print(f"✓ No full scans in {len(HOT_QUERIES)} hot queries")
+            return 2 if findings else 0
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
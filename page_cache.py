@@ -0,0 +1,124 @@
+"""
+Rendered-page cache for the HTML routes.
+
+The page templates take no per-request context, so each one is rendered once
+and kept with its ETag and a gzip copy (which has its own ETag, as the bytes
+differ). Entries are keyed by template name and the mtimes of the template
+and everything it extends, includes or imports (e.g. _macros.html), so
+editing any of them is picked up on the next request. Set DEV_MODE=1 to
+bypass the cache entirely.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import Response, current_app, render_template, request
+from jinja2 import meta
+
+ENABLED = os.getenv("DEV_MODE", "0") != "1"
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+MIN_GZIP_BYTES = 512
+
+_lock = threading.Lock()
+_pages = {}   # template name -> (template_key, PageEntry)
+_sources = {}  # template name -> (it and the templates it pulls in, their mtimes)
+
+
+class PageEntry:
+    __slots__ = ("body", "gzip_body", "etag", "gzip_etag")
+
+    def __init__(self, html):
+        self.body = html.encode("utf-8")
+        self.gzip_body = gzip.compress(self.body, 6) if len(self.body) >= MIN_GZIP_BYTES else None
+        self.etag = hashlib.md5(self.body).hexdigest()
+        self.gzip_etag = self.etag + "-gzip"
+
+
+def _mtimes(names):
+    mtimes = []
+    for name in names:
+        try:
+            mtimes.append(os.stat(os.path.join(TEMPLATE_DIR, name)).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def _templates(name):
+    """name and every template it pulls in, recursively"""
+    env = current_app.jinja_env
+    names, todo = [], [name]
+    while todo:
+        current = todo.pop()
+        if current in names:
+            continue
+        names.append(current)
+        source = env.loader.get_source(env, current)[0]
+        todo.extend(n for n in meta.find_referenced_templates(env.parse(source)) if n is not None)
+    return tuple(names)
+
+
+def template_key(name):
+    """mtimes of a template and everything it pulls in; changes when any is edited"""
+    hit = _sources.get(name)
+    if hit is not None:
+        mtimes = _mtimes(hit[0])
+        if mtimes == hit[1]:
+            return mtimes
+    names = _templates(name)
+    mtimes = _mtimes(names)
+    with _lock:
+        _sources[name] = (names, mtimes)
+    return mtimes
+
+
+def respond(entry, status=200, max_age=0):
+    """Build a response for an entry, honouring If-None-Match and Accept-Encoding"""
+    body, etag = entry.body, entry.etag
+    gzipped = entry.gzip_body is not None and "gzip" in request.accept_encodings
+    if gzipped:
+        body, etag = entry.gzip_body, entry.gzip_etag
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={max_age}, must-revalidate" if max_age else "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if status == 200 and etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, status=status, headers=headers, mimetype="text/html")
+
+
+def get(name):
+    """Cached entry for a context-free template, re-rendered if any of its files changed"""
+    key = template_key(name)
+    hit = _pages.get(name)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+
+    entry = PageEntry(render_template(name))
+    with _lock:
+        _pages[name] = (key, entry)
+    return entry
+
+
+def page(name, status=200):
+    """Serve a context-free template from the cache (or render it in dev mode)"""
+    if not ENABLED:
+        return render_template(name), status
+    return respond(get(name), status)
+
+
+def warm(app, names):
+    """Render every page once at startup so the first hits are memory copies"""
+    if not ENABLED:
+        return
+    with app.test_request_context("/"):
+        for name in names:
+            try:
+                get(name)
+            except Exception as e:
+                print(f"Could not pre-render {name}: {e}")
@@ -0,0 +1,215 @@
+"""
+Co-purchase recommendations computed from order_detail.
+
+Every accepted or shipped order is a basket of products. The batch build
+counts, for each pair of products, the orders containing both (item-item
+co-occurrence) and scores the pair by cosine similarity,
+
+    orders with a and b / sqrt(orders with a * orders with b)
+
+so best sellers don't top every list. The TOP_K neighbours of each product
+are kept in memory; a customer's picks are the summed neighbour scores of
+what they bought, minus what they already have.
+
+Pair counting is vectorized with NumPy. Accepting an order adds its basket
+incrementally and re-ranks the products in it; a full rebuild every
+REBUILD_SECONDS picks up everything else (other workers' accepts, status
+changes). NumPy is a declared dependency; without it nothing is built,
+start() prints a warning, and callers fall back to featured products.
+"""
+import math
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOP_K = 12
+REBUILD_SECONDS = int(os.getenv("RECOMMENDATIONS_REBUILD_SECONDS", "3600"))
+PURCHASED_STATUSES = ("Accepted", "Shipped")
+
+_lock = threading.Lock()
+_pairs = {}        # product_id -> {other product_id: orders containing both}
+_orders_with = {}  # product_id -> orders containing it
+_top = {}          # product_id -> [(other product_id, score)], best first
+_history = {}      # customer_id -> product ids bought
+_built_at = None
+_started = False
+
+BASKET_SQL = """
+    SELECT DISTINCT o.order_id, o.customer_id, v.product_id
+    FROM `order` o
+    JOIN order_detail od ON od.order_id = o.order_id
+    JOIN product_variant v ON v.variant_id = od.variant_id
+    WHERE {where}
+    ORDER BY o.order_id
+"""
+
+
+# ============= BATCH BUILD =============
+
+def cooccurrence(order_ids, product_ids):
+    """
+    Pair counts from parallel arrays of (order, product), grouped by order.
+    Returns (products, a, b, counts, orders_with): a/b index into products,
+    one entry per ordered pair a != b seen together; orders_with[i] is the
+    number of orders containing products[i].
+    """
+    products, index = np.unique(product_ids, return_inverse=True)
+    n = len(products)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return products, empty, empty, empty, empty
+
+    # Each item is paired with every item of its own order
+    starts = np.flatnonzero(np.r_[True, order_ids[1:] != order_ids[:-1]])
+    lengths = np.diff(np.r_[starts, len(order_ids)])
+    per_item = np.repeat(lengths, lengths)
+    item_order_start = np.repeat(starts, lengths)
+    left = np.repeat(index, per_item)
+    offsets = np.arange(per_item.sum()) - np.repeat(np.cumsum(per_item) - per_item, per_item)
+    right = index[np.repeat(item_order_start, per_item) + offsets]
+
+    keep = left != right
+    keys, counts = np.unique(left[keep].astype(np.int64) * n + right[keep], return_counts=True)
+    return products, keys // n, keys % n, counts, np.bincount(index, minlength=n)
+
+
+def top_neighbours(products, a, b, counts, orders_with, k=TOP_K):
+    """{product_id: [(other, score)]} keeping the k best scores per product"""
+    scores = counts / np.sqrt(orders_with[a].astype(np.float64) * orders_with[b])
+    order = np.lexsort((-scores, a))
+    a, b, scores = a[order], b[order], scores[order]
+    group_start = np.flatnonzero(np.r_[True, a[1:] != a[:-1]]) if len(a) else a
+    rank = np.arange(len(a)) - np.repeat(group_start, np.diff(np.r_[group_start, len(a)]))
+    keep = rank < k
+
+    top = {}
+    for i, j, score in zip(a[keep].tolist(), b[keep].tolist(), scores[keep].tolist()):
+        top.setdefault(int(products[i]), []).append((int(products[j]), score))
+    return top
+
+
+def build(conn):
+    """Recompute everything from the order history"""
+    global _pairs, _orders_with, _top, _history, _built_at
+    if np is None:
+        return False
+
+    cur = conn.cursor()
+    cur.execute(BASKET_SQL.format(where="o.status IN (%s, %s)"), PURCHASED_STATUSES)
+    rows = cur.fetchall()
+    cur.close()
+
+    history = {}
+    for _, customer_id, product_id in rows:
+        history.setdefault(customer_id, set()).add(product_id)
+
+    order_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    product_ids = np.array([r[2] for r in rows], dtype=np.int64)
+    products, a, b, counts, orders_with = cooccurrence(order_ids, product_ids)
+
+    pairs = {}
+    for i, j, count in zip(products[a].tolist(), products[b].tolist(), counts.tolist()):
+        pairs.setdefault(i, {})[j] = count
+    top = top_neighbours(products, a, b, counts, orders_with)
+
+    with _lock:
+        _pairs, _top, _history = pairs, top, history
+        _orders_with = dict(zip(products.tolist(), orders_with.tolist()))
+        _built_at = time.time()
+    return True
+
+
+# ============= INCREMENTAL UPDATES =============
+
+def _rank(product_id):
+    total = _orders_with.get(product_id, 0)
+    scored = [(other, count / math.sqrt(total * _orders_with[other]))
+              for other, count in _pairs.get(product_id, {}).items()]
+    scored.sort(key=lambda item: -item[1])
+    return scored[:TOP_K]
+
+
+def add_basket(customer_id, product_ids):
+    """Count one more purchased order and re-rank the products in it"""
+    products = set(product_ids)
+    with _lock:
+        for a in products:
+            _orders_with[a] = _orders_with.get(a, 0) + 1
+            row = _pairs.setdefault(a, {})
+            for b in products:
+                if b != a:
+                    row[b] = row.get(b, 0) + 1
+        for a in products:
+            _top[a] = _rank(a)
+        _history.setdefault(customer_id, set()).update(products)
+
+
+def record_order(conn, order_id):
+    """Add an order that was just accepted"""
+    if _built_at is None:
+        return
+    cur = conn.cursor()
+    cur.execute(BASKET_SQL.format(where="o.order_id = %s"), (order_id,))
+    rows = cur.fetchall()
+    cur.close()
+    if rows:
+        add_basket(rows[0][1], [r[2] for r in rows])
+
+
+# ============= LOOKUPS =============
+
+def for_product(product_id, limit=TOP_K):
+    """[(product_id, score)] most often bought together with product_id"""
+    return _top.get(product_id, [])[:limit]
+
+
+def for_customer(customer_id, limit=TOP_K):
+    """[(product_id, score)] for a customer from what they already bought"""
+    with _lock:
+        bought = set(_history.get(customer_id, ()))
+        scores = {}
+        for a in bought:
+            for b, score in _top.get(a, ()):
+                if b not in bought:
+                    scores[b] = scores.get(b, 0.0) + score
+    return sorted(scores.items(), key=lambda item: -item[1])[:limit]
+
+
+def stats():
+    return {"enabled": np is not None, "built_at": _built_at,
+            "products": len(_top), "customers": len(_history)}
+
+
+def _rebuilder(get_conn):
+    while True:
+        conn = None
+        try:
+            conn = get_conn()
+            build(conn)
+        except Exception as e:
+            print(f"Recommendations build error: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+        time.sleep(REBUILD_SECONDS)
+
+
+def start(get_conn):
+    """Build in the background now and every REBUILD_SECONDS"""
+    global _started
+    with _lock:
+        if _started:
+            return
+        if np is None:
+            print("WARNING: NumPy is not installed (see requirements.txt); "
+                  "recommendations are disabled and featured products are shown instead")
+            return
+        _started = True
+
+    threading.Thread(target=_rebuilder, args=(get_conn,),
+                     name="recommendations-builder", daemon=True).start()
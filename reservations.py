@@ -0,0 +1,254 @@
+"""
+Stock reservations for pending orders.
+
+When a customer places an order its quantities are held in the
+stock_reservation table until an employee accepts it, it is cancelled, or the
+hold expires. Available-to-sell is on-hand stock minus every active hold.
+
+Holds live in the database so every worker sees the same ones: reserve()
+locks the variants' stock rows in the order's warehouse (FOR UPDATE) before
+counting what is already held there, so two workers can't both take the last
+unit, and a hold means accepting the order - which deducts from that
+warehouse - will find the stock. It runs in the caller's transaction, as do
+release() and hold_order().
+
+An expired hold is only released: the order stays Pending, and accepting it
+later reserves again against what is available then (hold_order()). Set
+RESERVATION_CANCEL_EXPIRED=1 to cancel such orders instead. Moving an order
+back to Pending reserves again. Each worker keeps the per-variant totals for
+available_quantity() in memory and reloads them when the catalog version
+moves (holds bump it).
+"""
+import os
+import threading
+import time
+
+import catalog
+import events
+import rollups
+from db import in_clause
+
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_MINUTES", "30")) * 60
+SWEEP_INTERVAL_SECONDS = int(os.getenv("RESERVATION_SWEEP_SECONDS", "30"))
+CANCEL_EXPIRED = os.getenv("RESERVATION_CANCEL_EXPIRED", "0") == "1"
+
+_lock = threading.Lock()
+_reserved = {}        # variant_id -> total quantity held (this worker's copy)
+_loaded_version = None
+_get_conn = None
+_started = False
+
+
+# ============= HOLDS =============
+
+def reserve(cur, order_id, warehouse_id, items, ttl=None):
+    """
+    Hold quantities for an order from its warehouse, in the caller's
+    transaction. items: {variant_id: qty}. Returns False (and holds nothing)
+    if any variant lacks available stock in that warehouse.
+    """
+    if not items:
+        return True
+    ids = list(items)
+    cur.execute(f"""
+        SELECT variant_id, quantity FROM stock
+        WHERE warehouse_id = %s AND variant_id IN ({in_clause(ids)})
+        FOR UPDATE
+    """, [warehouse_id] + ids)
+    on_hand = {variant_id: int(quantity)
+               for variant_id, quantity in _tuples(cur.fetchall(), ("variant_id", "quantity"))}
+
+    cur.execute(f"""
+        SELECT variant_id, SUM(quantity) AS quantity FROM stock_reservation
+        WHERE warehouse_id = %s AND variant_id IN ({in_clause(ids)})
+          AND expires_at > NOW() AND order_id <> %s
+        GROUP BY variant_id
+    """, [warehouse_id] + ids + [order_id])
+    held = {variant_id: int(quantity)
+            for variant_id, quantity in _tuples(cur.fetchall(), ("variant_id", "quantity"))}
+
+    for variant_id, qty in items.items():
+        if on_hand.get(variant_id, 0) - held.get(variant_id, 0) < qty:
+            return False
+
+    ttl = RESERVATION_TTL_SECONDS if ttl is None else ttl
+    cur.execute("DELETE FROM stock_reservation WHERE order_id = %s", (order_id,))
+    cur.executemany("""
+        INSERT INTO stock_reservation (order_id, warehouse_id, variant_id, quantity, expires_at)
+        VALUES (%s, %s, %s, %s, NOW() + INTERVAL %s SECOND)
+    """, [(order_id, warehouse_id, variant_id, qty, ttl) for variant_id, qty in items.items()])
+    return True
+
+
+def reserve_order(cur, order_id, ttl=None):
+    """Hold an existing order's lines again (moved back to Pending, or its hold ran out)"""
+    cur.execute("SELECT warehouse_id FROM `order` WHERE order_id = %s", (order_id,))
+    rows = list(_tuples(cur.fetchall(), ("warehouse_id",)))
+    cur.execute("SELECT variant_id, quantity FROM order_detail WHERE order_id = %s", (order_id,))
+    items = {}
+    for variant_id, quantity in _tuples(cur.fetchall(), ("variant_id", "quantity")):
+        items[variant_id] = items.get(variant_id, 0) + int(quantity)
+    if not rows:
+        return None
+    return items if reserve(cur, order_id, rows[0][0], items, ttl) else None
+
+
+def release(cur, order_id):
+    """Drop an order's hold (on accept or cancel). Returns the released items."""
+    cur.execute("SELECT variant_id, quantity FROM stock_reservation WHERE order_id = %s",
+                (order_id,))
+    items = {variant_id: int(quantity)
+             for variant_id, quantity in _tuples(cur.fetchall(), ("variant_id", "quantity"))}
+    if items:
+        cur.execute("DELETE FROM stock_reservation WHERE order_id = %s", (order_id,))
+    return items
+
+
+def hold_order(cur, order_id):
+    """
+    Make sure a Pending order holds its stock before it is accepted: keeps an
+    active hold, or reserves again if it ran out (or was swept). Returns
+    False if the stock is no longer available.
+    """
+    cur.execute("""
+        SELECT 1 FROM stock_reservation WHERE order_id = %s AND expires_at > NOW()
+        FOR UPDATE
+    """, (order_id,))
+    if cur.fetchall():
+        return True
+    return reserve_order(cur, order_id) is not None
+
+
+def hold_pending_step(cur):
+    """Migration step: hold stock for Pending orders placed within the TTL"""
+    cur.execute("""
+        INSERT IGNORE INTO stock_reservation (order_id, warehouse_id, variant_id, quantity, expires_at)
+        SELECT o.order_id, o.warehouse_id, od.variant_id, SUM(od.quantity),
+               o.order_date + INTERVAL %s SECOND
+        FROM `order` o
+        JOIN order_detail od ON od.order_id = o.order_id
+        WHERE o.status = 'Pending' AND o.order_date >= NOW() - INTERVAL %s SECOND
+        GROUP BY o.order_id, o.warehouse_id, od.variant_id, o.order_date
+    """, (RESERVATION_TTL_SECONDS, RESERVATION_TTL_SECONDS))
+
+
+def _tuples(rows, columns):
+    """Rows from either a plain or a dictionary cursor as tuples"""
+    for row in rows:
+        yield tuple(row[c] for c in columns) if isinstance(row, dict) else tuple(row)
+
+
+# ============= AVAILABILITY =============
+
+def _load(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT variant_id, SUM(quantity) FROM stock_reservation
+        WHERE expires_at > NOW()
+        GROUP BY variant_id
+    """)
+    totals = {variant_id: int(quantity) for variant_id, quantity in cur.fetchall()}
+    cur.close()
+    return totals
+
+
+def _totals():
+    """Held quantity per variant, reloaded once per catalog version"""
+    global _reserved, _loaded_version
+    current = catalog.version()
+    if current == _loaded_version or _get_conn is None:
+        return _reserved
+    with _lock:
+        if current != _loaded_version:
+            conn = None
+            try:
+                conn = _get_conn()
+                _reserved = _load(conn)
+            except Exception as e:
+                print(f"Could not load reservations: {e}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            _loaded_version = current
+    return _reserved
+
+
+def reserved_quantity(variant_id):
+    """Total quantity currently held for a variant"""
+    return _totals().get(variant_id, 0)
+
+
+def available_quantity(variant_id, on_hand):
+    """On-hand stock minus active reservations (never negative)"""
+    return max(int(on_hand) - _totals().get(variant_id, 0), 0)
+
+
+# ============= EXPIRY =============
+
+def sweep(conn, cancel=False):
+    """
+    Drop expired holds; with cancel=True also cancel their orders if still
+    Pending. Safe to run in every worker: each order is handled under its row
+    lock. Returns ({order_id: released items}, [cancelled order ids]).
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT DISTINCT order_id FROM stock_reservation WHERE expires_at <= NOW()")
+    order_ids = [row[0] for row in cur.fetchall()]
+
+    expired, cancelled = {}, []
+    for order_id in order_ids:
+        try:
+            cur.execute("SELECT status FROM `order` WHERE order_id = %s FOR UPDATE", (order_id,))
+            row = cur.fetchone()
+            cur.execute("""
+                SELECT 1 FROM stock_reservation
+                WHERE order_id = %s AND expires_at <= NOW()
+                FOR UPDATE
+            """, (order_id,))
+            if not cur.fetchall():
+                conn.rollback()   # another worker got there first
+                continue
+            items = release(cur, order_id)
+            if cancel and row and row[0] == 'Pending':
+                cur.execute("UPDATE `order` SET status = 'Cancelled' WHERE order_id = %s", (order_id,))
+                rollups.order_status_changed(cur, order_id, 'Pending', 'Cancelled')
+                cancelled.append(order_id)
+            conn.commit()
+            expired[order_id] = items
+        except Exception as e:
+            conn.rollback()
+            print(f"Could not expire reservation for order {order_id}: {e}")
+    cur.close()
+    return expired, cancelled
+
+
+def _sweeper():
+    while True:
+        time.sleep(SWEEP_INTERVAL_SECONDS)
+        conn = None
+        try:
+            conn = _get_conn()
+            expired, cancelled = sweep(conn, CANCEL_EXPIRED)
+            if expired:
+                catalog.bump(holds={v for items in expired.values() for v in items})
+            for order_id in cancelled:
+                events.publish("status-changed", {"order_id": order_id, "status": "Cancelled"})
+            if cancelled:
+                print(f"Cancelled orders with expired reservations: {cancelled}")
+        except Exception as e:
+            print(f"Reservation sweeper error: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def start(get_conn):
+    """Start the background sweeper (the table comes from migrations.py)."""
+    global _started, _get_conn
+    with _lock:
+        if _started:
+            return
+        _started = True
+        _get_conn = get_conn
+
+    threading.Thread(target=_sweeper, name="reservation-sweeper", daemon=True).start()
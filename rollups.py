@@ -0,0 +1,337 @@
+"""
+Hourly and daily sales rollups for the admin dashboard.
+
+sales_rollup keeps, per bucket and product (with its category): revenue and
+units from accepted / shipped orders, and cost and units from purchase
+orders; margin is revenue - cost, the same definition as the dashboard's net
+earnings. order_status_rollup keeps order counts per bucket and status.
+Orders are bucketed by order_date, purchases by their order_date.
+
+The write paths keep them current inside their own transaction:
+order_status_changed() when an order is created or changes status (moving
+revenue in or out when it enters or leaves REVENUE_STATUSES), and
+purchase_recorded() for a new purchase order. Each is one set-based
+INSERT ... SELECT ... ON DUPLICATE KEY UPDATE per grain over that order's
+rows. query() answers any window from the rollup tables alone.
+
+backfill() recomputes whole days from history, BACKFILL_DAYS at a time, one
+transaction per batch. It replaces those days' rows, so it is safe to re-run
+(e.g. to repair drift), but run it while the store is quiet: an order written
+into a batch's days while that batch runs may be counted twice or missed.
+
+A full-history backfill records how far it got in rollup_backfill (migration
+6) with each batch. start() runs it in a background thread once per database
+- resuming an interrupted run - so an upgrade that only restarts the server
+gets full history without holding up requests or the migration lock; a named
+lock keeps other workers from running it at the same time.
+
+Usage:
+    python rollups.py backfill [YYYY-MM-DD]    recompute from a day (default: all history)
+"""
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+REVENUE_STATUSES = ("Accepted", "Shipped")
+ER_NO_SUCH_TABLE = 1146
+BACKFILL_DAYS = 31
+BACKFILL_LOCK = "ashhab_rollup_backfill"
+MAX_BUCKETS = 2000
+
+# grain -> (code stored in the table, SQL truncating a DATETIME column to the bucket)
+GRAINS = {
+    "hour": ("h", "TIMESTAMP(DATE({c}), MAKETIME(HOUR({c}), 0, 0))"),
+    "day": ("d", "TIMESTAMP(DATE({c}))"),
+}
+GROUPS = ("total", "category", "product")
+
+_ORDER_LINES = """
+    FROM `order` o
+    JOIN order_detail od ON od.order_id = o.order_id
+    JOIN product_variant v ON v.variant_id = od.variant_id
+    JOIN product p ON p.product_id = v.product_id
+"""
+_PURCHASE_LINES = """
+    FROM purchase_order po
+    JOIN purchase_order_detail pod ON pod.purchase_order_id = po.purchase_order_id
+    JOIN product_variant v ON v.variant_id = pod.variant_id
+    JOIN product p ON p.product_id = v.product_id
+"""
+
+
+def _bucket(grain, column):
+    return GRAINS[grain][1].format(c=column)
+
+
+def _revenue_statuses():
+    return ", ".join(f"'{s}'" for s in REVENUE_STATUSES)
+
+
+# ============= INCREMENTAL UPDATES =============
+
+def _execute(cur, sql, params):
+    """
+    Run one rollup write. If the rollup tables don't exist (migrations not
+    applied yet) the order or purchase still goes through: only this statement
+    fails, the rest of the transaction is untouched, and a backfill fixes the
+    rollups later.
+    """
+    try:
+        cur.execute(sql, params)
+    except mysql.connector.Error as e:
+        if e.errno != ER_NO_SUCH_TABLE:
+            raise
+        print(f"Sales rollups skipped, run the migrations: {e}")
+        return False
+    return True
+
+
+def _add_sales(cur, order_id, sign):
+    for grain, (code, _) in GRAINS.items():
+        bucket = _bucket(grain, "o.order_date")
+        if not _execute(cur, f"""
+            INSERT INTO sales_rollup (grain, bucket, product_id, category, revenue, units)
+            SELECT %s, {bucket}, p.product_id, p.category,
+                   %s * SUM(od.quantity * od.price), %s * SUM(od.quantity)
+            {_ORDER_LINES}
+            WHERE o.order_id = %s
+            GROUP BY {bucket}, p.product_id, p.category
+            ON DUPLICATE KEY UPDATE revenue = revenue + VALUES(revenue),
+                                    units = units + VALUES(units)
+        """, (code, sign, sign, order_id)):
+            return
+
+
+def _add_status(cur, order_id, status, delta):
+    for grain, (code, _) in GRAINS.items():
+        if not _execute(cur, f"""
+            INSERT INTO order_status_rollup (grain, bucket, status, orders)
+            SELECT %s, {_bucket(grain, "o.order_date")}, %s, %s
+            FROM `order` o WHERE o.order_id = %s
+            ON DUPLICATE KEY UPDATE orders = orders + VALUES(orders)
+        """, (code, status, delta, order_id)):
+            return
+
+
+def order_status_changed(cur, order_id, old_status, new_status):
+    """
+    Call in the transaction that created the order (old_status None) or
+    changed its status, after its order_detail rows exist.
+    """
+    if old_status == new_status:
+        return
+    if old_status is not None:
+        _add_status(cur, order_id, old_status, -1)
+    _add_status(cur, order_id, new_status, 1)
+
+    was, now = old_status in REVENUE_STATUSES, new_status in REVENUE_STATUSES
+    if was != now:
+        _add_sales(cur, order_id, 1 if now else -1)
+
+
+def purchase_recorded(cur, purchase_order_id):
+    """Call in the transaction that created the purchase order and its lines"""
+    for grain, (code, _) in GRAINS.items():
+        bucket = _bucket(grain, "po.order_date")
+        if not _execute(cur, f"""
+            INSERT INTO sales_rollup (grain, bucket, product_id, category, cost, purchased_units)
+            SELECT %s, {bucket}, p.product_id, p.category,
+                   SUM(pod.quantity * pod.price), SUM(pod.quantity)
+            {_PURCHASE_LINES}
+            WHERE po.purchase_order_id = %s
+            GROUP BY {bucket}, p.product_id, p.category
+            ON DUPLICATE KEY UPDATE cost = cost + VALUES(cost),
+                                    purchased_units = purchased_units + VALUES(purchased_units)
+        """, (code, purchase_order_id)):
+            return
+
+
+# ============= BACKFILL =============
+
+def _backfill_range(cur, start, end):
+    """Replace every rollup row with start <= bucket < end (whole days)"""
+    cur.execute("DELETE FROM sales_rollup WHERE bucket >= %s AND bucket < %s", (start, end))
+    cur.execute("DELETE FROM order_status_rollup WHERE bucket >= %s AND bucket < %s", (start, end))
+    for grain, (code, _) in GRAINS.items():
+        order_bucket = _bucket(grain, "o.order_date")
+        purchase_bucket = _bucket(grain, "po.order_date")
+        cur.execute(f"""
+            INSERT INTO sales_rollup (grain, bucket, product_id, category, revenue, units)
+            SELECT %s, {order_bucket}, p.product_id, p.category,
+                   SUM(od.quantity * od.price), SUM(od.quantity)
+            {_ORDER_LINES}
+            WHERE o.order_date >= %s AND o.order_date < %s
+              AND o.status IN ({_revenue_statuses()})
+            GROUP BY {order_bucket}, p.product_id, p.category
+        """, (code, start, end))
+        cur.execute(f"""
+            INSERT INTO sales_rollup (grain, bucket, product_id, category, cost, purchased_units)
+            SELECT %s, {purchase_bucket}, p.product_id, p.category,
+                   SUM(pod.quantity * pod.price), SUM(pod.quantity)
+            {_PURCHASE_LINES}
+            WHERE po.order_date >= %s AND po.order_date < %s
+            GROUP BY {purchase_bucket}, p.product_id, p.category
+            ON DUPLICATE KEY UPDATE cost = cost + VALUES(cost),
+                                    purchased_units = purchased_units + VALUES(purchased_units)
+        """, (code, start, end))
+        cur.execute(f"""
+            INSERT INTO order_status_rollup (grain, bucket, status, orders)
+            SELECT %s, {order_bucket}, o.status, COUNT(*)
+            FROM `order` o
+            WHERE o.order_date >= %s AND o.order_date < %s
+            GROUP BY {order_bucket}, o.status
+        """, (code, start, end))
+
+
+def _batches(cur, since=None):
+    """(start, end) day ranges of BACKFILL_DAYS from `since` (default: first order or purchase) to today"""
+    if since is None:
+        cur.execute("""
+            SELECT LEAST(COALESCE((SELECT MIN(order_date) FROM `order`), NOW()),
+                         COALESCE((SELECT MIN(order_date) FROM purchase_order), NOW()))
+        """)
+        since = cur.fetchall()[0][0]
+    start = datetime.combine(since.date() if isinstance(since, datetime) else since,
+                             datetime.min.time())
+    stop = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    while start < stop:
+        end = min(start + timedelta(days=BACKFILL_DAYS), stop)
+        yield start, end
+        start = end
+
+
+def _run(conn, cur, batches, record):
+    """Backfill batches, one transaction each; record=True notes progress in rollup_backfill"""
+    done = 0
+    for start, end in list(batches):
+        _backfill_range(cur, start, end)
+        if record:
+            cur.execute("""
+                INSERT INTO rollup_backfill (id, through) VALUES (1, %s)
+                ON DUPLICATE KEY UPDATE through = VALUES(through)
+            """, (end,))
+        conn.commit()
+        done += 1
+    if record:
+        cur.execute("UPDATE rollup_backfill SET finished_at = NOW() WHERE id = 1")
+        conn.commit()
+    return done
+
+
+def backfill(conn, since=None):
+    """Recompute rollups from `since` (a date; default the first order or purchase) to now"""
+    cur = conn.cursor()
+    try:
+        return _run(conn, cur, _batches(cur, since), record=since is None)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def initial_backfill(conn):
+    """
+    Fill the rollups from all history unless that was done already, resuming
+    where an interrupted run stopped. Returns the batches run, or None if
+    another worker holds the backfill lock or it is already done.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, 0)", (BACKFILL_LOCK,))
+    if cur.fetchall()[0][0] != 1:
+        cur.close()
+        return None
+    try:
+        cur.execute("SELECT through, finished_at FROM rollup_backfill WHERE id = 1")
+        rows = cur.fetchall()
+        conn.rollback()   # end the read so each batch sees current data
+        if rows and rows[0][1] is not None:
+            return None
+        return _run(conn, cur, _batches(cur, rows[0][0] if rows else None), record=True)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.execute("SELECT RELEASE_LOCK(%s)", (BACKFILL_LOCK,))
+        cur.fetchall()
+        cur.close()
+
+
+def _backfiller(get_conn):
+    conn = None
+    try:
+        conn = get_conn()
+        batches = initial_backfill(conn)
+        if batches is not None:
+            print(f"✓ Sales rollups backfilled in {batches} batch(es)")
+    except Exception as e:
+        print(f"Sales rollup backfill error (run 'python rollups.py backfill'): {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def start(get_conn):
+    """Backfill the rollups in the background if that hasn't been done yet"""
+    threading.Thread(target=_backfiller, args=(get_conn,),
+                     name="rollup-backfill", daemon=True).start()
+
+
+# ============= QUERIES =============
+
+def query(cur, start, end, grain="day", group="total"):
+    """
+    Rollups for start <= bucket < end:
+    {"sales": [{bucket, key, revenue, units, cost, purchased_units, margin}],
+     "orders": [{bucket, status, orders}]}
+    key is the category / product_id for group="category" / "product", None for "total".
+    """
+    code = GRAINS[grain][0]
+    key = {"total": "NULL", "category": "category", "product": "product_id"}[group]
+    cur.execute(f"""
+        SELECT bucket, {key} AS `key`,
+               SUM(revenue) AS revenue, SUM(units) AS units,
+               SUM(cost) AS cost, SUM(purchased_units) AS purchased_units
+        FROM sales_rollup
+        WHERE grain = %s AND bucket >= %s AND bucket < %s
+        GROUP BY bucket, `key`
+        ORDER BY bucket, `key`
+    """, (code, start, end))
+    sales = []
+    for row in cur.fetchall():
+        revenue, cost = float(row['revenue']), float(row['cost'])
+        sales.append({"bucket": row['bucket'].isoformat(), "key": row['key'],
+                      "revenue": revenue, "units": int(row['units']), "cost": cost,
+                      "purchased_units": int(row['purchased_units']),
+                      "margin": round(revenue - cost, 2)})
+
+    cur.execute("""
+        SELECT bucket, status, orders FROM order_status_rollup
+        WHERE grain = %s AND bucket >= %s AND bucket < %s AND orders <> 0
+        ORDER BY bucket, status
+    """, (code, start, end))
+    orders = [{"bucket": row['bucket'].isoformat(), "status": row['status'], "orders": int(row['orders'])}
+              for row in cur.fetchall()]
+    return {"sales": sales, "orders": orders}
+
+
+def main(argv):
+    from db import get_conn
+
+    if not argv or argv[0] != "backfill":
+        print(__doc__)
+        return 1
+    since = datetime.strptime(argv[1], "%Y-%m-%d") if len(argv) > 1 else None
+    conn = get_conn()
+    try:
+        batches = backfill(conn, since)
+    finally:
+        conn.close()
+    print(f"✓ Rollups rebuilt in {batches} batch(es) of up to {BACKFILL_DAYS} days")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,12 +1,84 @@
-from flask import Flask, request, render_template, jsonify, session, send_from_directory
-from db import get_conn
+from flask import Flask, request, render_template, jsonify, session, send_from_directory, Response, stream_with_context
+from db import get_conn, in_clause, is_pinned, replica_status, REPLICAS, PIN_SECONDS
 from decimal import Decimal
+from datetime import datetime, timedelta
+from werkzeug.datastructures import MultiDict
+from concurrent.futures import ThreadPoolExecutor
 import traceback
+import time
+import hashlib
+import json
+import os
+import reservations
+import inventory
+import catalog_import
+import migrations
+import events
+import catalog
+import catalog_snapshot
+import catalog_file
+import facets
+import recommendations
+import rollups
+import similar_products
+import page_cache
+import singleflight
+import statements
 
 app = Flask(__name__)
 app.secret_key = "ashhab-sport-secret-key-2025"
 
 DEFAULT_WAREHOUSE_ID = 1  # Main warehouse
+ORDER_PAGE_SIZE = 50
+ORDER_PAGE_MAX = 200
+STOREFRONT_PAGE_SIZE = 24   # products server-rendered into main.html
+STOREFRONT_FEATURED = 6
+
+_jobs_started = False
+
+
+@app.before_request
+def start_background_jobs():
+    global _jobs_started
+    if _jobs_started:
+        return
+    _jobs_started = True
+
+    # Schema first: the ledger snapshotter needs its tables
+    conn = get_conn()
+    try:
+        migrations.migrate(conn)
+    except Exception as e:
+        print(f"Could not apply schema migrations: {e}")
+    finally:
+        conn.close()
+
+    reservations.start(get_conn)
+    inventory.start(get_conn)
+    recommendations.start(get_conn)
+    similar_products.start(get_conn)
+    rollups.start(get_conn)
+
+
+@app.after_request
+def note_write(resp):
+    """Remember when this session last wrote so its reads stay on the primary for a while"""
+    if (request.method in ("POST", "PUT", "PATCH", "DELETE") and resp.status_code < 400
+            and request.path != "/api/batch"):
+        session['last_write'] = time.time()
+    return resp
+
+
+@app.after_request
+def api_etag(resp):
+    """ETag every JSON GET so the client cache can revalidate with If-None-Match"""
+    if (request.method == "GET" and request.path.startswith("/api/")
+            and resp.status_code == 200 and not resp.is_streamed
+            and resp.mimetype == "application/json"):
+        resp.add_etag()
+        resp.headers.setdefault("Cache-Control", "private, no-cache")
+        resp.make_conditional(request)
+    return resp
 
 
 # ============= HTML PAGE ROUTES =============
@@ -14,82 +86,141 @@ DEFAULT_WAREHOUSE_ID = 1  # Main warehouse
 @app.route("/")
 @app.route("/index.html")
 def index():
-    return render_template("index.html")
+    return page_cache.page("index.html")
+
+
+@app.template_filter("currency")
+def currency_filter(value):
+    """Server-side counterpart of formatCurrency() in ui.js"""
+    return f"₪{float(value or 0):,.0f}"
+
+
+def _catalog_page(key, build):
+    """
+    Serve server-rendered catalog HTML cached per catalog version and template
+    files, with ETag/304 and gzip
+    """
+    try:
+        entry = catalog.cached(key + page_cache.template_key(key[0]),
+                               lambda: page_cache.PageEntry(build()))
+    except Exception as e:
+        # Without the DB the page still works: the JS fetches data itself
+        print(f"Server render failed for {key[0]}: {e}")
+        return page_cache.page(key[0])
+
+    return page_cache.respond(entry)
+
+
+def _without_stock(products):
+    """
+    Drop stock from products rendered into cached pages: the fragment cache
+    survives reservation changes, so the page scripts fetch availability live.
+    """
+    for product in products:
+        for v in product.get('variants', ()):
+            v.pop('stock_quantity', None)
+            v.pop('available_quantity', None)
+    return products
+
+
+def _storefront_context():
+    """First page of products plus the featured picks, without stock; main.js loads the rest"""
+    snapshot = _catalog_snapshot()
+    records = snapshot.records()
+    featured = [p for p in records if p.featured][:STOREFRONT_FEATURED]
+    return {"products": _without_stock(snapshot.to_dicts(products=records[:STOREFRONT_PAGE_SIZE])),
+            "featured": _without_stock(snapshot.to_dicts(products=featured)),
+            "total": len(records), "categories": snapshot.categories()}
+
+
+def _product_context(product_id):
+    product = _fetch_product(product_id)
+    return {"product": _without_stock([product])[0]} if product else {}
 
 
 @app.route("/main.html")
 def main():
-    return render_template("main.html")
+    return _catalog_page(("main.html",),
+                         lambda: render_template("main.html", **_storefront_context()))
 
 
 @app.route("/login.html")
 def login():
-    return render_template("login.html")
+    return page_cache.page("login.html")
 
 
 @app.route("/signup.html")
 def signup():
-    return render_template("signup.html")
+    return page_cache.page("signup.html")
 
 
 @app.route("/product.html")
 def product():
-    return render_template("product.html")
+    product_id = request.args.get("id", type=int)
+    if not product_id:
+        return page_cache.page("product.html")
+    return _catalog_page(("product.html", product_id),
+                         lambda: render_template("product.html", **_product_context(product_id)))
 
 
 @app.route("/customer.html")
 def customer():
-    return render_template("customer.html")
+    return page_cache.page("customer.html")
 
 
 @app.route("/payment-info.html")
 def payment_info():
-    return render_template("payment-info.html")
+    return page_cache.page("payment-info.html")
 
 
 @app.route("/employee.html")
 def employee():
-    return render_template("employee.html")
+    return page_cache.page("employee.html")
 
 
 @app.route("/admin.html")
 def admin():
-    return render_template("admin.html")
+    return page_cache.page("admin.html")
 
 
 @app.route("/admin-employees.html")
 def admin_employees():
-    return render_template("admin-employees.html")
+    return page_cache.page("admin-employees.html")
 
 
 @app.route("/admin-products.html")
 def admin_products():
-    return render_template("admin-products.html")
+    return page_cache.page("admin-products.html")
 
 
 @app.route("/admin-stock.html")
 def admin_stock():
-    return render_template("admin-stock.html")
+    return page_cache.page("admin-stock.html")
 
 
 @app.route("/admin-purchases.html")
 def admin_purchases():
-    return render_template("admin-purchases.html")
+    return page_cache.page("admin-purchases.html")
 
 
 @app.route("/admin-orders.html")
 def admin_orders():
-    return render_template("admin-orders.html")
+    return page_cache.page("admin-orders.html")
 
 
 @app.route("/admin-suppliers.html")
 def admin_suppliers():
-    return render_template("admin-suppliers.html")
+    return page_cache.page("admin-suppliers.html")
 
 
 @app.route("/order.html")
 def order():
-    return render_template("order.html")
+    return page_cache.page("order.html")
+
+
+@app.route("/offline.html")
+def offline():
+    return page_cache.page("offline.html")
 
 
 @app.route("/assets/<path:filename>")
@@ -97,42 +228,285 @@ def assets(filename):
     return send_from_directory("static/assets", filename)
 
 
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SHELL_DIRS = ("js", "css")
+OFFLINE_PAGE = "/offline.html"   # answers navigations the service worker has no copy of
+
+
+def _asset_build():
+    """(version, precache urls) for the service worker, from the static js/css contents"""
+    digest = hashlib.md5()
+    urls = ["/main.html", OFFLINE_PAGE, "/assets/img/products/placeholder.jpg"]
+    for folder in SHELL_DIRS:
+        for name in sorted(os.listdir(os.path.join(STATIC_DIR, folder))):
+            if folder == "js" and name == "sw.js":
+                continue
+            with open(os.path.join(STATIC_DIR, folder, name), "rb") as f:
+                digest.update(name.encode("utf-8"))
+                digest.update(f.read())
+            urls.append(f"/static/{folder}/{name}")
+    return digest.hexdigest()[:12], urls
+
+
+_ASSET_BUILD = _asset_build()
+
+
+@app.route("/sw.js")
+def service_worker():
+    """Service worker at the site root (so its scope covers every page), stamped with the asset version"""
+    # Dev mode re-hashes on every request so edits roll the worker immediately
+    version, urls = _ASSET_BUILD if page_cache.ENABLED else _asset_build()
+    with open(os.path.join(STATIC_DIR, "js", "sw.js"), encoding="utf-8") as f:
+        body = f"const ASSET_VERSION = {json.dumps(version)};\n" \
+               f"const PRECACHE_URLS = {json.dumps(urls)};\n\n" + f.read()
+    resp = Response(body, mimetype="application/javascript")
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+# ============= SHARED QUERIES =============
+# Used by the individual endpoints and by /api/bootstrap, which assembles a
+# whole page's data on one connection.
+
+def _read_conn():
+    """Connection for read-only routes: a replica, unless this session just wrote"""
+    return get_conn("read", last_write=session.get('last_write'))
+
+
+def _read_key():
+    """Single-flight key for replica reads: pinned sessions don't share a replica result"""
+    return singleflight.default_key() + (is_pinned(session.get('last_write')),)
+
+
+def _session_user():
+    """Current session user in the /api/session shape, or None"""
+    if 'user_id' not in session:
+        return None
+    return {
+        "id": session['user_id'],
+        "type": session['user_type'],
+        "role": session.get('user_role'),
+        "name": session.get('user_name')
+    }
+
+
+def _prepare_variants(variants):
+    for v in variants:
+        v['stock_quantity'] = int(v['stock_quantity'])
+        v['available_quantity'] = reservations.available_quantity(
+            v['variant_id'], v['stock_quantity'])
+    return variants
+
+
+# Sparse fieldsets (?fields=a,b&include=variants): field -> SQL expression
+PRODUCT_COLUMNS = {
+    "product_id": "p.product_id",
+    "product_name": "p.product_name",
+    "description": "p.description",
+    "price": "p.price",
+    "category": "p.category",
+    "image_url": "p.image_url",
+    "featured": "p.featured",
+    "variant_count": "(SELECT COUNT(*) FROM product_variant pv WHERE pv.product_id = p.product_id)",
+}
+DEFAULT_PRODUCT_FIELDS = ["product_id", "product_name", "description", "price",
+                          "category", "image_url", "featured"]
+
+STOCK_COLUMNS = {
+    "variant_id": "v.variant_id",
+    "product_id": "v.product_id",
+    "size": "v.size",
+    "color": "v.color",
+    "product_name": "p.product_name",
+    "category": "p.category",
+    "price": "p.price",
+    "stock_quantity": "COALESCE(SUM(s.quantity), 0)",
+}
+
+
+def _fields_param(args, columns, always):
+    """
+    Parse ?fields= into a list of known column names (None when absent).
+    The key column is always included; unknown names raise ValueError.
+    """
+    raw = args.get("fields")
+    if not raw:
+        return None
+    fields = [always]
+    for name in raw.split(","):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in columns:
+            raise ValueError(f"Unknown field: {name}")
+        fields.append(name)
+    return fields
+
+
+def _includes(args):
+    return {name.strip() for name in args.get("include", "").split(",") if name.strip()}
+
+
+def _fetch_products(cur, fields=None, include_variants=True, product_ids=None):
+    """
+    Products with their variants and stock (two queries in total).
+    fields limits the product columns selected; include_variants=False skips
+    the variant/stock query entirely; product_ids restricts both queries.
+    """
+    fields = fields or DEFAULT_PRODUCT_FIELDS
+    select = ", ".join(f"{PRODUCT_COLUMNS[f]} AS {f}" for f in fields)
+    where, params = "", []
+    if product_ids is not None:
+        if not product_ids:
+            return []
+        params = list(product_ids)
+        where = f" WHERE p.product_id IN ({in_clause(params)})"
+    cur.execute(f"SELECT {select} FROM product p{where} ORDER BY p.product_id", params)
+    products = cur.fetchall()
+    for product in products:
+        if 'price' in product:
+            product['price'] = float(product['price'])
+
+    if not include_variants:
+        return products
+
+    cur.execute(f"""
+        SELECT v.product_id, v.variant_id, v.size, v.color, 
+               COALESCE(SUM(s.quantity), 0) as stock_quantity
+        FROM product_variant v
+        LEFT JOIN stock s ON s.variant_id = v.variant_id
+        {where.replace("p.product_id", "v.product_id")}
+        GROUP BY v.product_id, v.variant_id, v.size, v.color
+        ORDER BY v.variant_id
+    """, params)
+    by_product = {}
+    for v in _prepare_variants(cur.fetchall()):
+        by_product.setdefault(v.pop('product_id'), []).append(v)
+
+    for product in products:
+        product['variants'] = by_product.get(product['product_id'], [])
+    return products
+
+
+def _fetch_stock(cur, fields, variant_ids=None):
+    """Stock rows per variant; only joins product / stock when the fields need them"""
+    exprs = [STOCK_COLUMNS[f] for f in fields]
+    plain = [e for f, e in zip(fields, exprs) if f != "stock_quantity"]
+    joins = ""
+    if any(e.startswith("p.") for e in exprs):
+        joins += " JOIN product p ON p.product_id = v.product_id"
+    where, params = "", []
+    if variant_ids is not None:
+        if not variant_ids:
+            return []
+        params = list(variant_ids)
+        where = f" WHERE v.variant_id IN ({in_clause(params)})"
+    group = ""
+    if "stock_quantity" in fields:
+        joins += " LEFT JOIN stock s ON s.variant_id = v.variant_id"
+        group = " GROUP BY " + ", ".join(plain + [e for e in ["v.product_id"] if e not in plain])
+
+    cur.execute(
+        "SELECT " + ", ".join(f"{e} AS {f}" for f, e in zip(fields, exprs)) +
+        " FROM product_variant v" + joins + where + group +
+        " ORDER BY v.product_id, v.variant_id", params)
+    stock = cur.fetchall()
+    for item in stock:
+        if 'price' in item:
+            item['price'] = float(item['price'])
+        if 'stock_quantity' in item:
+            item['stock_quantity'] = int(item['stock_quantity'])
+    return stock
+
+
+def _catalog_delta(cur, since, kind, fetch):
+    """
+    ?since=<version> response for products ("product") or stock ("variant"):
+    {"version", "full", "upserts", "deletes"}. fetch(ids) loads rows (ids=None: all).
+    Falls back to a full list when since is outside the change log.
+    """
+    current = catalog.version()
+    changes = catalog.changes_since(since)
+    if changes is None:
+        return {"version": current, "full": True, "upserts": fetch(None), "deletes": []}
+
+    # A variant change shows up in its product; a product change in its variants' stock rows
+    if kind == "product":
+        ids, related, deletes = set(changes['products']), changes['variants'], changes['deleted_products']
+        lookup = "SELECT DISTINCT product_id AS id FROM product_variant WHERE variant_id IN ({})"
+    else:
+        ids, related, deletes = set(changes['variants']), changes['products'], changes['deleted_variants']
+        lookup = "SELECT variant_id AS id FROM product_variant WHERE product_id IN ({})"
+    if related:
+        cur.execute(lookup.format(in_clause(related)), list(related))
+        ids.update(row['id'] for row in cur.fetchall())
+    ids -= deletes
+
+    return {"version": changes['version'], "full": False,
+            "upserts": fetch(sorted(ids)), "deletes": sorted(deletes)}
+
+
+def _catalog_snapshot():
+    """
+    Catalog for listings and product pages: the host-wide mmap snapshot file,
+    or an in-process snapshot where that isn't available. With replicas, a
+    change is rebuilt from a replica once it is PIN_SECONDS old (the previous
+    snapshot is served until then); a session that just wrote gets it rebuilt
+    from the primary at once, like its other reads.
+    """
+    fresh = not REPLICAS or is_pinned(session.get('last_write'))
+    delay = None if fresh else PIN_SECONDS
+    return catalog_file.current(get_conn, delay) or catalog_snapshot.current(get_conn, delay)
+
+
+def _fetch_product(product_id):
+    """Single product with variants and stock, or None"""
+    snapshot = _catalog_snapshot()
+    product = snapshot.product(product_id)
+    return None if product is None else snapshot.to_dict(product)
+
+
+def _fetch_categories(cur):
+    cur.execute("SELECT DISTINCT category FROM product ORDER BY category")
+    return [row['category'] for row in cur.fetchall()]
+
+
 # ============= API ENDPOINTS =============
 
 @app.route("/api/products", methods=["GET"])
+@singleflight.coalesce(_read_key)
 def api_products():
-    """Get all products with their variants and stock"""
+    """
+    Get all products with their variants and stock.
+    ?fields=product_id,product_name,... selects only those columns; with fields
+    set, variants are only returned when ?include=variants is given.
+    ?since=<version> returns {"version", "full", "upserts", "deletes"} with only
+    the products changed after that version (since=0 for the initial load).
+    """
+    try:
+        fields = _fields_param(request.args, PRODUCT_COLUMNS, "product_id")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    include_variants = fields is None or "variants" in _includes(request.args)
+    since = request.args.get("since", type=int)
+
+    if since is None:
+        try:
+            return jsonify(_catalog_snapshot().to_dicts(fields, include_variants))
+        except Exception as e:
+            print(f"Error fetching products: {e}")
+            traceback.print_exc()
+            return jsonify({"error": str(e)}), 500
+
+    # Deltas must come from the primary: a lagging replica would hand out the
+    # new version with old rows and the client would never see the change
     conn = get_conn()
     try:
         cur = conn.cursor(dictionary=True)
-
-        cur.execute("""
-            SELECT product_id, product_name, description, price, 
-                   category, image_url, featured
-            FROM product
-            ORDER BY product_id
-        """)
-        products = cur.fetchall()
-
-        for product in products:
-            # Get variants with stock
-            cur.execute("""
-                SELECT v.variant_id, v.size, v.color, 
-                       COALESCE(SUM(s.quantity), 0) as stock_quantity
-                FROM product_variant v
-                LEFT JOIN stock s ON s.variant_id = v.variant_id
-                WHERE v.product_id = %s
-                GROUP BY v.variant_id, v.size, v.color
-                ORDER BY v.variant_id
-            """, (product['product_id'],))
-            product['variants'] = cur.fetchall()
-
-            product['price'] = float(product['price'])
-            for v in product['variants']:
-                v['stock_quantity'] = int(v['stock_quantity'])
-
+        result = _catalog_delta(cur, since, "product",
+                                lambda ids: _fetch_products(cur, fields, include_variants, ids))
         cur.close()
-        return jsonify(products)
+        return jsonify(result)
     except Exception as e:
         print(f"Error fetching products: {e}")
         traceback.print_exc()
@@ -142,54 +516,60 @@ def api_products():
 
 
 @app.route("/api/products/<int:product_id>", methods=["GET"])
+@singleflight.coalesce(_read_key)
 def api_product_detail(product_id):
     """Get single product with variants and stock"""
-    conn = get_conn()
     try:
-        cur = conn.cursor(dictionary=True)
-
-        cur.execute("""
-            SELECT product_id, product_name, description, price, 
-                   category, image_url, featured
-            FROM product
-            WHERE product_id = %s
-        """, (product_id,))
-        product = cur.fetchone()
+        product = _fetch_product(product_id)
 
         if not product:
             return jsonify({"error": "Product not found"}), 404
 
-        cur.execute("""
-            SELECT v.variant_id, v.size, v.color, 
-                   COALESCE(SUM(s.quantity), 0) as stock_quantity
-            FROM product_variant v
-            LEFT JOIN stock s ON s.variant_id = v.variant_id
-            WHERE v.product_id = %s
-            GROUP BY v.variant_id, v.size, v.color
-            ORDER BY v.variant_id
-        """, (product_id,))
-        product['variants'] = cur.fetchall()
-
-        product['price'] = float(product['price'])
-        for v in product['variants']:
-            v['stock_quantity'] = int(v['stock_quantity'])
-
-        cur.close()
         return jsonify(product)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+
+
+@app.route("/api/products/<int:product_id>/similar", methods=["GET"])
+def api_similar_products(product_id):
+    """
+    Products with similar names / descriptions (TF-IDF neighbours), or from
+    the same category while the index isn't built. ?limit= (default 6).
+    Returns {"source": "content" | "category", "products": [{..., "score"}]}.
+    """
+    limit = max(1, min(request.args.get("limit", 6, type=int), similar_products.TOP_K))
+    fields = ["product_id", "product_name", "price", "category", "image_url"]
+    try:
+        snapshot = _catalog_snapshot()
+        product = snapshot.product(product_id)
+        if product is None:
+            return jsonify({"error": "Product not found"}), 404
+
+        products = []
+        for other_id, score in similar_products.similar(product_id):
+            other = snapshot.product(other_id)
+            if other is not None:
+                products.append({**snapshot.to_dict(other, fields, False), "score": round(score, 4)})
+        if products:
+            return jsonify({"source": "content", "products": products[:limit]})
+
+        same = [p for p in snapshot.records()
+                if p.category == product.category and p.product_id != product_id]
+        return jsonify({"source": "category",
+                        "products": [snapshot.to_dict(p, fields, False) for p in same[:limit]]})
+    except Exception as e:
+        print(f"Error fetching similar products: {e}")
+        return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/categories", methods=["GET"])
+@singleflight.coalesce(_read_key)
 def api_categories():
     """Get all product categories"""
-    conn = get_conn()
+    conn = _read_conn()
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT category FROM product ORDER BY category")
-        categories = [row[0] for row in cur.fetchall()]
+        cur = conn.cursor(dictionary=True)
+        categories = _fetch_categories(cur)
         cur.close()
         return jsonify(categories)
     except Exception as e:
@@ -198,6 +578,57 @@ def api_categories():
         conn.close()
 
 
+@app.route("/api/facets", methods=["GET"])
+def api_facets():
+    """
+    Faceted product search.
+    ?category=&size=&color=&price=<band>&in_stock=1 (repeat a facet to OR values)
+    returns {"version", "total", "product_ids", "facets": {facet: [{value, count}]}}.
+    """
+    selected = {f: request.args.getlist(f) for f in facets.FACETS if f in request.args}
+    try:
+        return jsonify(facets.search(_catalog_snapshot(), selected))
+    except Exception as e:
+        print(f"Error searching facets: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/recommendations", methods=["GET"])
+def api_recommendations():
+    """
+    ?product_id=<id>: products often bought together with it.
+    ?customer=<id>: picks from that customer's purchases (own id, or any for staff).
+    Returns {"source": "co-purchase" | "featured", "product_ids"}; featured
+    products when there is no purchase signal yet. ?limit= caps the list (default 6).
+    """
+    product_id = request.args.get("product_id", type=int)
+    customer_id = request.args.get("customer", type=int)
+    limit = max(1, min(request.args.get("limit", 6, type=int), recommendations.TOP_K))
+    if product_id is None and customer_id is None:
+        return jsonify({"error": "product_id or customer is required"}), 400
+    if customer_id is not None and session.get('user_type') != 'employee' and \
+            not (session.get('user_type') == 'customer' and session.get('user_id') == customer_id):
+        return jsonify({"error": "Not authorized"}), 401
+
+    try:
+        snapshot = _catalog_snapshot()
+        # Over-fetch: some picks may have been deleted since the last build
+        if product_id is not None:
+            picks = recommendations.for_product(product_id, recommendations.TOP_K)
+        else:
+            picks = recommendations.for_customer(customer_id, recommendations.TOP_K)
+        ids = [pid for pid, _ in picks if snapshot.product(pid) is not None][:limit]
+        if ids:
+            return jsonify({"source": "co-purchase", "product_ids": ids})
+
+        featured = [p.product_id for p in snapshot.records()
+                    if p.featured and p.product_id != product_id]
+        return jsonify({"source": "featured", "product_ids": featured[:limit]})
+    except Exception as e:
+        print(f"Error fetching recommendations: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/login", methods=["POST"])
 def api_login():
     """Handle login for customers and employees"""
@@ -220,8 +651,7 @@ def api_login():
 
             if user:
                 # Ensure cart exists
-                cur.execute("SELECT cart_id FROM cart WHERE customer_id = %s", (user['customer_id'],))
-                cart = cur.fetchone()
+                cart = statements.fetch_one(conn, "cart_id", (user['customer_id'],))
                 if not cart:
                     cur.execute("INSERT INTO cart (customer_id) VALUES (%s)", (user['customer_id'],))
                     conn.commit()
@@ -282,16 +712,9 @@ def api_logout():
 @app.route("/api/session", methods=["GET"])
 def api_session():
     """Get current session info"""
-    if 'user_id' in session:
-        return jsonify({
-            "logged_in": True,
-            "user": {
-                "id": session['user_id'],
-                "type": session['user_type'],
-                "role": session.get('user_role'),
-                "name": session.get('user_name')
-            }
-        })
+    user = _session_user()
+    if user:
+        return jsonify({"logged_in": True, "user": user})
     return jsonify({"logged_in": False})
 
 
@@ -332,6 +755,25 @@ def api_signup():
         conn.close()
 
 
+def _fetch_cart(conn, cur, customer_id):
+    """Cart items for a customer, creating the cart if it doesn't exist"""
+    cart = statements.fetch_one(conn, "cart_id", (customer_id,))
+    if not cart:
+        # Create cart if it doesn't exist
+        cur.execute("INSERT INTO cart (customer_id) VALUES (%s)", (customer_id,))
+        conn.commit()
+        cart_id = cur.lastrowid
+    else:
+        cart_id = cart['cart_id']
+
+    items = statements.fetch_all(conn, "cart_items", (cart_id,))
+
+    for item in items:
+        item['price'] = float(item['price'])
+        item['cart_item_id'] = item['variant_id']  # For compatibility
+    return items
+
+
 @app.route("/api/cart", methods=["GET"])
 def api_get_cart():
     """Get customer's cart"""
@@ -342,39 +784,7 @@ def api_get_cart():
     conn = get_conn()
     try:
         cur = conn.cursor(dictionary=True)
-
-        # Get cart_id
-        cur.execute("SELECT cart_id FROM cart WHERE customer_id = %s", (customer_id,))
-        cart = cur.fetchone()
-        if not cart:
-            # Create cart if it doesn't exist
-            cur.execute("INSERT INTO cart (customer_id) VALUES (%s)", (customer_id,))
-            conn.commit()
-            cart_id = cur.lastrowid
-        else:
-            cart_id = cart['cart_id']
-
-        # Get cart items
-        cur.execute("""
-            SELECT ci.variant_id, ci.quantity, ci.cart_id,
-                   p.product_id, p.product_name, p.price, p.category,
-                   v.size, v.color,
-                   COALESCE(SUM(s.quantity), 0) as stock_quantity
-            FROM cart_item ci
-            JOIN product_variant v ON v.variant_id = ci.variant_id
-            JOIN product p ON p.product_id = v.product_id
-            LEFT JOIN stock s ON s.variant_id = ci.variant_id
-            WHERE ci.cart_id = %s
-            GROUP BY ci.variant_id, ci.quantity, ci.cart_id, 
-                     p.product_id, p.product_name, p.price, p.category, 
-                     v.size, v.color
-        """, (cart_id,))
-        items = cur.fetchall()
-
-        for item in items:
-            item['price'] = float(item['price'])
-            item['cart_item_id'] = item['variant_id']  # For compatibility
-
+        items = _fetch_cart(conn, cur, customer_id)
         cur.close()
         return jsonify(items)
     except Exception as e:
@@ -397,8 +807,7 @@ def api_add_to_cart():
         cur = conn.cursor(dictionary=True)
 
         # Get cart_id
-        cur.execute("SELECT cart_id FROM cart WHERE customer_id = %s", (customer_id,))
-        cart = cur.fetchone()
+        cart = statements.fetch_one(conn, "cart_id", (customer_id,))
         if not cart:
             cur.execute("INSERT INTO cart (customer_id) VALUES (%s)", (customer_id,))
             conn.commit()
@@ -407,11 +816,8 @@ def api_add_to_cart():
             cart_id = cart['cart_id']
 
         # Check if item already in cart
-        cur.execute("""
-            SELECT quantity FROM cart_item
-            WHERE cart_id = %s AND variant_id = %s
-        """, (cart_id, data.get("variant_id")))
-        existing = cur.fetchone()
+        existing = statements.fetch_one(conn, "cart_item_quantity",
+                                        (cart_id, data.get("variant_id")))
 
         if existing:
             new_qty = existing['quantity'] + data.get("quantity", 1)
@@ -448,8 +854,7 @@ def api_update_cart(variant_id):
     try:
         cur = conn.cursor(dictionary=True)
 
-        cur.execute("SELECT cart_id FROM cart WHERE customer_id = %s", (customer_id,))
-        cart = cur.fetchone()
+        cart = statements.fetch_one(conn, "cart_id", (customer_id,))
         if not cart:
             return jsonify({"error": "Cart not found"}), 404
 
@@ -478,8 +883,7 @@ def api_delete_cart(variant_id):
     try:
         cur = conn.cursor(dictionary=True)
 
-        cur.execute("SELECT cart_id FROM cart WHERE customer_id = %s", (customer_id,))
-        cart = cur.fetchone()
+        cart = statements.fetch_one(conn, "cart_id", (customer_id,))
         if not cart:
             return jsonify({"error": "Cart not found"}), 404
 
@@ -497,52 +901,148 @@ def api_delete_cart(variant_id):
         conn.close()
 
 
+def _order_scope():
+    """WHERE clauses and params limiting orders to what the session may see"""
+    if session['user_type'] == 'customer':
+        return ["o.customer_id = %s"], [session['user_id']]
+    if session.get('user_role') == 'ADMIN':
+        return [], []
+    return ["(o.status = 'Pending' OR o.employee_id = %s)"], [session['user_id']]
+
+
+def _order_filters(args):
+    """WHERE clauses and params for the optional order list filters"""
+    where, params = [], []
+
+    status = args.get('status')
+    if status and status != 'All':
+        where.append("o.status = %s")
+        params.append(status)
+    if args.get('from'):
+        where.append("o.order_date >= %s")
+        params.append(args.get('from'))
+    if args.get('to'):
+        where.append("o.order_date < %s + INTERVAL 1 DAY")
+        params.append(args.get('to'))
+    if args.get('customer_id', type=int):
+        where.append("o.customer_id = %s")
+        params.append(args.get('customer_id', type=int))
+    if args.get('mine') and session['user_type'] == 'employee':
+        where.append("o.employee_id = %s")
+        params.append(session['user_id'])
+    elif args.get('employee_id', type=int):
+        where.append("o.employee_id = %s")
+        params.append(args.get('employee_id', type=int))
+
+    q = (args.get('q') or '').strip().lstrip('#')
+    if q and session['user_type'] == 'employee':
+        if q.isdigit():
+            where.append("o.order_id = %s")
+            params.append(int(q))
+        else:
+            where.append("(c.first_name LIKE %s OR c.last_name LIKE %s)")
+            params.extend([q + '%', q + '%'])
+
+    return where, params
+
+
+def _fetch_orders(cur, args):
+    """Order list for the session; a {orders, next_cursor} page when args has limit/cursor"""
+    paged = 'limit' in args or 'cursor' in args
+    limit = min(max(args.get('limit', ORDER_PAGE_SIZE, type=int), 1), ORDER_PAGE_MAX)
+    cursor = args.get('cursor', type=int)
+
+    where, params = _order_scope()
+    extra_where, extra_params = _order_filters(args)
+    where += extra_where
+    params += extra_params
+    if cursor:
+        where.append("o.order_id < %s")
+        params.append(cursor)
+
+    sql = """
+        SELECT o.order_id, o.order_date, o.status, o.total_amount,
+               c.first_name AS customer_first, c.last_name AS customer_last,
+               e.first_name AS employee_first, e.last_name AS employee_last
+        FROM `order` o
+        JOIN customer c ON c.customer_id = o.customer_id
+        LEFT JOIN employee e ON e.employee_id = o.employee_id
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY o.order_id DESC"
+    if paged:
+        sql += " LIMIT %s"
+        params.append(limit + 1)
+
+    cur.execute(sql, params)
+    orders = cur.fetchall()
+    for order in orders:
+        order['total_amount'] = float(order['total_amount'])
+
+    if not paged:
+        return orders
+
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = orders[-1]['order_id']
+    return {"orders": orders, "next_cursor": next_cursor}
+
+
+def _fetch_order_counts(cur):
+    """Per-status counts for the session's orders, plus 'mine' for employees"""
+    where, params = _order_scope()
+    sql = "SELECT o.status, COUNT(*) AS count FROM `order` o"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " GROUP BY o.status"
+    cur.execute(sql, params)
+    by_status = {row['status']: row['count'] for row in cur.fetchall()}
+
+    counts = {"by_status": by_status, "pending": by_status.get('Pending', 0)}
+    if session['user_type'] == 'employee':
+        cur.execute("SELECT COUNT(*) AS count FROM `order` WHERE employee_id = %s",
+                    (session['user_id'],))
+        counts['mine'] = cur.fetchone()['count']
+    return counts
+
+
 @app.route("/api/orders", methods=["GET"])
 def api_get_orders():
-    """Get orders filtered by user type"""
+    """Get orders filtered by user type.
+
+    Optional filters: status, from, to (YYYY-MM-DD), customer_id, employee_id,
+    mine=1, q (order id or customer name). Passing limit and/or cursor returns
+    {"orders": [...], "next_cursor": id} pages ordered by order_id DESC.
+    """
     if 'user_id' not in session:
         return jsonify({"error": "Not logged in"}), 401
 
     conn = get_conn()
     try:
         cur = conn.cursor(dictionary=True)
+        result = _fetch_orders(cur, request.args)
+        cur.close()
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
 
-        if session['user_type'] == 'customer':
-            cur.execute("""
-                SELECT o.order_id, o.order_date, o.status, o.total_amount,
-                       e.first_name AS employee_first, e.last_name AS employee_last
-                FROM `order` o
-                LEFT JOIN employee e ON e.employee_id = o.employee_id
-                WHERE o.customer_id = %s
-                ORDER BY o.order_id DESC
-            """, (session['user_id'],))
-        elif session['user_type'] == 'employee':
-            if session.get('user_role') == 'ADMIN':
-                cur.execute("""
-                    SELECT o.order_id, o.order_date, o.status, o.total_amount,
-                           c.first_name AS customer_first, c.last_name AS customer_last,
-                           e.first_name AS employee_first, e.last_name AS employee_last
-                    FROM `order` o
-                    JOIN customer c ON c.customer_id = o.customer_id
-                    LEFT JOIN employee e ON e.employee_id = o.employee_id
-                    ORDER BY o.order_id DESC
-                """)
-            else:
-                cur.execute("""
-                    SELECT o.order_id, o.order_date, o.status, o.total_amount,
-                           c.first_name AS customer_first, c.last_name AS customer_last
-                    FROM `order` o
-                    JOIN customer c ON c.customer_id = o.customer_id
-                    WHERE o.status = 'Pending' OR o.employee_id = %s
-                    ORDER BY o.order_id DESC
-                """, (session['user_id'],))
-
-        orders = cur.fetchall()
-        for order in orders:
-            order['total_amount'] = float(order['total_amount'])
 
+@app.route("/api/orders/counts", methods=["GET"])
+def api_order_counts():
+    """Order counts for queue badges: per status, plus 'mine' for employees"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    conn = get_conn()
+    try:
+        cur = conn.cursor(dictionary=True)
+        counts = _fetch_order_counts(cur)
         cur.close()
-        return jsonify(orders)
+        return jsonify(counts)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     finally:
@@ -572,8 +1072,7 @@ def api_create_order():
             return jsonify({"error": "Payment info required", "redirect": "payment-info"}), 400
 
         # Get cart
-        cur.execute("SELECT cart_id FROM cart WHERE customer_id = %s", (customer_id,))
-        cart = cur.fetchone()
+        cart = statements.fetch_one(conn, "cart_id", (customer_id,))
         if not cart:
             return jsonify({"error": "Cart not found"}), 400
 
@@ -593,11 +1092,6 @@ def api_create_order():
         if not items:
             return jsonify({"error": "Cart is empty"}), 400
 
-        # Check stock
-        for item in items:
-            if item['stock_quantity'] < item['quantity']:
-                return jsonify({"error": "Not enough stock for some items"}), 400
-
         # Calculate total
         total = sum(float(item['price']) * item['quantity'] for item in items)
 
@@ -608,6 +1102,14 @@ def api_create_order():
         """, (customer_id, DEFAULT_WAREHOUSE_ID, total))
         order_id = cur.lastrowid
 
+        # Hold stock for the pending order (checks stock minus other holds)
+        wanted = {}
+        for item in items:
+            wanted[item['variant_id']] = wanted.get(item['variant_id'], 0) + item['quantity']
+        if not reservations.reserve(cur, order_id, DEFAULT_WAREHOUSE_ID, wanted):
+            conn.rollback()
+            return jsonify({"error": "Not enough stock for some items"}), 400
+
         # Add order items
         for item in items:
             cur.execute("""
@@ -618,8 +1120,20 @@ def api_create_order():
         # Clear cart
         cur.execute("DELETE FROM cart_item WHERE cart_id = %s", (cart['cart_id'],))
 
+        rollups.order_status_changed(cur, order_id, None, 'Pending')
         conn.commit()
+        catalog.bump(holds=wanted)
         cur.close()
+
+        first, _, last = session.get('user_name', '').partition(' ')
+        events.publish("order-created", {
+            "order_id": order_id,
+            "order_date": datetime.now().isoformat(),
+            "status": "Pending",
+            "total_amount": total,
+            "customer_first": first,
+            "customer_last": last,
+        })
         return jsonify({"success": True, "order_id": order_id})
     except Exception as e:
         conn.rollback()
@@ -798,30 +1312,29 @@ def api_accept_order(order_id):
     try:
         cur = conn.cursor(dictionary=True)
 
-        # Get order
-        cur.execute("SELECT status, warehouse_id FROM `order` WHERE order_id = %s", (order_id,))
+        # Get order (locked: the reservation sweeper may be releasing its hold)
+        cur.execute("SELECT status, warehouse_id FROM `order` WHERE order_id = %s FOR UPDATE",
+                    (order_id,))
         order = cur.fetchone()
 
         if not order:
             return jsonify({"error": "Order not found"}), 404
         if order['status'] != 'Pending':
             return jsonify({"error": "Order is not pending"}), 400
+        # An expired hold was released: take the stock again, unless others hold it now
+        if not reservations.hold_order(cur, order_id):
+            conn.rollback()
+            return jsonify({"error": "Not enough stock"}), 400
 
         warehouse_id = order['warehouse_id']
 
         # Get order items
-        cur.execute("""
-            SELECT variant_id, quantity FROM order_detail WHERE order_id = %s
-        """, (order_id,))
-        items = cur.fetchall()
+        items = statements.fetch_all(conn, "order_items", (order_id,))
 
         # Check and deduct stock
         for item in items:
-            cur.execute("""
-                SELECT quantity FROM stock 
-                WHERE warehouse_id = %s AND variant_id = %s
-            """, (warehouse_id, item['variant_id']))
-            stock = cur.fetchone()
+            stock = statements.fetch_one(conn, "warehouse_stock",
+                                         (warehouse_id, item['variant_id']))
 
             if not stock or stock['quantity'] < item['quantity']:
                 conn.rollback()
@@ -835,11 +1348,9 @@ def api_accept_order(order_id):
             """, (item['quantity'], warehouse_id, item['variant_id']))
 
             # Record inventory movement
-            cur.execute("""
-                INSERT INTO inventory_movement 
-                (warehouse_id, variant_id, movement_type, qty_change, employee_id, ref_type, ref_id, note)
-                VALUES (%s, %s, 'SALE', %s, %s, 'order', %s, 'Order accepted and fulfilled')
-            """, (warehouse_id, item['variant_id'], -item['quantity'], employee_id, order_id))
+            inventory.record_movement(cur, warehouse_id, item['variant_id'], 'SALE',
+                                      -item['quantity'], employee_id, 'order', order_id,
+                                      'Order accepted and fulfilled')
 
         # Update order
         cur.execute("""
@@ -847,9 +1358,25 @@ def api_accept_order(order_id):
             SET status = 'Accepted', employee_id = %s
             WHERE order_id = %s
         """, (employee_id, order_id))
+        rollups.order_status_changed(cur, order_id, 'Pending', 'Accepted')
+        reservations.release(cur, order_id)
 
         conn.commit()
+        catalog.bump(variants=[item['variant_id'] for item in items])
         cur.close()
+        try:
+            recommendations.record_order(conn, order_id)
+        except Exception as e:
+            print(f"Could not update recommendations for order {order_id}: {e}")
+
+        first, _, last = session.get('user_name', '').partition(' ')
+        events.publish("order-accepted", {
+            "order_id": order_id,
+            "status": "Accepted",
+            "employee_id": employee_id,
+            "employee_first": first,
+            "employee_last": last,
+        })
         return jsonify({"success": True})
     except Exception as e:
         conn.rollback()
@@ -875,11 +1402,27 @@ def api_update_order_status(order_id):
     conn = get_conn()
     try:
         cur = conn.cursor()
+        cur.execute("SELECT status FROM `order` WHERE order_id = %s FOR UPDATE", (order_id,))
+        row = cur.fetchone()
+        if not row:
+            return jsonify({"error": "Order not found"}), 404
+        if new_status == 'Pending' and row[0] != 'Pending':
+            held = reservations.reserve_order(cur, order_id)
+            if held is None:
+                conn.rollback()
+                return jsonify({"error": "Not enough stock to reopen the order"}), 400
+        else:
+            held = reservations.release(cur, order_id) if new_status != 'Pending' else {}
         cur.execute("""
             UPDATE `order` SET status = %s WHERE order_id = %s
         """, (new_status, order_id))
+        rollups.order_status_changed(cur, order_id, row[0], new_status)
         conn.commit()
+        if held:
+            catalog.bump(holds=held)
         cur.close()
+
+        events.publish("status-changed", {"order_id": order_id, "status": new_status})
         return jsonify({"success": True})
     except Exception as e:
         conn.rollback()
@@ -888,6 +1431,17 @@ def api_update_order_status(order_id):
         conn.close()
 
 
+@app.route("/api/orders/stream", methods=["GET"])
+def api_order_stream():
+    """Server-Sent Events stream of order-created / order-accepted / status-changed"""
+    if 'user_id' not in session or session.get('user_type') != 'employee':
+        return jsonify({"error": "Not authorized"}), 401
+
+    q = events.subscribe()
+    return Response(stream_with_context(events.stream(q)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.route("/api/employees", methods=["GET"])
 def api_get_employees():
     """Get all employees (admin only)"""
@@ -997,31 +1551,33 @@ def api_update_employee(employee_id):
 
 
 @app.route("/api/stock", methods=["GET"])
+@singleflight.coalesce(_read_key)
 def api_get_stock():
-    """Get all product variants with stock"""
+    """
+    Get all product variants with stock (?fields= selects a subset of columns).
+    ?since=<version> returns only the variants changed after that version,
+    in the same {"version", "full", "upserts", "deletes"} shape as /api/products.
+    """
     if 'user_id' not in session or session.get('user_type') != 'employee':
         return jsonify({"error": "Employee only"}), 401
 
-    conn = get_conn()
+    try:
+        fields = _fields_param(request.args, STOCK_COLUMNS, "variant_id") or list(STOCK_COLUMNS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    since = request.args.get("since", type=int)
+
+    # Deltas read the primary (see api_products)
+    conn = get_conn() if since is not None else _read_conn()
     try:
         cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT v.variant_id, v.product_id, v.size, v.color,
-                   p.product_name, p.category, p.price,
-                   COALESCE(SUM(s.quantity), 0) as stock_quantity
-            FROM product_variant v
-            JOIN product p ON p.product_id = v.product_id
-            LEFT JOIN stock s ON s.variant_id = v.variant_id
-            GROUP BY v.variant_id, v.product_id, v.size, v.color,
-                     p.product_name, p.category, p.price
-            ORDER BY v.product_id, v.variant_id
-        """)
-        stock = cur.fetchall()
-        for item in stock:
-            item['price'] = float(item['price'])
-            item['stock_quantity'] = int(item['stock_quantity'])
+        if since is not None:
+            result = _catalog_delta(cur, since, "variant",
+                                    lambda ids: _fetch_stock(cur, fields, ids))
+        else:
+            result = _fetch_stock(cur, fields)
         cur.close()
-        return jsonify(stock)
+        return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     finally:
@@ -1035,12 +1591,22 @@ def api_update_stock(variant_id):
         return jsonify({"error": "Admin only"}), 401
 
     data = request.get_json(silent=True) or {}
-    quantity = data.get("quantity")
+    try:
+        quantity = int(data.get("quantity"))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid quantity"}), 400
+    if quantity < 0:
+        return jsonify({"error": "Quantity must be >= 0"}), 400
 
     conn = get_conn()
     try:
         cur = conn.cursor()
 
+        # Lock the current row so the logged delta matches what we overwrite
+        row = statements.fetch_one(conn, "warehouse_stock_for_update",
+                                   (DEFAULT_WAREHOUSE_ID, variant_id))
+        previous = int(row['quantity']) if row else 0
+
         # Update or insert stock
         cur.execute("""
             INSERT INTO stock (warehouse_id, variant_id, quantity)
@@ -1048,14 +1614,13 @@ def api_update_stock(variant_id):
             ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)
         """, (DEFAULT_WAREHOUSE_ID, variant_id, quantity))
 
-        # Log inventory movement
-        cur.execute("""
-            INSERT INTO inventory_movement
-            (warehouse_id, variant_id, movement_type, qty_change, employee_id)
-            VALUES (%s, %s, 'ADJUSTMENT', %s, %s)
-        """, (DEFAULT_WAREHOUSE_ID, variant_id, quantity, session.get('user_id')))
+        # Log the change as a delta, not the new absolute quantity
+        if quantity != previous:
+            inventory.record_movement(cur, DEFAULT_WAREHOUSE_ID, variant_id, 'ADJUSTMENT',
+                                      quantity - previous, session.get('user_id'))
 
         conn.commit()
+        catalog.bump(variants=[variant_id])
         cur.close()
         return jsonify({"success": True})
     except Exception as e:
@@ -1065,6 +1630,37 @@ def api_update_stock(variant_id):
         conn.close()
 
 
+@app.route("/api/stock/as-of", methods=["GET"])
+def api_stock_as_of():
+    """Stock per variant at a point in time, from the inventory ledger (admin only)"""
+    if 'user_id' not in session or session.get('user_role') != 'ADMIN':
+        return jsonify({"error": "Admin only"}), 401
+
+    if not request.args.get('date'):
+        return jsonify({"error": "date is required"}), 400
+    try:
+        when = datetime.fromisoformat(request.args['date'])
+    except ValueError:
+        return jsonify({"error": "date must be an ISO date or datetime"}), 400
+    variant_id = request.args.get('variant_id', type=int)
+
+    conn = get_conn()
+    try:
+        quantities = inventory.stock_as_of(conn, when, variant_id)
+        if quantities is None:
+            return jsonify({"error": "No inventory snapshot at or before that date"}), 404
+        return jsonify([
+            {"warehouse_id": w, "variant_id": v, "quantity": q}
+            for (w, v), q in sorted(quantities.items())
+        ])
+    except Exception as e:
+        print(f"Stock as-of error: {e}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+
 # ============= CUSTOMER PROFILE =============
 
 @app.route("/api/customer/profile", methods=["GET"])
@@ -1421,36 +2017,51 @@ def api_get_purchases():
 
 @app.route("/api/purchases", methods=["POST"])
 def api_create_purchase():
-    """Create a purchase and add its quantity to stock (admin only)."""
+    """Create a purchase order with one or more lines and add them to stock (admin only).
+
+    Body: {"supplier_id": 1, "lines": [{"variant_id": 5, "quantity": 10, "unit_cost": 42.5}, ...]}
+    The single-line form {"supplier_id", "variant_id", "quantity", "unit_cost"} is still accepted.
+    """
     if 'user_id' not in session or session.get('user_role') != 'ADMIN':
         return jsonify({"error": "Admin only"}), 401
 
     data = request.get_json() or {}
 
     supplier_id = data.get('supplier_id')
-    variant_id = data.get('variant_id')
-    quantity = data.get('quantity')
-    unit_cost = data.get('unit_cost')
+    raw_lines = data.get('lines')
+    if raw_lines is None:
+        raw_lines = [{k: data.get(k) for k in ('variant_id', 'quantity', 'unit_cost')}]
 
     # Validation
     if not supplier_id:
         return jsonify({"error": "Supplier is required"}), 400
-    if not variant_id or not quantity or unit_cost is None:
-        return jsonify({"error": "Missing required fields (variant_id, quantity, unit_cost)"}), 400
+    if not isinstance(raw_lines, list) or not raw_lines:
+        return jsonify({"error": "At least one line is required"}), 400
 
+    lines = []
     try:
         supplier_id = int(supplier_id)
-        variant_id = int(variant_id)
-        quantity = int(quantity)
-        if quantity <= 0:
-            return jsonify({"error": "Quantity must be positive"}), 400
-        unit_cost = Decimal(str(unit_cost))
-        if unit_cost < 0:
-            return jsonify({"error": "Unit cost must be >= 0"}), 400
-    except (ValueError, TypeError):
+        for idx, line in enumerate(raw_lines, start=1):
+            variant_id = line.get('variant_id')
+            quantity = line.get('quantity')
+            unit_cost = line.get('unit_cost')
+            if not variant_id or not quantity or unit_cost is None:
+                return jsonify({"error": f"Line {idx}: missing required fields (variant_id, quantity, unit_cost)"}), 400
+            quantity = int(quantity)
+            if quantity <= 0:
+                return jsonify({"error": f"Line {idx}: quantity must be positive"}), 400
+            unit_cost = Decimal(str(unit_cost))
+            if unit_cost < 0:
+                return jsonify({"error": f"Line {idx}: unit cost must be >= 0"}), 400
+            lines.append((int(variant_id), quantity, unit_cost))
+    except (ValueError, TypeError, AttributeError, ArithmeticError):
         return jsonify({"error": "Invalid numeric values"}), 400
 
-    total_cost = unit_cost * Decimal(quantity)
+    total_cost = sum((unit_cost * Decimal(quantity) for _, quantity, unit_cost in lines), Decimal(0))
+
+    received = {}
+    for variant_id, quantity, _ in lines:
+        received[variant_id] = received.get(variant_id, 0) + quantity
 
     conn = get_conn()
     try:
@@ -1461,6 +2072,13 @@ def api_create_purchase():
         if not cur.fetchone():
             return jsonify({"error": "Supplier not found"}), 404
 
+        # Verify all variants exist in one query
+        cur.execute(f"SELECT variant_id FROM product_variant WHERE variant_id IN ({in_clause(received)})",
+                    list(received))
+        unknown = set(received) - {row['variant_id'] for row in cur.fetchall()}
+        if unknown:
+            return jsonify({"error": f"Unknown variant(s): {sorted(unknown)}"}), 404
+
         # Create purchase order
         cur.execute("""
             INSERT INTO purchase_order (supplier_id, order_date, total_cost, employee_id)
@@ -1468,29 +2086,32 @@ def api_create_purchase():
         """, (supplier_id, total_cost, session.get('user_id')))
         purchase_order_id = cur.lastrowid
 
-        # Create purchase order detail
-        cur.execute("""
+        # Create purchase order details (multi-row insert)
+        cur.executemany("""
             INSERT INTO purchase_order_detail (purchase_order_id, variant_id, quantity, price)
             VALUES (%s, %s, %s, %s)
-        """, (purchase_order_id, variant_id, quantity, unit_cost))
+        """, [(purchase_order_id, variant_id, quantity, unit_cost)
+              for variant_id, quantity, unit_cost in lines])
 
-        # Add to stock (increment)
-        cur.execute("""
+        # Add to stock (increment, one upsert for the whole delivery)
+        cur.executemany("""
             INSERT INTO stock (warehouse_id, variant_id, quantity)
             VALUES (%s, %s, %s)
             ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
-        """, (DEFAULT_WAREHOUSE_ID, variant_id, quantity))
+        """, [(DEFAULT_WAREHOUSE_ID, variant_id, qty) for variant_id, qty in received.items()])
 
-        # Log inventory movement
-        cur.execute("""
-            INSERT INTO inventory_movement 
-            (warehouse_id, variant_id, movement_type, qty_change, employee_id, ref_type, ref_id)
-            VALUES (%s, %s, 'RECEIPT', %s, %s, 'PURCHASE', %s)
-        """, (DEFAULT_WAREHOUSE_ID, variant_id, quantity, session.get('user_id'), purchase_order_id))
+        # Log inventory movements
+        inventory.record_movements(cur, [
+            (DEFAULT_WAREHOUSE_ID, variant_id, 'RECEIPT', qty, session.get('user_id'),
+             'PURCHASE', purchase_order_id, None)
+            for variant_id, qty in received.items()
+        ])
+        rollups.purchase_recorded(cur, purchase_order_id)
 
         conn.commit()
+        catalog.bump(variants=received)
         cur.close()
-        return jsonify({"success": True, "purchase_id": purchase_order_id})
+        return jsonify({"success": True, "purchase_id": purchase_order_id, "lines": len(lines)})
     except Exception as e:
         conn.rollback()
         print(f"Create purchase error: {e}")
@@ -1500,98 +2121,242 @@ def api_create_purchase():
         conn.close()
 
 
+def _fetch_admin_stats(cur):
+    # Total sales from ACCEPTED orders only
+    cur.execute("""
+        SELECT COALESCE(SUM(total_amount), 0) as total_sales 
+        FROM `order` 
+        WHERE status = 'Accepted'
+    """)
+    total_sales = float(cur.fetchone()['total_sales'])
+
+    # Total purchases from purchase orders
+    cur.execute("SELECT COALESCE(SUM(total_cost), 0) as total_purchases FROM purchase_order")
+    total_purchases = float(cur.fetchone()['total_purchases'])
+
+    # Net earnings (only from accepted orders)
+    net_earnings = total_sales - total_purchases
+
+    # Orders by status (total is their sum)
+    cur.execute("""
+        SELECT status, COUNT(*) as count
+        FROM `order`
+        GROUP BY status
+    """)
+    status_counts = {row['status']: row['count'] for row in cur.fetchall()}
+    total_orders = sum(status_counts.values())
+
+    # Total products
+    cur.execute("SELECT COUNT(*) as total_products FROM product")
+    total_products = cur.fetchone()['total_products']
+
+    return {
+        "total_sales": total_sales,
+        "total_purchases": total_purchases,
+        "net_earnings": net_earnings,
+        "total_orders": total_orders,
+        "pending_orders": status_counts.get('Pending', 0),
+        "accepted_orders": status_counts.get('Accepted', 0),
+        "cancelled_orders": status_counts.get('Cancelled', 0),
+        "total_products": total_products
+    }
+
+
+def _fetch_top_products(cur, limit):
+    cur.execute("""
+        SELECT p.product_id, p.product_name, p.category, p.price,
+               SUM(od.quantity) as total_sold,
+               SUM(od.quantity * od.price) as total_revenue
+        FROM order_detail od
+        JOIN product_variant v ON v.variant_id = od.variant_id
+        JOIN product p ON p.product_id = v.product_id
+        JOIN `order` o ON o.order_id = od.order_id
+        WHERE o.status IN ('Accepted', 'Shipped')
+        GROUP BY p.product_id, p.product_name, p.category, p.price
+        ORDER BY total_sold DESC
+        LIMIT %s
+    """, (limit,))
+
+    products = cur.fetchall()
+    for p in products:
+        p['price'] = float(p['price'])
+        p['total_sold'] = int(p['total_sold'])
+        p['total_revenue'] = float(p['total_revenue'])
+    return products
+
+
 @app.route("/api/admin/stats", methods=["GET"])
+@singleflight.coalesce(_read_key)
 def api_admin_stats():
     """Get admin dashboard statistics"""
     if 'user_id' not in session or session.get('user_role') != 'ADMIN':
         return jsonify({"error": "Admin only"}), 401
 
-    conn = get_conn()
+    conn = _read_conn()
     try:
         cur = conn.cursor(dictionary=True)
+        stats = _fetch_admin_stats(cur)
+        cur.close()
+        return jsonify(stats)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
 
-        # Total sales from ACCEPTED orders only
-        cur.execute("""
-            SELECT COALESCE(SUM(total_amount), 0) as total_sales 
-            FROM `order` 
-            WHERE status = 'Accepted'
-        """)
-        total_sales = float(cur.fetchone()['total_sales'])
 
-        # Total purchases from purchase orders
-        cur.execute("SELECT COALESCE(SUM(total_cost), 0) as total_purchases FROM purchase_order")
-        total_purchases = float(cur.fetchone()['total_purchases'])
+@app.route("/api/admin/top-products", methods=["GET"])
+@singleflight.coalesce(_read_key)
+def api_top_products():
+    """Get most sold products"""
+    if 'user_id' not in session or session.get('user_role') != 'ADMIN':
+        return jsonify({"error": "Admin only"}), 401
 
-        # Net earnings (only from accepted orders)
-        net_earnings = total_sales - total_purchases
+    limit = request.args.get('limit', 10, type=int)
 
-        # Total orders
-        cur.execute("SELECT COUNT(*) as total_orders FROM `order`")
-        total_orders = cur.fetchone()['total_orders']
+    conn = _read_conn()
+    try:
+        cur = conn.cursor(dictionary=True)
+        products = _fetch_top_products(cur, limit)
+        cur.close()
+        return jsonify(products)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
 
-        # Orders by status
-        cur.execute("""
-            SELECT status, COUNT(*) as count
-            FROM `order`
-            GROUP BY status
-        """)
-        status_counts = {row['status']: row['count'] for row in cur.fetchall()}
 
-        # Total products
-        cur.execute("SELECT COUNT(*) as total_products FROM product")
-        total_products = cur.fetchone()['total_products']
+def _sales_window(args, grain):
+    """
+    (start, end) from ?from=&to= (dates or ISO datetimes, server local time; a
+    date `to` is inclusive). Defaults: the last 30 days, or 24 hours for hourly.
+    """
+    def parse(value):
+        moment = datetime.fromisoformat(value)
+        return moment + timedelta(days=1) if len(value) == 10 else moment
+
+    now = datetime.now()
+    if args.get('to'):
+        end = parse(args['to'])
+    elif grain == 'hour':
+        end = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    else:
+        end = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    if args.get('from'):
+        start = datetime.fromisoformat(args['from'])
+    else:
+        start = end - (timedelta(days=30) if grain == 'day' else timedelta(days=1))
+    return start, end
+
+
+@app.route("/api/admin/sales", methods=["GET"])
+@singleflight.coalesce(_read_key)
+def api_admin_sales():
+    """
+    Revenue, units, purchase cost and margin per hour / day, in total or per
+    category / product, plus order counts by status. Read from the rollup
+    tables only. ?from=&to=&granularity=day|hour&group=total|category|product
+    """
+    if 'user_id' not in session or session.get('user_role') != 'ADMIN':
+        return jsonify({"error": "Admin only"}), 401
 
+    grain = request.args.get('granularity', 'day')
+    group = request.args.get('group', 'total')
+    if grain not in rollups.GRAINS:
+        return jsonify({"error": "granularity must be hour or day"}), 400
+    if group not in rollups.GROUPS:
+        return jsonify({"error": "group must be total, category or product"}), 400
+    try:
+        start, end = _sales_window(request.args, grain)
+    except ValueError:
+        return jsonify({"error": "from / to must be YYYY-MM-DD or ISO datetimes"}), 400
+    if start >= end:
+        return jsonify({"error": "from must be before to"}), 400
+    step = timedelta(hours=1) if grain == 'hour' else timedelta(days=1)
+    if (end - start) / step > rollups.MAX_BUCKETS:
+        return jsonify({"error": f"Window too large: at most {rollups.MAX_BUCKETS} {grain}s"}), 400
+
+    conn = _read_conn()
+    try:
+        cur = conn.cursor(dictionary=True)
+        result = rollups.query(cur, start, end, grain, group)
         cur.close()
-        return jsonify({
-            "total_sales": total_sales,
-            "total_purchases": total_purchases,
-            "net_earnings": net_earnings,
-            "total_orders": total_orders,
-            "pending_orders": status_counts.get('Pending', 0),
-            "accepted_orders": status_counts.get('Accepted', 0),
-            "cancelled_orders": status_counts.get('Cancelled', 0),
-            "total_products": total_products
-        })
+        result.update({"from": start.isoformat(), "to": end.isoformat(),
+                       "granularity": grain, "group": group})
+        return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
 
 
-@app.route("/api/admin/top-products", methods=["GET"])
-def api_top_products():
-    """Get most sold products"""
+@app.route("/api/admin/metrics", methods=["GET"])
+def api_admin_metrics():
+    """Server-side counters (request coalescing, replicas, prepared statements, recommendations)"""
     if 'user_id' not in session or session.get('user_role') != 'ADMIN':
         return jsonify({"error": "Admin only"}), 401
+    return jsonify({"singleflight": singleflight.stats(), "replicas": replica_status(),
+                    "statements": statements.stats(), "recommendations": recommendations.stats()})
 
-    limit = request.args.get('limit', 10, type=int)
+
+# ============= PAGE BOOTSTRAP =============
+
+BOOTSTRAP_PAGES = ("storefront", "product", "customer", "employee", "admin")
+
+
+@app.route("/api/bootstrap/<page>", methods=["GET"])
+def api_bootstrap(page):
+    """Session, layout data and a page's initial datasets in one response.
+
+    Pages: storefront, product (?id=), customer, employee, admin. If the session
+    can't see the page, only {"session": ...} is returned so the client can redirect.
+    """
+    if page not in BOOTSTRAP_PAGES:
+        return jsonify({"error": "Unknown page"}), 404
+
+    user = _session_user()
+    data = {"page": page, "session": user}
+
+    is_customer = user is not None and user['type'] == 'customer'
+    is_employee = user is not None and user['type'] == 'employee'
+    is_admin = is_employee and user['role'] == 'ADMIN'
+    if (page == "customer" and not is_customer) or (page == "employee" and not is_employee) \
+            or (page == "admin" and not is_admin):
+        return jsonify(data)
+
+    product_id = request.args.get('id', type=int)
+    if page == "product" and not product_id:
+        return jsonify({"error": "id is required"}), 400
 
     conn = get_conn()
     try:
         cur = conn.cursor(dictionary=True)
 
-        cur.execute("""
-            SELECT p.product_id, p.product_name, p.category, p.price,
-                   SUM(od.quantity) as total_sold,
-                   SUM(od.quantity * od.price) as total_revenue
-            FROM order_detail od
-            JOIN product_variant v ON v.variant_id = od.variant_id
-            JOIN product p ON p.product_id = v.product_id
-            JOIN `order` o ON o.order_id = od.order_id
-            WHERE o.status IN ('Accepted', 'Shipped')
-            GROUP BY p.product_id, p.product_name, p.category, p.price
-            ORDER BY total_sold DESC
-            LIMIT %s
-        """, (limit,))
-
-        products = cur.fetchall()
-        for p in products:
-            p['price'] = float(p['price'])
-            p['total_revenue'] = float(p['total_revenue'])
+        if page == "storefront":
+            snapshot = _catalog_snapshot()
+            data['products'] = snapshot.to_dicts()
+            data['categories'] = snapshot.categories()
+        elif page == "product":
+            data['product'] = _fetch_product(product_id)
+            if data['product'] is None:
+                cur.close()
+                return jsonify({"error": "Product not found", "session": user}), 404
+        elif page == "customer":
+            data['cart'] = _fetch_cart(conn, cur, user['id'])
+            data['orders'] = _fetch_orders(cur, MultiDict())
+        elif page == "employee":
+            data['pending'] = _fetch_orders(cur, MultiDict({"status": "Pending", "limit": 25}))
+            data['mine'] = _fetch_orders(cur, MultiDict({"mine": 1, "limit": 25}))
+            data['counts'] = _fetch_order_counts(cur)
+        elif page == "admin":
+            data['stats'] = _fetch_admin_stats(cur)
+            data['top_products'] = _fetch_top_products(cur, 10)
+            data['recent_orders'] = _fetch_orders(cur, MultiDict({"limit": 5}))
 
         cur.close()
-        return jsonify(products)
+        return jsonify(data)
     except Exception as e:
+        print(f"Bootstrap error ({page}): {e}")
+        traceback.print_exc()
         return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
@@ -1620,7 +2385,10 @@ def api_create_product():
         ))
         conn.commit()
         product_id = cur.lastrowid
+        catalog.bump(products=[product_id])
         cur.close()
+        similar_products.upsert(product_id, data.get("product_name"),
+                                data.get("description", ""), data.get("category"))
         return jsonify({"success": True, "product_id": product_id})
     except Exception as e:
         conn.rollback()
@@ -1654,7 +2422,10 @@ def api_update_product(product_id):
             product_id
         ))
         conn.commit()
+        catalog.bump(products=[product_id])
         cur.close()
+        similar_products.upsert(product_id, data.get("product_name"),
+                                data.get("description"), data.get("category"))
         return jsonify({"success": True})
     except Exception as e:
         conn.rollback()
@@ -1672,9 +2443,13 @@ def api_delete_product(product_id):
     conn = get_conn()
     try:
         cur = conn.cursor()
+        cur.execute("SELECT variant_id FROM product_variant WHERE product_id = %s", (product_id,))
+        variant_ids = [row[0] for row in cur.fetchall()]
         cur.execute("DELETE FROM product WHERE product_id = %s", (product_id,))
         conn.commit()
+        catalog.bump(deleted_products=[product_id], deleted_variants=variant_ids)
         cur.close()
+        similar_products.remove(product_id)
         return jsonify({"success": True})
     except Exception as e:
         conn.rollback()
@@ -1683,9 +2458,109 @@ def api_delete_product(product_id):
         conn.close()
 
 
+# ============= BATCH =============
+
+BATCH_MAX_ITEMS = 20
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_EXCLUDED = ("/api/batch", "/api/orders/stream")
+
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="api-batch")
+
+
+def _run_sub_request(item, cookie):
+    """Dispatch one batched GET through the normal routing (auth checks, ETag hook included)"""
+    if isinstance(item, str):
+        item = {"path": item}
+    if not isinstance(item, dict):
+        return {"status": 400, "body": {"error": "Invalid request item"}}
+    path = str(item.get("path") or "")
+    method = str(item.get("method") or "GET").upper()
+
+    if not path.startswith("/api/") or path.split("?")[0] in BATCH_EXCLUDED:
+        return {"status": 400, "body": {"error": "Path cannot be batched"}}
+    if method != "GET":
+        return {"status": 405, "body": {"error": "Only GET requests can be batched"}}
+
+    headers = {}
+    if cookie:
+        headers["Cookie"] = cookie
+    if item.get("etag"):
+        headers["If-None-Match"] = item["etag"]
+
+    with app.test_request_context(path, method="GET", headers=headers):
+        resp = app.full_dispatch_request()
+        body = resp.get_json(silent=True)
+        if body is None and resp.status_code >= 400:
+            body = {"error": resp.status}
+        return {"status": resp.status_code, "etag": resp.headers.get("ETag"), "body": body}
+
+
+@app.route("/api/batch", methods=["POST"])
+def api_batch():
+    """
+    Run several read-only API calls in one request.
+    Body: {"requests": [{"path": "/api/stock"}, {"path": "/api/orders?limit=5", "etag": "..."}]}
+    Items run concurrently; each gets its own status/etag/body in "responses", in order.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("requests")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "requests must be a non-empty list"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} requests per batch"}), 400
+
+    cookie = request.headers.get("Cookie")
+    responses = list(_batch_executor.map(lambda item: _run_sub_request(item, cookie), items))
+    return jsonify({"responses": responses})
+
+
+# ============= BULK IMPORT (ADMIN) =============
+
+@app.route("/api/admin/import", methods=["POST"])
+def api_bulk_import():
+    """Bulk import products, variants and stock from CSV or NDJSON (admin only)"""
+    if 'user_id' not in session or session.get('user_role') != 'ADMIN':
+        return jsonify({"error": "Admin only"}), 401
+
+    upload = request.files.get('file')
+    if upload:
+        stream = catalog_import.open_text(upload.stream)
+        fmt = request.form.get('format') or catalog_import.detect_format(upload.filename, upload.mimetype)
+    else:
+        stream = catalog_import.open_text(request.stream)
+        fmt = request.args.get('format') or catalog_import.detect_format(None, request.content_type)
+
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    conn = get_conn()
+    try:
+        report = catalog_import.import_rows(
+            conn, catalog_import.read_rows(stream, fmt), session.get('user_id'))
+        report['success'] = report['error_count'] == 0
+        return jsonify(report)
+    except Exception as e:
+        conn.rollback()
+        print(f"Bulk import error: {e}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+
+# Pre-render the context-free pages so the first visitors get cached copies
+PAGE_TEMPLATES = [
+    "index.html", "login.html", "signup.html", "product.html", "main.html",
+    "customer.html", "payment-info.html", "employee.html", "order.html",
+    "admin.html", "admin-employees.html", "admin-products.html", "admin-stock.html",
+    "admin-purchases.html", "admin-orders.html", "admin-suppliers.html", "offline.html",
+]
+page_cache.warm(app, PAGE_TEMPLATES)
+
+
 @app.errorhandler(404)
 def not_found(e):
-    return render_template('main.html'), 404
+    return page_cache.page("main.html", 404)
 
 
 @app.errorhandler(500)
@@ -1704,4 +2579,4 @@ if __name__ == "__main__":
     print("  Employee: username: staff1     password: staff123")
     print("  Customer: email: demo@demo.com password: demo123")
     print("=" * 60)
-    app.run(host="127.0.0.1", port=5000, debug=True)
\ No newline at end of file
+    app.run(host="127.0.0.1", port=5000, debug=True, threaded=True)
\ No newline at end of file
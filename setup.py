@@ -24,6 +24,22 @@ DB_NAME=ashhab_sport
         print("✓ .env file already exists")
 
 
+def check_dependencies():
+    """Check that the packages from requirements.txt are installed"""
+    missing = []
+    for module, package in (("flask", "Flask"), ("jinja2", "Jinja2"),
+                            ("mysql.connector", "mysql-connector-python"), ("numpy", "numpy")):
+        try:
+            __import__(module)
+            print(f"✓ {package} installed")
+        except ImportError:
+            print(f"✗ {package} missing")
+            missing.append(package)
+    if missing:
+        print("  Install with: pip install -r requirements.txt")
+    return not missing
+
+
 def check_directories():
     """Check if required directories exist"""
     required_dirs = [
@@ -109,6 +125,7 @@ def test_database_connection():
         conn.close()
         print(f"✓ Database connection successful!")
         print(f"✓ Found {count} products in database")
+        apply_migrations()
         return True
     except Exception as e:
         print(f"✗ Database connection failed: {e}")
@@ -119,6 +136,19 @@ def test_database_connection():
         return False
 
 
+def apply_migrations():
+    """Bring the schema up to date (ledger tables, triggers, indexes)"""
+    from db import get_conn
+    import migrations
+
+    conn = get_conn()
+    try:
+        applied = migrations.migrate(conn)
+        print(f"✓ Applied schema migrations {applied}" if applied else "✓ Schema is up to date")
+    finally:
+        conn.close()
+
+
 def create_placeholder_image():
     """Create a simple placeholder image"""
     try:
@@ -146,6 +176,8 @@ def main():
 
     create_env_file()
     print()
+    check_dependencies()
+    print()
     check_directories()
     check_files()
     create_placeholder_image()
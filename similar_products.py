@@ -0,0 +1,320 @@
+"""
+Content-based "similar products" from TF-IDF vectors.
+
+Each product is a document made of its name (counted twice), description
+and category. Terms are weighted by sublinear TF x smoothed IDF, rows are
+L2-normalized, and cosine similarity is a matrix product computed in NumPy
+blocks; the TOP_K nearest neighbours of every product are kept in memory, so
+lookups are a dict access. Terms used by a single product still count in
+its norm but get no column - they can't make two products similar.
+
+Creating or updating a product re-vectorizes just that product against the
+current vocabulary and patches its neighbours and theirs. The request that
+saved it only queues the change (upsert() / remove()); a background thread
+applies it, so the matrix work never runs on a request. Other workers pick
+the change up from the catalog change log every SYNC_SECONDS (sync()), and
+fall back to a full rebuild when the log no longer reaches back far enough or
+too many products changed. Every list the product was in is recomputed, so
+lists refill to TOP_K when it drops out. New words only take part after the
+next full rebuild (at start and every REBUILD_SECONDS). NumPy is a declared
+dependency; without it nothing is built, start() prints a warning, and
+callers fall back to products from the same category.
+"""
+import math
+import os
+import queue
+import re
+import threading
+import time
+
+import catalog
+from db import in_clause
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOP_K = 8
+MIN_SCORE = 0.05
+BLOCK_ROWS = 512
+REBUILD_SECONDS = int(os.getenv("SIMILAR_REBUILD_SECONDS", str(6 * 3600)))
+SYNC_SECONDS = int(os.getenv("SIMILAR_SYNC_SECONDS", "30"))
+MAX_SYNC_PRODUCTS = 500   # more changes than this: rebuild instead
+
+STOPWORDS = frozenset("""
+    a an and are as at be by for from in is it its of on or the this to with your you
+""".split())
+TOKEN = re.compile(r"[a-z0-9]+")
+
+_lock = threading.Lock()
+_vocab = {}       # term -> column
+_idf = None       # idf per column
+_idf_default = 0.0
+_matrix = None    # normalized rows, float32
+_rows = {}        # product_id -> row
+_top = {}         # product_id -> [(other product_id, score)], best first
+_pending = None   # upserts made while a rebuild is running
+_synced = None    # catalog version the vectors reflect
+_started = False
+_updates = queue.Queue()   # (function, args) queued by requests for the updater thread
+
+
+def _words(text):
+    return [t for t in TOKEN.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def _terms(name, description, category):
+    return _words(name) * 2 + _words(description) + _words(category) + \
+        [f"category:{(category or '').lower()}"]
+
+
+def _weights(terms):
+    counts = {}
+    for t in terms:
+        counts[t] = counts.get(t, 0) + 1
+    return {t: 1.0 + math.log(c) for t, c in counts.items()}
+
+
+# ============= BATCH BUILD =============
+
+def _neighbours(matrix, ids, rows=None):
+    """{product_id: [(other, score)]} for the given rows (default: all) against every row"""
+    rows = range(len(ids)) if rows is None else rows
+    rows = np.asarray(list(rows), dtype=np.int64)
+    top = {}
+    k = min(TOP_K, len(ids) - 1)
+    if k <= 0:
+        return {ids[r]: [] for r in rows.tolist()}
+    for start in range(0, len(rows), BLOCK_ROWS):
+        block = rows[start:start + BLOCK_ROWS]
+        scores = matrix[block] @ matrix.T
+        scores[np.arange(len(block)), block] = -1.0
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for i, r in enumerate(block.tolist()):
+            picked = sorted(((float(scores[i, j]), ids[j]) for j in best[i].tolist()
+                             if ids[j] is not None and scores[i, j] >= MIN_SCORE), reverse=True)
+            top[ids[r]] = [(pid, score) for score, pid in picked]
+    return top
+
+
+def build(conn):
+    """Vectorize every product and precompute its neighbours"""
+    global _vocab, _idf, _idf_default, _matrix, _rows, _top, _pending, _synced
+    if np is None:
+        return False
+
+    with _lock:
+        _pending = []
+    # Read before the products, so changes made during the build are synced again
+    synced = catalog.version()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT product_id, product_name, description, category FROM product")
+        products = cur.fetchall()
+        cur.close()
+
+        docs = [_weights(_terms(*p[1:])) for p in products]
+        df = {}
+        for doc in docs:
+            for t in doc:
+                df[t] = df.get(t, 0) + 1
+        n = len(docs)
+        idf = {t: math.log((1 + n) / (1 + d)) + 1.0 for t, d in df.items()}
+        vocab = {t: i for i, t in enumerate(sorted(t for t, d in df.items() if d > 1))}
+
+        matrix = np.zeros((n, len(vocab)), dtype=np.float32)
+        for r, doc in enumerate(docs):
+            norm = math.sqrt(sum((w * idf[t]) ** 2 for t, w in doc.items())) or 1.0
+            for t, w in doc.items():
+                col = vocab.get(t)
+                if col is not None:
+                    matrix[r, col] = w * idf[t] / norm
+
+        ids = [p[0] for p in products]
+        top = _neighbours(matrix, ids)
+
+        with _lock:
+            _vocab, _matrix, _top = vocab, matrix, top
+            _idf = np.array([idf[t] for t in vocab], dtype=np.float32)
+            _idf_default = math.log((1 + n) / 2) + 1.0
+            _rows = {pid: r for r, pid in enumerate(ids)}
+            replay, _pending = _pending, None
+            _synced = synced
+        for args in replay:
+            _upsert(*args)
+        return True
+    finally:
+        with _lock:
+            _pending = None
+
+
+# ============= INCREMENTAL UPDATES =============
+
+def _vector(name, description, category):
+    doc = _weights(_terms(name, description, category))
+    vector = np.zeros(len(_vocab), dtype=np.float32)
+    norm = 0.0
+    for t, w in doc.items():
+        col = _vocab.get(t)
+        weight = w * (_idf[col] if col is not None else _idf_default)
+        norm += weight * weight
+        if col is not None:
+            vector[col] = weight
+    return vector / (math.sqrt(norm) or 1.0)
+
+
+def _ids():
+    ids = [None] * len(_matrix)
+    for pid, r in _rows.items():
+        ids[r] = pid
+    return ids
+
+
+def _holders(product_id):
+    """Rows of the products whose neighbour lists contain product_id"""
+    return [_rows[pid] for pid, neighbours in _top.items()
+            if pid in _rows and any(other == product_id for other, _ in neighbours)]
+
+
+def _upsert(product_id, name, description, category):
+    """Re-vectorize one created or updated product and patch the neighbour lists"""
+    global _matrix
+    with _lock:
+        if _pending is not None:
+            _pending.append((product_id, name, description, category))
+        if _matrix is None:
+            return
+
+        vector = _vector(name, description, category)
+        row = _rows.get(product_id)
+        if row is None:
+            row = _rows[product_id] = len(_matrix)
+            _matrix = np.vstack([_matrix, vector[None, :]])
+        else:
+            _matrix[row] = vector
+        ids = _ids()
+
+        # Lists it was in may lose it (and need the next best): recompute them.
+        # Elsewhere its score can only push in, replacing the weakest entry.
+        holders = _holders(product_id)
+        _top.update(_neighbours(_matrix, ids, [row] + holders))
+        skip = set(holders)
+        skip.add(row)
+        scores = _matrix @ vector
+        for r, score in enumerate(scores.tolist()):
+            other = ids[r]
+            if other is None or r in skip or score < MIN_SCORE:
+                continue
+            neighbours = _top.get(other, [])
+            if len(neighbours) < TOP_K or score > neighbours[-1][1]:
+                neighbours = sorted(neighbours + [(product_id, score)], key=lambda item: -item[1])
+                _top[other] = neighbours[:TOP_K]
+
+
+def _remove(product_id):
+    with _lock:
+        holders = _holders(product_id)
+        row = _rows.pop(product_id, None)
+        if row is None:
+            return
+        _matrix[row] = 0
+        _top.pop(product_id, None)
+        if holders:
+            _top.update(_neighbours(_matrix, _ids(), holders))
+
+
+def upsert(product_id, name, description, category):
+    """Queue a created or updated product for the updater thread"""
+    if _started:
+        _updates.put((_upsert, (product_id, name, description, category)))
+
+
+def remove(product_id):
+    """Queue a deleted product for the updater thread"""
+    if _started:
+        _updates.put((_remove, (product_id,)))
+
+
+def _updater():
+    while True:
+        apply, args = _updates.get()
+        try:
+            apply(*args)
+        except Exception as e:
+            print(f"Similar products update error: {e}")
+
+
+def sync(conn):
+    """Apply the product changes logged (by any worker) since the last build or sync"""
+    global _synced
+    if _matrix is None:
+        return
+    changes = catalog.changes_since(_synced)
+    if changes is None or len(changes["products"]) > MAX_SYNC_PRODUCTS:
+        build(conn)
+        return
+
+    ids = list(changes["products"])
+    if ids:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT product_id, product_name, description, category FROM product
+            WHERE product_id IN ({in_clause(ids)})
+        """, ids)
+        products = cur.fetchall()
+        cur.close()
+        for product in products:
+            _upsert(*product)
+        missing = set(ids) - {p[0] for p in products}
+    else:
+        missing = set()
+    for product_id in missing | changes["deleted_products"]:
+        _remove(product_id)
+    _synced = changes["version"]
+
+
+# ============= LOOKUPS =============
+
+def similar(product_id, limit=TOP_K):
+    """[(product_id, score)] most similar first; empty if unknown or not built"""
+    return _top.get(product_id, [])[:limit]
+
+
+def _rebuilder(get_conn):
+    built_at = None
+    while True:
+        conn = None
+        try:
+            conn = get_conn()
+            if built_at is None or time.time() - built_at >= REBUILD_SECONDS or _matrix is None:
+                build(conn)
+                built_at = time.time()
+            else:
+                sync(conn)
+        except Exception as e:
+            print(f"Similar products build error: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+        time.sleep(SYNC_SECONDS)
+
+
+def start(get_conn):
+    """
+    Build in the background now and every REBUILD_SECONDS, sync every
+    SYNC_SECONDS, and apply queued upserts / removes as they come
+    """
+    global _started
+    with _lock:
+        if _started:
+            return
+        if np is None:
+            print("WARNING: NumPy is not installed (see requirements.txt); "
+                  "similar products are disabled and same-category products are shown instead")
+            return
+        _started = True
+
+    threading.Thread(target=_rebuilder, args=(get_conn,),
+                     name="similar-products-builder", daemon=True).start()
+    threading.Thread(target=_updater, name="similar-products-updater", daemon=True).start()
@@ -0,0 +1,107 @@
+"""
+Single-flight coalescing for hot read endpoints.
+
+Concurrent requests with the same key (path + normalized query string + role
+by default) share one execution of the view: the first caller runs it, the
+others wait and receive a copy of its response. Nothing is cached after the
+flight lands, so this only removes duplicate work that overlaps in time.
+Set SINGLEFLIGHT=0 to turn it off.
+"""
+import functools
+import os
+import threading
+from urllib.parse import urlencode
+
+from flask import Response, current_app, request, session
+
+ENABLED = os.getenv("SINGLEFLIGHT", "1") != "0"
+WAIT_TIMEOUT_SECONDS = 30
+
+_lock = threading.Lock()
+_inflight = {}   # key -> _Flight
+_stats = {}      # path -> {"executed", "coalesced", "errors"}
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+def default_key():
+    """path + sorted query string + the caller's role"""
+    query = urlencode(sorted(request.args.items(multi=True)))
+    role = session.get('user_role') or session.get('user_type') or "anon"
+    return (request.path, query, role)
+
+
+def _count(path, field):
+    stats = _stats.setdefault(path, {"executed": 0, "coalesced": 0, "errors": 0})
+    stats[field] += 1
+
+
+def run(key, fn):
+    """Run fn once for all concurrent callers with the same key"""
+    path = key[0] if isinstance(key, tuple) else str(key)
+    with _lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+            _count(path, "executed")
+        else:
+            flight.waiters += 1
+            _count(path, "coalesced")
+
+    if not leader:
+        if not flight.done.wait(WAIT_TIMEOUT_SECONDS):
+            return fn()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = fn()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        with _lock:
+            _count(path, "errors")
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        flight.done.set()
+
+
+def coalesce(key_func=default_key):
+    """
+    View decorator. The view's response is frozen to (body, status, headers)
+    and every waiter gets its own Response built from that, so per-request
+    hooks (ETag, 304) still apply independently.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return view(*args, **kwargs)
+
+            def execute():
+                resp = current_app.make_response(view(*args, **kwargs))
+                return resp.get_data(), resp.status_code, list(resp.headers.items())
+
+            body, status, headers = run(key_func(), execute)
+            return Response(body, status=status, headers=headers)
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Per-path counters plus the number of flights currently in the air"""
+    with _lock:
+        return {"in_flight": len(_inflight),
+                "paths": {path: dict(counts) for path, counts in _stats.items()}}
@@ -0,0 +1,128 @@
+"""
+Registry of hot statements, run as server-side prepared statements.
+
+Each statement is declared once in STATEMENTS and executed by name. The first
+use on a connection prepares it (COM_STMT_PREPARE); later uses on the same
+connection only send the parameters (COM_STMT_EXECUTE). Prepared cursors are
+kept on the underlying MySQL connection, so they live as long as the pooled
+connection does, and are dropped when it reconnects (new connection id) or the
+server no longer knows the statement handle.
+
+Parameters are positional (%s): the connector only skips the re-prepare when
+it gets the very same SQL string, which named parameters would rewrite.
+Set DB_PREPARED=0 to run them as plain queries.
+"""
+import os
+import threading
+
+import mysql.connector
+
+ENABLED = os.getenv("DB_PREPARED", "1") != "0"
+
+# MySQL error for an unknown or deallocated statement handle
+ER_UNKNOWN_STMT_HANDLER = 1243
+
+STATEMENTS = {
+    "cart_id": "SELECT cart_id FROM cart WHERE customer_id = %s",
+    "cart_items": """
+        SELECT ci.variant_id, ci.quantity, ci.cart_id,
+               p.product_id, p.product_name, p.price, p.category,
+               v.size, v.color,
+               COALESCE(SUM(s.quantity), 0) as stock_quantity
+        FROM cart_item ci
+        JOIN product_variant v ON v.variant_id = ci.variant_id
+        JOIN product p ON p.product_id = v.product_id
+        LEFT JOIN stock s ON s.variant_id = ci.variant_id
+        WHERE ci.cart_id = %s
+        GROUP BY ci.variant_id, ci.quantity, ci.cart_id,
+                 p.product_id, p.product_name, p.price, p.category,
+                 v.size, v.color
+    """,
+    "cart_item_quantity": """
+        SELECT quantity FROM cart_item
+        WHERE cart_id = %s AND variant_id = %s
+    """,
+    "order_items": "SELECT variant_id, quantity FROM order_detail WHERE order_id = %s",
+    "warehouse_stock": """
+        SELECT quantity FROM stock
+        WHERE warehouse_id = %s AND variant_id = %s
+    """,
+    "warehouse_stock_for_update": """
+        SELECT quantity FROM stock
+        WHERE warehouse_id = %s AND variant_id = %s
+        FOR UPDATE
+    """,
+}
+
+_lock = threading.Lock()
+_stats = {name: {"prepares": 0, "executes": 0} for name in STATEMENTS}
+
+
+def _count(name, prepared):
+    with _lock:
+        counts = _stats[name]
+        counts["executes"] += 1
+        if prepared:
+            counts["prepares"] += 1
+
+
+def _statement_cursors(raw):
+    """{name: prepared cursor} for this physical connection, reset on reconnect"""
+    connection_id = raw.connection_id
+    cache = getattr(raw, "_ashhab_statements", None)
+    if cache is None or cache[0] != connection_id:
+        cache = (connection_id, {})
+        raw._ashhab_statements = cache
+    return cache[1]
+
+
+def _execute(conn, name, params):
+    sql = STATEMENTS[name]
+    raw = getattr(conn, "raw", conn)
+    if not ENABLED:
+        cur = raw.cursor()
+        cur.execute(sql, params)
+        _count(name, False)
+        return cur
+
+    cursors = _statement_cursors(raw)
+    cur = cursors.get(name)
+    fresh = cur is None
+    if fresh:
+        cur = cursors[name] = raw.cursor(prepared=True)
+    try:
+        cur.execute(sql, params)
+    except mysql.connector.Error as e:
+        if fresh or e.errno != ER_UNKNOWN_STMT_HANDLER:
+            raise
+        # The server dropped the handle (session reset): prepare it again
+        cur = cursors[name] = raw.cursor(prepared=True)
+        cur.execute(sql, params)
+        fresh = True
+    _count(name, fresh)
+    return cur
+
+
+def _rows(cur):
+    columns = [d[0] for d in cur.description or ()]
+    rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    if not ENABLED:
+        cur.close()
+    return rows
+
+
+def fetch_all(conn, name, params=()):
+    """Run a registered statement, returning its rows as dicts"""
+    return _rows(_execute(conn, name, tuple(params)))
+
+
+def fetch_one(conn, name, params=()):
+    """First row of a registered statement as a dict, or None"""
+    rows = fetch_all(conn, name, params)
+    return rows[0] if rows else None
+
+
+def stats():
+    """{name: {"prepares", "executes"}}; prepares stay flat once the pool is warm"""
+    with _lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
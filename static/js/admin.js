@@ -1,5 +1,5 @@
 import { API } from './api.js';
-import { injectLayout, wireLogout, toast, formatCurrency, requireRole, escapeHtml } from "./ui.js";
+import { injectLayout, wireLogout, toast, formatCurrency, requireRole, escapeHtml, primeSession } from "./ui.js";
 
 function qs(sel, root=document){ return root.querySelector(sel); }
 
@@ -90,6 +90,15 @@ function wireProfileButtons() {
 
 // ==================== DASHBOARD ====================
 export async function initAdminDashboard(){
+  // Session, stats, top products and recent orders in one request
+  let boot = {};
+  try {
+    boot = await API.bootstrap("admin");
+    primeSession(boot.session);
+  } catch (e) {
+    console.error(e);
+  }
+
   const sess = await requireRole("admin");
   if (!sess) return;
 
@@ -101,7 +110,7 @@ export async function initAdminDashboard(){
 
   // Load stats
   try {
-    const stats = await API.getAdminStats();
+    const stats = boot.stats || await API.getAdminStats();
     qs("#totalSales").textContent = formatCurrency(stats.total_sales);
     qs("#totalPurchases").textContent = formatCurrency(stats.total_purchases);
     qs("#netEarnings").textContent = formatCurrency(stats.net_earnings);
@@ -117,7 +126,7 @@ export async function initAdminDashboard(){
 
   // Load top products
   try {
-    const topProducts = await API.getTopProducts(10);
+    const topProducts = boot.top_products || await API.getTopProducts(10);
     const tbody = qs("#topProductsBody");
 
     if (!topProducts.length) {
@@ -139,34 +148,133 @@ export async function initAdminDashboard(){
     toast("Error", "Failed to load top products", "bad");
   }
 
+  // Sales over time (from the rollup tables)
+  const salesWindow = qs("#salesWindow");
+  if (salesWindow) {
+    salesWindow.addEventListener("change", () => loadSales(salesWindow.value));
+    loadSales(salesWindow.value);
+  }
+
   // Load recent orders
   try {
-    const orders = await API.getOrders();
-    const tbody = qs("#recentOrdersBody");
-    const recent = orders.slice(0, 5);
-
-    if (!recent.length) {
-      tbody.innerHTML = '<tr><td colspan="6" class="muted">No orders yet.</td></tr>';
-    } else {
-      tbody.innerHTML = recent.map(o => {
-        const customerName = (o.customer_first || '') + ' ' + (o.customer_last || '');
-        const orderDate = new Date(o.order_date).toLocaleDateString();
-        return '<tr>' +
-          '<td><strong>#' + o.order_id + '</strong></td>' +
-          '<td>' + escapeHtml(customerName) + '</td>' +
-          '<td>' + orderDate + '</td>' +
-          '<td><span class="pill">' + escapeHtml(o.status) + '</span></td>' +
-          '<td><strong>' + formatCurrency(o.total_amount) + '</strong></td>' +
-          '<td><a class="btn" href="order.html?id=' + o.order_id + '">View</a></td>' +
-        '</tr>';
-      }).join("");
-    }
+    const page = boot.recent_orders || await API.getOrders({ limit: 5 });
+    const recent = page.orders;
+    renderRecentOrders(recent);
+
+    API.subscribeOrderEvents((type, data) => {
+      const idx = recent.findIndex(o => o.order_id === data.order_id);
+      if (type === "order-created" && idx === -1) {
+        recent.unshift(data);
+        recent.length = Math.min(recent.length, 5);
+      } else if (idx !== -1) {
+        Object.assign(recent[idx], data);
+      }
+      renderRecentOrders(recent);
+    });
   } catch (e) {
     console.error("Orders error:", e);
     toast("Error", "Failed to load orders", "bad");
   }
 }
 
+// The server defaults to the last 24 hours (hourly) / 30 days (daily) in its own time zone
+const SALES_WINDOWS = {
+  "24h": { granularity: "hour" },
+  "30d": { granularity: "day" },
+  "365d": { granularity: "day", days: 365 }
+};
+
+async function loadSales(windowKey){
+  const { granularity, days } = SALES_WINDOWS[windowKey] || SALES_WINDOWS["30d"];
+  const params = { granularity };
+  if (days) {
+    const start = new Date(Date.now() - (days - 1) * 86400000);
+    params.from = [start.getFullYear(), start.getMonth() + 1, start.getDate()]
+      .map(n => String(n).padStart(2, "0")).join("-");
+  }
+
+  try {
+    const [totals, byCategory] = await Promise.all([
+      API.getSalesRollups({ ...params, group: "total" }),
+      API.getSalesRollups({ ...params, group: "category" })
+    ]);
+    renderSalesChart(totals.sales, granularity);
+    renderSalesByCategory(byCategory.sales);
+  } catch (e) {
+    console.error("Sales error:", e);
+    toast("Error", "Failed to load sales", "bad");
+  }
+}
+
+function renderSalesChart(rows, granularity){
+  const chart = qs("#salesChart");
+  if (!chart) return;
+  const sold = rows.filter(r => r.revenue || r.units);
+  if (!sold.length) {
+    chart.innerHTML = '<div class="muted">No sales in this period.</div>';
+    return;
+  }
+  const max = Math.max(...sold.map(r => r.revenue)) || 1;
+  chart.innerHTML = sold.map(r => {
+    const when = new Date(r.bucket);
+    const label = granularity === "hour"
+      ? when.toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" })
+      : when.toLocaleDateString();
+    const width = Math.max(1, Math.round(100 * r.revenue / max));
+    return '<div class="row" style="align-items:center;gap:10px;margin:3px 0">' +
+      '<div class="small" style="width:110px">' + label + '</div>' +
+      '<div style="flex:1"><div style="height:14px;border-radius:4px;background:var(--brand);width:' + width + '%"></div></div>' +
+      '<div class="small" style="width:170px;text-align:right">' + formatCurrency(r.revenue) + ' · ' + r.units + ' units</div>' +
+    '</div>';
+  }).join("");
+}
+
+function renderSalesByCategory(rows){
+  const tbody = qs("#salesByCategoryBody");
+  if (!tbody) return;
+  const totals = {};
+  for (const r of rows) {
+    const t = totals[r.key || "Uncategorized"] ||= { units: 0, revenue: 0, cost: 0 };
+    t.units += r.units;
+    t.revenue += r.revenue;
+    t.cost += r.cost;
+  }
+  const categories = Object.entries(totals).sort((a, b) => b[1].revenue - a[1].revenue);
+  if (!categories.length) {
+    tbody.innerHTML = '<tr><td colspan="5" class="muted">No sales or purchases in this period.</td></tr>';
+    return;
+  }
+  tbody.innerHTML = categories.map(([category, t]) => '<tr>' +
+    '<td><strong>' + escapeHtml(category) + '</strong></td>' +
+    '<td>' + t.units + '</td>' +
+    '<td>' + formatCurrency(t.revenue) + '</td>' +
+    '<td>' + formatCurrency(t.cost) + '</td>' +
+    '<td><strong>' + formatCurrency(t.revenue - t.cost) + '</strong></td>' +
+  '</tr>').join("");
+}
+
+function renderRecentOrders(recent){
+  const tbody = qs("#recentOrdersBody");
+  if (!tbody) return;
+
+  if (!recent.length) {
+    tbody.innerHTML = '<tr><td colspan="6" class="muted">No orders yet.</td></tr>';
+  } else {
+    tbody.innerHTML = recent.map(o => {
+      const customerName = (o.customer_first || '') + ' ' + (o.customer_last || '');
+      const orderDate = new Date(o.order_date).toLocaleDateString();
+      return '<tr>' +
+        '<td><strong>#' + o.order_id + '</strong></td>' +
+        '<td>' + escapeHtml(customerName) + '</td>' +
+        '<td>' + orderDate + '</td>' +
+        '<td><span class="pill">' + escapeHtml(o.status) + '</span></td>' +
+        '<td><strong>' + formatCurrency(o.total_amount) + '</strong></td>' +
+        '<td><a class="btn" href="order.html?id=' + o.order_id + '">View</a></td>' +
+      '</tr>';
+    }).join("");
+  }
+}
+
 // ==================== EMPLOYEES ====================
 export async function initAdminEmployees(){
   const sess = await requireRole("admin");
@@ -290,6 +398,21 @@ export async function initAdminEmployees(){
   renderEmployees();
 }
 
+// Local copy of a catalog list kept current with ?since= deltas: the first
+// sync loads everything, later ones only fetch rows changed since then.
+function deltaList(fetchChanges, key, compare){
+  const byId = new Map();
+  let version = 0;
+  return async function sync(){
+    const delta = await fetchChanges(version);
+    if (delta.full) byId.clear();
+    delta.upserts.forEach(row => byId.set(row[key], row));
+    delta.deletes.forEach(id => byId.delete(id));
+    version = delta.version;
+    return Array.from(byId.values()).sort(compare);
+  };
+}
+
 // ==================== PRODUCTS ====================
 export async function initAdminProducts(){
   const sess = await requireRole("admin");
@@ -301,10 +424,18 @@ export async function initAdminProducts(){
   let allProducts = [];
   let currentEditProductId = null;
 
+  const syncProducts = deltaList(
+    (since) => API.getProductChanges(since, {
+      fields: "product_name,description,price,category,image_url,featured,variant_count"
+    }),
+    "product_id",
+    (a, b) => a.product_id - b.product_id
+  );
+
   async function renderProducts(filter){
     filter = filter || "";
     try {
-      allProducts = await API.getProducts();
+      allProducts = await syncProducts();
       const tbody = qs("#productsBody");
 
       const filtered = filter ?
@@ -324,7 +455,7 @@ export async function initAdminProducts(){
           '<td>' + escapeHtml(p.category) + '</td>' +
           '<td><strong>' + formatCurrency(p.price) + '</strong></td>' +
           '<td>' + featuredText + '</td>' +
-          '<td>' + (p.variants ? p.variants.length : 0) + ' variants</td>' +
+          '<td>' + (p.variant_count ?? (p.variants ? p.variants.length : 0)) + ' variants</td>' +
           '<td>' +
             '<button class="btn" data-editprod="' + p.product_id + '" data-name="' +
             escapeHtml(p.product_name) + '" data-price="' + p.price + '">Edit Price</button> ' +
@@ -445,10 +576,16 @@ export async function initAdminStock(){
 
   let allStock = [];
 
+  const syncStock = deltaList(
+    (since) => API.getStockChanges(since),
+    "variant_id",
+    (a, b) => (a.product_id - b.product_id) || (a.variant_id - b.variant_id)
+  );
+
   async function renderStock(filter){
     filter = filter || "";
     try {
-      allStock = await API.getStock();
+      allStock = await syncStock();
       const tbody = qs("#stockBody");
       const lowStockBody = qs("#lowStockBody");
 
@@ -507,109 +644,144 @@ export async function initAdminOrders(){
   await injectLayout();
   wireLogout();
 
+  const PAGE_SIZE = 50;
+  let rows = [];
+  let nextCursor = null;
+
+  const filterStatus = qs("#filterStatus");
+  const searchOrder = qs("#searchOrder");
+  const filterFrom = qs("#filterFrom");
+  const filterTo = qs("#filterTo");
+  const moreBtn = qs("#ordersMore");
+
+  function currentFilters(){
+    return {
+      status: filterStatus ? filterStatus.value : "All",
+      q: (searchOrder ? searchOrder.value : "").trim(),
+      from: filterFrom ? filterFrom.value : "",
+      to: filterTo ? filterTo.value : ""
+    };
+  }
+
   async function acceptOrder(orderId) {
     try {
       await API.acceptOrder(orderId);
       toast("Accepted", `Order #${orderId} accepted. Stock updated.`, "ok");
-      renderOrders(
-        qs("#filterStatus")?.value || "All",
-        qs("#searchOrder")?.value || ""
-      );
+      // The order-accepted event updates the row
     } catch (e) {
       toast("Error", e.message, "bad");
     }
   }
 
-  async function renderOrders(statusFilter, searchFilter){
-    statusFilter = statusFilter || "All";
-    searchFilter = (searchFilter || "").toLowerCase();
-
-    try {
-      const orders = await API.getOrders();
-      const tbody = qs("#ordersBody");
-      const noOrders = qs("#noOrders");
+  // New orders only need to appear when the Pending/All view is unfiltered
+  function acceptsNewOrder(){
+    const f = currentFilters();
+    return (f.status === "All" || f.status === "Pending") && !f.q && !f.from && !f.to;
+  }
 
-      let filtered = orders;
+  function applyOrderEvent(type, data){
+    if (type === "resync") {
+      renderOrders();
+      return;
+    }
 
-      if (statusFilter !== "All") {
-        filtered = filtered.filter(o => o.status === statusFilter);
-      }
+    const idx = rows.findIndex(o => o.order_id === data.order_id);
+    if (type === "order-created") {
+      if (idx === -1 && acceptsNewOrder()) rows.unshift(data);
+    } else if (idx !== -1) {
+      Object.assign(rows[idx], data);
+      const status = currentFilters().status;
+      if (status !== "All" && rows[idx].status !== status) rows.splice(idx, 1);
+    }
+    renderRows();
+  }
 
-      if (searchFilter) {
-        filtered = filtered.filter(o => {
-          const customerName = ((o.customer_first || '') + ' ' + (o.customer_last || '')).toLowerCase();
-          const orderId = String(o.order_id);
-          return customerName.includes(searchFilter) || orderId.includes(searchFilter);
-        });
-      }
+  function renderRows(){
+    const tbody = qs("#ordersBody");
+    const noOrders = qs("#noOrders");
 
-      if (!filtered.length) {
-        tbody.innerHTML = '';
-        noOrders.style.display = "block";
-      } else {
-        noOrders.style.display = "none";
-        tbody.innerHTML = filtered.map(o => {
-          const statusColors = {
-            'Pending': 'var(--warn)',
-            'Accepted': 'var(--ok)',
-            'Cancelled': 'var(--bad)'
-          };
-          const statusColor = statusColors[o.status] || 'var(--text)';
-          const customerName = (o.customer_first || '') + ' ' + (o.customer_last || '');
-          const employeeName = o.employee_first ?
-            (o.employee_first + ' ' + o.employee_last) : '-';
-          const orderDate = new Date(o.order_date).toLocaleString();
-          const acceptBtn = o.status === 'Pending'
-            ? '<button class="btn ok" data-accept="' + o.order_id + '">Accept</button> '
-            : '';
+    if (!rows.length) {
+      tbody.innerHTML = '';
+      noOrders.style.display = "block";
+    } else {
+      noOrders.style.display = "none";
+      tbody.innerHTML = rows.map(o => {
+        const statusColors = {
+          'Pending': 'var(--warn)',
+          'Accepted': 'var(--ok)',
+          'Cancelled': 'var(--bad)'
+        };
+        const statusColor = statusColors[o.status] || 'var(--text)';
+        const customerName = (o.customer_first || '') + ' ' + (o.customer_last || '');
+        const employeeName = o.employee_first ?
+          (o.employee_first + ' ' + o.employee_last) : '-';
+        const orderDate = new Date(o.order_date).toLocaleString();
+        const acceptBtn = o.status === 'Pending'
+          ? '<button class="btn ok" data-accept="' + o.order_id + '">Accept</button> '
+          : '';
 
-          return '<tr>' +
-            '<td><strong>#' + o.order_id + '</strong></td>' +
-            '<td>' + escapeHtml(customerName) + '</td>' +
-            '<td>' + orderDate + '</td>' +
-            '<td><span class="pill" style="background:' + statusColor + '20;color:' + statusColor + ';border-color:' + statusColor + '40">' +
-              escapeHtml(o.status) + '</span></td>' +
-            '<td><strong>' + formatCurrency(o.total_amount) + '</strong></td>' +
-            '<td>' + escapeHtml(employeeName) + '</td>' +
-            '<td>' +
-              '<a class="btn ghost" href="order.html?id=' + o.order_id + '">View Items</a>' +
-            '</td>' +
-            '<td>' +
-              acceptBtn +
-              '<a class="btn" href="order.html?id=' + o.order_id + '">Details</a>' +
-            '</td>' +
-          '</tr>';
-        }).join("");
+        return '<tr>' +
+          '<td><strong>#' + o.order_id + '</strong></td>' +
+          '<td>' + escapeHtml(customerName) + '</td>' +
+          '<td>' + orderDate + '</td>' +
+          '<td><span class="pill" style="background:' + statusColor + '20;color:' + statusColor + ';border-color:' + statusColor + '40">' +
+            escapeHtml(o.status) + '</span></td>' +
+          '<td><strong>' + formatCurrency(o.total_amount) + '</strong></td>' +
+          '<td>' + escapeHtml(employeeName) + '</td>' +
+          '<td>' +
+            '<a class="btn ghost" href="order.html?id=' + o.order_id + '">View Items</a>' +
+          '</td>' +
+          '<td>' +
+            acceptBtn +
+            '<a class="btn" href="order.html?id=' + o.order_id + '">Details</a>' +
+          '</td>' +
+        '</tr>';
+      }).join("");
 
-        // Wire accept buttons
-        tbody.querySelectorAll('button[data-accept]').forEach(btn => {
-          btn.addEventListener('click', () => {
-            acceptOrder(Number(btn.dataset.accept));
-          });
+      // Wire accept buttons
+      tbody.querySelectorAll('button[data-accept]').forEach(btn => {
+        btn.addEventListener('click', () => {
+          acceptOrder(Number(btn.dataset.accept));
         });
-      }
+      });
+    }
+
+    if (moreBtn) moreBtn.style.display = nextCursor ? "inline-flex" : "none";
+  }
+
+  // Filtering and paging happen on the server
+  async function renderOrders(more = false){
+    try {
+      const page = await API.getOrders({
+        ...currentFilters(),
+        limit: PAGE_SIZE,
+        cursor: more ? nextCursor : null
+      });
+      rows = more ? rows.concat(page.orders) : page.orders;
+      nextCursor = page.next_cursor;
+      renderRows();
     } catch (e) {
       console.error("Orders error:", e);
       toast("Error", "Failed to load orders", "bad");
     }
   }
 
-  const filterStatus = qs("#filterStatus");
-  const searchOrder = qs("#searchOrder");
+  let searchTimer = null;
 
-  if (filterStatus) {
-    filterStatus.addEventListener("change", (e) => {
-      renderOrders(e.target.value, searchOrder ? searchOrder.value : "");
-    });
-  }
+  if (filterStatus) filterStatus.addEventListener("change", () => renderOrders());
+  if (filterFrom) filterFrom.addEventListener("change", () => renderOrders());
+  if (filterTo) filterTo.addEventListener("change", () => renderOrders());
+  if (moreBtn) moreBtn.addEventListener("click", () => renderOrders(true));
+  API.subscribeOrderEvents(applyOrderEvent);
 
   if (searchOrder) {
-    searchOrder.addEventListener("input", (e) => {
-      renderOrders(filterStatus ? filterStatus.value : "All", e.target.value);
+    searchOrder.addEventListener("input", () => {
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(() => renderOrders(), 250);
     });
   }
 
-  renderOrders("All", "");
+  renderOrders();
 }
 
 // ==================== SUPPLIERS ====================
@@ -785,6 +957,12 @@ export async function initAdminPurchases(){
   const notes = qs('#notes');
   const purchasesBody = qs('#purchasesBody');
   const noPurchases = qs('#noPurchases');
+  const linesBody = qs('#linesBody');
+  const noLines = qs('#noLines');
+  const deliveryTotal = qs('#deliveryTotal');
+
+  // Lines of the delivery being entered; submitted together as one purchase order
+  let lines = [];
 
   function calcTotal(){
     const q = Number(qty?.value || 0);
@@ -793,6 +971,66 @@ export async function initAdminPurchases(){
     if (totalCost) totalCost.value = isFinite(t) ? t.toFixed(2) : '0.00';
   }
 
+  function renderLines(){
+    if (!linesBody) return;
+
+    linesBody.innerHTML = lines.map((l, idx) => `
+      <tr>
+        <td>${escapeHtml(l.label)}</td>
+        <td>${l.quantity}</td>
+        <td>${formatCurrency(l.unit_cost)}</td>
+        <td>${formatCurrency(l.quantity * l.unit_cost)}</td>
+        <td><button class="btn danger" type="button" data-delline="${idx}">Remove</button></td>
+      </tr>
+    `).join('');
+
+    linesBody.querySelectorAll('button[data-delline]').forEach(btn => {
+      btn.addEventListener('click', () => {
+        lines.splice(Number(btn.dataset.delline), 1);
+        renderLines();
+      });
+    });
+
+    if (noLines) noLines.style.display = lines.length ? 'none' : 'block';
+    const total = lines.reduce((sum, l) => sum + l.quantity * l.unit_cost, 0);
+    if (deliveryTotal) deliveryTotal.textContent = total.toFixed(2);
+  }
+
+  function readLine(){
+    const line = {
+      variant_id: Number(variantSelect?.value),
+      quantity: Number(qty?.value),
+      unit_cost: Number(unitCost?.value),
+      label: variantSelect?.selectedOptions[0]?.textContent || ''
+    };
+
+    if (!line.variant_id) {
+      toast('Missing', 'Please choose an item', 'bad');
+      return null;
+    }
+    if (!line.quantity || line.quantity <= 0) {
+      toast('Missing', 'Quantity must be > 0', 'bad');
+      return null;
+    }
+    if (unitCost?.value === '' || Number.isNaN(line.unit_cost) || line.unit_cost < 0) {
+      toast('Missing', 'Unit cost must be >= 0', 'bad');
+      return null;
+    }
+    return line;
+  }
+
+  function addLine(){
+    const line = readLine();
+    if (!line) return false;
+
+    lines.push(line);
+    if (qty) qty.value = '1';
+    if (unitCost) unitCost.value = '';
+    calcTotal();
+    renderLines();
+    return true;
+  }
+
   async function loadSuppliers(){
     if (!supplierSelect) return;
 
@@ -817,7 +1055,7 @@ export async function initAdminPurchases(){
     if (!variantSelect) return;
 
     try {
-      const stock = await API.getStock();
+      const stock = await API.getStock("product_name,size,color,stock_quantity");
       // Sort: product_name then size/color
       stock.sort((a,b) => {
         const pa = (a.product_name || '').toLowerCase();
@@ -896,15 +1134,17 @@ export async function initAdminPurchases(){
   }
 
   async function loadAllData(){
-    await loadSuppliers();
-    await loadVariants();
-    await loadPurchases();
+    // Issued together so api.js sends them as one /api/batch request
+    await Promise.all([loadSuppliers(), loadVariants(), loadPurchases()]);
   }
 
   // Wire events
   if (qty) qty.addEventListener('input', calcTotal);
   if (unitCost) unitCost.addEventListener('input', calcTotal);
 
+  const addLineBtn = qs('#addLine');
+  if (addLineBtn) addLineBtn.addEventListener('click', addLine);
+
   const refreshData = qs('#refreshData');
   if (refreshData) refreshData.addEventListener('click', loadAllData);
 
@@ -922,39 +1162,30 @@ export async function initAdminPurchases(){
         return;
       }
 
+      // A filled-in line that was not added yet is part of the delivery too
+      if (unitCost && unitCost.value !== '' && !addLine()) return;
+      if (!lines.length) {
+        toast('Missing', 'Add at least one line', 'bad');
+        return;
+      }
+
       const payload = {
         supplier_id: supplierId,
-        variant_id: Number(variantSelect?.value),
-        quantity: Number(qty?.value),
-        unit_cost: Number(unitCost?.value),
+        lines: lines.map(l => ({ variant_id: l.variant_id, quantity: l.quantity, unit_cost: l.unit_cost })),
         notes: (notes?.value || '').trim(),
       };
 
-      if (!payload.variant_id) {
-        toast('Missing', 'Please choose an item', 'bad');
-        return;
-      }
-      if (!payload.quantity || payload.quantity <= 0) {
-        toast('Missing', 'Quantity must be > 0', 'bad');
-        return;
-      }
-      if (Number.isNaN(payload.unit_cost) || payload.unit_cost < 0) {
-        toast('Missing', 'Unit cost must be >= 0', 'bad');
-        return;
-      }
-
       try {
-        await API.createPurchase(payload);
-        toast('Added', 'Purchase recorded and stock updated', 'ok');
+        const res = await API.createPurchase(payload);
+        toast('Added', `Delivery recorded (${res.lines} lines) and stock updated`, 'ok');
 
-        // reset minimal fields
-        if (qty) qty.value = '1';
-        if (unitCost) unitCost.value = '';
+        // reset the delivery
+        lines = [];
+        renderLines();
         if (notes) notes.value = '';
         calcTotal();
 
-        await loadPurchases();
-        await loadVariants();
+        await Promise.all([loadPurchases(), loadVariants()]);
 
       } catch (err) {
         console.error('Create purchase error:', err);
@@ -964,5 +1195,6 @@ export async function initAdminPurchases(){
   }
 
   calcTotal();
+  renderLines();
   await loadAllData();
 }
\ No newline at end of file
@@ -1,6 +1,166 @@
 // API client for MySQL backend
+
+// ---- Client cache (stale-while-revalidate) ----
+// Cached GETs are kept in memory and in localStorage with the server's ETag.
+// A hit is returned immediately; if it is older than FRESH_MS it is revalidated
+// in the background (If-None-Match) and onUpdate(data) fires when it changed.
+// The session (who is logged in) is only kept in memory, never in localStorage.
+const CACHE_PREFIX = 'ashhab-api:';
+const FRESH_MS = 5000;
+const MEMORY_ONLY = ['/api/session'];
+const memoryCache = new Map();   // url -> { etag, data, at }
+const revalidating = new Map();  // url -> in-flight Promise
+let generation = 0;              // bumped by invalidate(); older fetches aren't stored
+
+// Mutations invalidate the cached reads they can change (matched by URL prefix)
+// once their response is in, so a read racing the mutation can't be kept.
+// Login/logout/signup change who is asking, so they drop everything.
+const INVALIDATES = [
+  ['/api/login', ['']],
+  ['/api/logout', ['']],
+  ['/api/signup', ['']],
+  ['/api/cart', ['/api/cart']],
+  ['/api/orders', ['/api/orders', '/api/cart', '/api/products']],
+  ['/api/products', ['/api/products', '/api/categories']],
+  ['/api/stock', ['/api/products', '/api/stock']],
+  ['/api/purchases', ['/api/products', '/api/stock', '/api/purchases']],
+  ['/api/admin/import', ['/api/products', '/api/categories', '/api/stock']],
+  ['/api/customer/profile', ['/api/session']],
+  ['/api/employee/profile', ['/api/session']],
+];
+
+function memoryOnly(url) {
+  return MEMORY_ONLY.some(prefix => url.startsWith(prefix));
+}
+
+function readEntry(url) {
+  if (memoryCache.has(url)) return memoryCache.get(url);
+  if (memoryOnly(url)) return null;
+  try {
+    const raw = localStorage.getItem(CACHE_PREFIX + url);
+    if (!raw) return null;
+    const entry = JSON.parse(raw);
+    memoryCache.set(url, entry);
+    return entry;
+  } catch {
+    return null;
+  }
+}
+
+function writeEntry(url, entry) {
+  memoryCache.set(url, entry);
+  if (memoryOnly(url)) return;
+  try {
+    localStorage.setItem(CACHE_PREFIX + url, JSON.stringify(entry));
+  } catch {
+    // quota exceeded or storage disabled: the memory copy still works
+  }
+}
+
+function invalidate(prefix = '') {
+  generation++;
+  for (const url of Array.from(memoryCache.keys())) {
+    if (url.startsWith(prefix)) memoryCache.delete(url);
+  }
+  for (const url of Array.from(revalidating.keys())) {
+    if (url.startsWith(prefix)) revalidating.delete(url);
+  }
+  try {
+    for (let i = localStorage.length - 1; i >= 0; i--) {
+      const key = localStorage.key(i);
+      if (key && key.startsWith(CACHE_PREFIX + prefix)) localStorage.removeItem(key);
+    }
+  } catch {
+    // storage disabled
+  }
+}
+
+// Sessions persisted by older versions of this file
+MEMORY_ONLY.forEach(prefix => {
+  try {
+    localStorage.removeItem(CACHE_PREFIX + prefix);
+  } catch {
+    // storage disabled
+  }
+});
+
+function invalidateFor(url) {
+  const path = url.split('?')[0];
+  INVALIDATES.forEach(([mutated, reads]) => {
+    if (path.startsWith(mutated)) reads.forEach(invalidate);
+  });
+}
+
+// ---- Request coalescing ----
+// Plain GETs issued in the same tick are sent together through /api/batch.
+// A lone call goes out as a normal request.
+const BATCH_MAX = 20;   // server limit per /api/batch call
+let batchQueue = [];
+
+function apiError(status, errorData) {
+  const err = new Error((errorData && errorData.error) ? errorData.error : 'Request failed');
+  // Attach extra info (e.g., redirect hints) without breaking existing callers.
+  err.data = errorData;
+  err.status = status;
+  return err;
+}
+
+function enqueueGet(url) {
+  return new Promise((resolve, reject) => {
+    batchQueue.push({ url, resolve, reject });
+    if (batchQueue.length === 1) queueMicrotask(flushBatch);
+  });
+}
+
+async function flushBatch() {
+  const queued = batchQueue.splice(0, BATCH_MAX);
+  if (batchQueue.length) queueMicrotask(flushBatch);
+
+  if (queued.length === 1) {
+    const { url, resolve, reject } = queued[0];
+    return API.send(url).then(resolve, reject);
+  }
+
+  try {
+    const response = await fetch('/api/batch', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ requests: queued.map(q => ({ path: q.url })) })
+    });
+    if (!response.ok) throw apiError(response.status, await response.json().catch(() => null));
+
+    const { responses } = await response.json();
+    queued.forEach((q, i) => {
+      const r = responses[i];
+      if (r.status >= 200 && r.status < 300) {
+        q.resolve(r.body);
+      } else {
+        const err = apiError(r.status, r.body);
+        console.error('API Error:', err);
+        q.reject(err);
+      }
+    });
+  } catch (error) {
+    console.error('API Error:', error);
+    queued.forEach(q => q.reject(error));
+  }
+}
+
 export const API = {
+  invalidate,
+
   async request(url, options = {}) {
+    const method = (options.method || 'GET').toUpperCase();
+    if (method !== 'GET') {
+      // Even a failed mutation may have changed something: invalidate either way
+      return this.send(url, options).finally(() => invalidateFor(url));
+    }
+    if (!options.body && !options.headers) return enqueueGet(url);
+    return this.send(url, options);
+  },
+
+  // Single fetch, no coalescing
+  async send(url, options = {}) {
     try {
       const response = await fetch(url, {
         ...options,
@@ -17,11 +177,7 @@ export const API = {
         } catch {
           // ignore JSON parse errors
         }
-        const err = new Error((errorData && errorData.error) ? errorData.error : 'Request failed');
-        // Attach extra info (e.g., redirect hints) without breaking existing callers.
-        err.data = errorData;
-        err.status = response.status;
-        throw err;
+        throw apiError(response.status, errorData);
       }
 
       return await response.json();
@@ -31,17 +187,108 @@ export const API = {
     }
   },
 
+  // GET through the client cache. options.onUpdate(data) is called if a
+  // background revalidation brings back different data.
+  async cached(url, { onUpdate } = {}) {
+    const entry = readEntry(url);
+    if (!entry) return this.revalidate(url);
+
+    if (Date.now() - entry.at > FRESH_MS) {
+      this.revalidate(url)
+        .then(data => { if (onUpdate && data !== entry.data) onUpdate(data); })
+        .catch(() => {});
+    }
+    return entry.data;
+  },
+
+  // Fetch url with If-None-Match; returns the cached data on 304
+  revalidate(url) {
+    if (revalidating.has(url)) return revalidating.get(url);
+
+    const entry = readEntry(url);
+    const started = generation;
+    const headers = { 'Content-Type': 'application/json' };
+    if (entry && entry.etag) headers['If-None-Match'] = entry.etag;
+
+    const pending = fetch(url, { headers })
+      .then(async response => {
+        if (response.status === 304 && entry) {
+          if (started === generation) writeEntry(url, { ...entry, at: Date.now() });
+          return entry.data;
+        }
+        if (!response.ok) {
+          let errorData = null;
+          try { errorData = await response.json(); } catch { /* ignore */ }
+          throw apiError(response.status, errorData);
+        }
+        const data = await response.json();
+        // Invalidated while in flight: the response may predate the mutation
+        if (started === generation) {
+          writeEntry(url, { etag: response.headers.get('ETag'), data, at: Date.now() });
+        }
+        return data;
+      })
+      .finally(() => {
+        if (revalidating.get(url) === pending) revalidating.delete(url);
+      });
+
+    revalidating.set(url, pending);
+    return pending;
+  },
+
+  // Page bootstrap: session + a page's initial data in one request
+  async bootstrap(page, params = {}) {
+    const query = new URLSearchParams(params).toString();
+    return this.request(`/api/bootstrap/${page}` + (query ? `?${query}` : ''));
+  },
+
   // Products
-  async getProducts() {
-    return this.request('/api/products');
+  // options: { fields: "product_name,price", include: "variants", onUpdate }
+  async getProducts({ fields, include, onUpdate } = {}) {
+    const query = new URLSearchParams();
+    if (fields) query.set('fields', fields);
+    if (include) query.set('include', include);
+    const qsStr = query.toString();
+    return this.cached('/api/products' + (qsStr ? `?${qsStr}` : ''), { onUpdate });
+  },
+
+  // Products changed since a catalog version (0 = everything):
+  // { version, full, upserts, deletes }
+  async getProductChanges(since, { fields, include } = {}) {
+    const query = new URLSearchParams({ since });
+    if (fields) query.set('fields', fields);
+    if (include) query.set('include', include);
+    return this.request(`/api/products?${query}`);
+  },
+
+  async getProduct(id, options) {
+    return this.cached(`/api/products/${id}`, options);
+  },
+
+  // -> { source: "content" | "category", products: [{ product_id, product_name, price, ... }] }
+  async getSimilarProducts(id, limit = 6) {
+    return this.request(`/api/products/${id}/similar?limit=${limit}`);
   },
 
-  async getProduct(id) {
-    return this.request(`/api/products/${id}`);
+  async getCategories(options) {
+    return this.cached('/api/categories', options);
   },
 
-  async getCategories() {
-    return this.request('/api/categories');
+  // { product_id } or { customer } -> { source: "co-purchase" | "featured", product_ids }
+  async getRecommendations(params, limit = 6) {
+    const query = new URLSearchParams({ ...params, limit });
+    return this.request(`/api/recommendations?${query}`);
+  },
+
+  // Faceted search. selected: { category: ["Shoes"], size: ["M", "L"], in_stock: ["1"] }
+  // -> { version, total, product_ids, facets: { facet: [{ value, count }] } }
+  async getFacets(selected = {}) {
+    const query = new URLSearchParams();
+    for (const [facet, values] of Object.entries(selected)) {
+      [].concat(values).forEach(v => query.append(facet, v));
+    }
+    const qsStr = query.toString();
+    return this.request('/api/facets' + (qsStr ? `?${qsStr}` : ''));
   },
 
   async createProduct(data) {
@@ -76,8 +323,8 @@ export const API = {
     return this.request('/api/logout', { method: 'POST' });
   },
 
-  async getSession() {
-    return this.request('/api/session');
+  async getSession(options) {
+    return this.cached('/api/session', options);
   },
 
   async signup(data) {
@@ -135,8 +382,29 @@ export const API = {
   },
 
   // Orders
-  async getOrders() {
-    return this.request('/api/orders');
+  // params: { status, from, to, customer_id, employee_id, mine, q, limit, cursor }
+  // With limit/cursor the server returns { orders, next_cursor }.
+  async getOrders(params = {}) {
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([k, v]) => {
+      if (v !== undefined && v !== null && v !== '') query.set(k, v);
+    });
+    const qsStr = query.toString();
+    return this.request('/api/orders' + (qsStr ? `?${qsStr}` : ''));
+  },
+
+  async getOrderCounts() {
+    return this.request('/api/orders/counts');
+  },
+
+  // Live order queue updates (employees). onEvent(type, data) receives
+  // order-created, order-accepted, status-changed and resync events.
+  subscribeOrderEvents(onEvent) {
+    const source = new EventSource('/api/orders/stream');
+    ['order-created', 'order-accepted', 'status-changed', 'resync'].forEach(type => {
+      source.addEventListener(type, (e) => onEvent(type, JSON.parse(e.data || '{}')));
+    });
+    return source;
   },
 
   async createOrder() {
@@ -209,8 +477,15 @@ export const API = {
   },
 
   // Stock (admin)
-  async getStock() {
-    return this.request('/api/stock');
+  async getStock(fields) {
+    return this.request('/api/stock' + (fields ? `?fields=${encodeURIComponent(fields)}` : ''));
+  },
+
+  // Stock rows changed since a catalog version, same shape as getProductChanges
+  async getStockChanges(since, fields) {
+    const query = new URLSearchParams({ since });
+    if (fields) query.set('fields', fields);
+    return this.request(`/api/stock?${query}`);
   },
 
   async updateStock(variantId, quantity) {
@@ -229,6 +504,11 @@ export const API = {
     return this.request(`/api/admin/top-products?limit=${limit}`);
   },
 
+  async getSalesRollups(params = {}) {
+    const query = new URLSearchParams(params).toString();
+    return this.request('/api/admin/sales' + (query ? `?${query}` : ''));
+  },
+
   // Payment Info
   async getPaymentInfo() {
     return this.request('/api/payment-info');
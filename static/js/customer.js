@@ -1,15 +1,15 @@
 import { API } from './api.js';
-import { injectLayout, wireLogout, toast, formatCurrency, requireRole, escapeHtml } from "./ui.js";
+import { injectLayout, wireLogout, toast, formatCurrency, requireRole, escapeHtml, primeSession } from "./ui.js";
 
 function qs(sel, root=document){ return root.querySelector(sel); }
 
-async function renderCart(){
+async function renderCart(preloaded){
   const tbody = qs("#cartBody");
   const totalEl = qs("#cartTotal");
   if (!tbody) return;
 
   try {
-    const items = await API.getCart();
+    const items = preloaded || await API.getCart();
 
     if (!items.length){
       tbody.innerHTML = `<tr><td colspan="6" class="muted">Your cart is empty.</td></tr>`;
@@ -83,12 +83,12 @@ async function checkout(){
   }
 }
 
-async function renderOrders(){
+async function renderOrders(preloaded){
   const tbody = qs("#ordersBody");
   if (!tbody) return;
 
   try {
-    const orders = await API.getOrders();
+    const orders = preloaded || await API.getOrders();
 
     if (!orders.length){
       tbody.innerHTML = `<tr><td colspan="5" class="muted">No orders yet.</td></tr>`;
@@ -179,6 +179,15 @@ async function saveProfile(e) {
 }
 
 export async function initCustomer(){
+  // Session, cart and orders in one request
+  let boot = {};
+  try {
+    boot = await API.bootstrap("customer");
+    primeSession(boot.session);
+  } catch (e) {
+    console.error(e);
+  }
+
   const sess = await requireRole("customer");
   if (!sess) return;
 
@@ -187,8 +196,8 @@ export async function initCustomer(){
 
   qs("#who").textContent = sess.name;
 
-  renderCart();
-  renderOrders();
+  renderCart(boot.cart);
+  renderOrders(boot.orders);
 
   qs("#btnCheckout").addEventListener("click", ()=>checkout());
 
@@ -1,68 +1,169 @@
 import { API } from './api.js';
-import { injectLayout, wireLogout, toast, formatCurrency, requireRole, escapeHtml } from "./ui.js";
+import { injectLayout, wireLogout, toast, formatCurrency, requireRole, escapeHtml, primeSession } from "./ui.js";
 
 function qs(sel, root=document){ return root.querySelector(sel); }
 
+const PAGE_SIZE = 25;
+
+// Each queue is a server-filtered, cursor-paginated list
+const queues = {
+  pending: { params: { status: 'Pending' }, rows: [], cursor: null },
+  mine: { params: { mine: 1 }, rows: [], cursor: null }
+};
+const counts = { pending: 0, mine: 0 };
+let me = null;
+
 async function acceptOrder(orderId){
   try {
     await API.acceptOrder(orderId);
     toast("Accepted", `Order #${orderId} accepted. Stock updated.`, "ok");
-    renderOrders();
+    // The order-accepted event updates both queues
   } catch (e) {
     toast("Error", e.message, "bad");
   }
 }
 
-async function renderOrders(){
+function showCounts(){
+  qs("#pendingCount").textContent = counts.pending;
+  qs("#mineCount").textContent = counts.mine;
+}
+
+// Apply one pushed order event to the local queues
+function applyOrderEvent(type, data){
+  const pending = queues.pending.rows;
+  const mine = queues.mine.rows;
+  const pendingIdx = pending.findIndex(o => o.order_id === data.order_id);
+
+  if (type === "resync") {
+    renderOrders();
+    return;
+  }
+
+  if (type === "order-created") {
+    if (pendingIdx !== -1) return;
+    pending.unshift(data);
+    counts.pending += 1;
+  } else {
+    const order = pendingIdx !== -1 ? pending[pendingIdx] : mine.find(o => o.order_id === data.order_id);
+    if (order) Object.assign(order, data);
+
+    // Only pending orders can be accepted, so that event always shrinks the queue
+    if (data.status !== "Pending" && (pendingIdx !== -1 || type === "order-accepted")) {
+      if (pendingIdx !== -1) pending.splice(pendingIdx, 1);
+      counts.pending = Math.max(counts.pending - 1, 0);
+    }
+    if (type === "order-accepted" && data.employee_id === me) {
+      counts.mine += 1;
+      if (order && !mine.includes(order)) mine.unshift(order);
+    }
+  }
+
+  renderPending();
+  renderMine();
+  showCounts();
+}
+
+async function loadQueue(name, more = false){
+  const queue = queues[name];
+  const page = await API.getOrders({
+    ...queue.params,
+    limit: PAGE_SIZE,
+    cursor: more ? queue.cursor : null
+  });
+  queue.rows = more ? queue.rows.concat(page.orders) : page.orders;
+  queue.cursor = page.next_cursor;
+}
+
+async function renderCounts(){
   try {
-    const orders = await API.getOrders();
-
-    const pending = orders.filter(o => o.status === 'Pending');
-    const mine = orders.filter(o => o.status !== 'Pending');
-
-    // Pending orders
-    const pb = qs("#pendingBody");
-    if (pb){
-      if (!pending.length){
-        pb.innerHTML = `<tr><td colspan="6" class="muted">No pending orders.</td></tr>`;
-      } else {
-        pb.innerHTML = pending.map(o=>`
-          <tr>
-            <td><strong>#${o.order_id}</strong></td>
-            <td>${escapeHtml(o.customer_first + ' ' + o.customer_last)}</td>
-            <td>${new Date(o.order_date).toLocaleString()}</td>
-            <td><strong>${formatCurrency(o.total_amount)}</strong></td>
-            <td><a class="btn" href="order.html?id=${o.order_id}">View</a></td>
-            <td><button class="btn ok" data-accept="${o.order_id}">Accept</button></td>
-          </tr>
-        `).join("");
-
-        pb.querySelectorAll("button[data-accept]").forEach(btn=>{
-          btn.addEventListener("click", ()=>{
-            acceptOrder(Number(btn.dataset.accept));
-          });
+    const res = await API.getOrderCounts();
+    counts.pending = res.pending || 0;
+    counts.mine = res.mine || 0;
+    showCounts();
+  } catch (e) {
+    console.error("Counts error:", e);
+  }
+}
+
+function renderPending(){
+  const pending = queues.pending.rows;
+  const pb = qs("#pendingBody");
+  if (pb){
+    if (!pending.length){
+      pb.innerHTML = `<tr><td colspan="6" class="muted">No pending orders.</td></tr>`;
+    } else {
+      pb.innerHTML = pending.map(o=>`
+        <tr>
+          <td><strong>#${o.order_id}</strong></td>
+          <td>${escapeHtml(o.customer_first + ' ' + o.customer_last)}</td>
+          <td>${new Date(o.order_date).toLocaleString()}</td>
+          <td><strong>${formatCurrency(o.total_amount)}</strong></td>
+          <td><a class="btn" href="order.html?id=${o.order_id}">View</a></td>
+          <td><button class="btn ok" data-accept="${o.order_id}">Accept</button></td>
+        </tr>
+      `).join("");
+
+      pb.querySelectorAll("button[data-accept]").forEach(btn=>{
+        btn.addEventListener("click", ()=>{
+          acceptOrder(Number(btn.dataset.accept));
         });
-      }
+      });
     }
+  }
+  const more = qs("#pendingMore");
+  if (more) more.style.display = queues.pending.cursor ? "inline-flex" : "none";
+}
 
-    // My orders
-    const mb = qs("#mineBody");
-    if (mb){
-      if (!mine.length){
-        mb.innerHTML = `<tr><td colspan="6" class="muted">No orders assigned yet.</td></tr>`;
-      } else {
-        mb.innerHTML = mine.map(o=>`
-          <tr>
-            <td><strong>#${o.order_id}</strong></td>
-            <td>${escapeHtml(o.customer_first + ' ' + o.customer_last)}</td>
-            <td>${escapeHtml(o.status)}</td>
-            <td><strong>${formatCurrency(o.total_amount)}</strong></td>
-            <td><a class="btn" href="order.html?id=${o.order_id}">Details</a></td>
-            <td></td>
-          </tr>
-        `).join("");
-      }
+function renderMine(){
+  const mine = queues.mine.rows;
+  const mb = qs("#mineBody");
+  if (mb){
+    if (!mine.length){
+      mb.innerHTML = `<tr><td colspan="6" class="muted">No orders assigned yet.</td></tr>`;
+    } else {
+      mb.innerHTML = mine.map(o=>`
+        <tr>
+          <td><strong>#${o.order_id}</strong></td>
+          <td>${escapeHtml(o.customer_first + ' ' + o.customer_last)}</td>
+          <td>${escapeHtml(o.status)}</td>
+          <td><strong>${formatCurrency(o.total_amount)}</strong></td>
+          <td><a class="btn" href="order.html?id=${o.order_id}">Details</a></td>
+          <td></td>
+        </tr>
+      `).join("");
+    }
+  }
+  const more = qs("#mineMore");
+  if (more) more.style.display = queues.mine.cursor ? "inline-flex" : "none";
+}
+
+function setQueue(name, page){
+  queues[name].rows = page.orders;
+  queues[name].cursor = page.next_cursor;
+}
+
+async function renderOrders(boot){
+  try {
+    if (boot && boot.pending) {
+      setQueue("pending", boot.pending);
+      setQueue("mine", boot.mine);
+      counts.pending = boot.counts.pending || 0;
+      counts.mine = boot.counts.mine || 0;
+      showCounts();
+    } else {
+      await Promise.all([loadQueue("pending"), loadQueue("mine"), renderCounts()]);
     }
+    renderPending();
+    renderMine();
+  } catch (e) {
+    toast("Error", "Failed to load orders", "bad");
+  }
+}
+
+async function loadMore(name){
+  try {
+    await loadQueue(name, true);
+    name === "pending" ? renderPending() : renderMine();
   } catch (e) {
     toast("Error", "Failed to load orders", "bad");
   }
@@ -137,6 +238,15 @@ async function saveProfile(e) {
 }
 
 export async function initEmployee(){
+  // Session, both queues and their counts in one request
+  let boot = null;
+  try {
+    boot = await API.bootstrap("employee");
+    primeSession(boot.session);
+  } catch (e) {
+    console.error(e);
+  }
+
   const sess = await requireRole("employee");
   if (!sess) return;
 
@@ -144,7 +254,12 @@ export async function initEmployee(){
   wireLogout();
 
   qs("#who").textContent = sess.name;
-  renderOrders();
+  me = sess.id;
+  await renderOrders(boot);
+  API.subscribeOrderEvents(applyOrderEvent);
+
+  qs("#pendingMore")?.addEventListener("click", () => loadMore("pending"));
+  qs("#mineMore")?.addEventListener("click", () => loadMore("mine"));
 
   // Wire profile edit buttons
   const btnEditProfile = qs("#btnEditProfile");
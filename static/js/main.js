@@ -1,5 +1,5 @@
 import { API } from './api.js';
-import { injectLayout, wireLogout, toast, formatCurrency, getSession } from "./ui.js";
+import { injectLayout, wireLogout, toast, formatCurrency, getSession, primeSession, readBootData } from "./ui.js";
 
 function qs(sel, root=document){ return root.querySelector(sel); }
 function qsa(sel, root=document){ return Array.from(root.querySelectorAll(sel)); }
@@ -11,15 +11,24 @@ function escapeHtml(s){
 }
 
 let allProducts = [];
+let featuredProducts = [];  // featured picks shown while there are no co-purchase ones
+let facetIds = null;      // ids matching the size/color/price/stock filters (null: none set)
+let facetRequest = 0;
+let recommendedIds = null;  // co-purchase picks for the logged-in customer (null: featured)
+
+const FACET_PLACEHOLDERS = { size: "Any size", color: "Any color", price: "Any price" };
 
 function productCard(p){
   const firstVar = (p.variants && p.variants[0]) ? p.variants[0].variant_id : null;
-  const stock = (p.variants || []).reduce((s,v)=>s+Number(v.stock_quantity||0),0);
+  const stock = (p.variants || []).reduce((s,v)=>s+Number(v.available_quantity ?? v.stock_quantity ?? 0),0);
+  // Server-rendered data carries no stock (it is cached across reservations)
+  const stockKnown = (p.variants || []).some(v => v.available_quantity !== undefined || v.stock_quantity !== undefined);
+  const badge = stockKnown ? ` • ${stock > 0 ? stock + " in stock" : "out of stock"}` : "";
   return `
   <article class="card">
     <a class="img" href="product.html?id=${p.product_id}">
       <img src="${p.image_url}" alt="${escapeHtml(p.product_name)}" onerror="this.src='/assets/img/products/placeholder.jpg'">
-      <span class="badge">${escapeHtml(p.category)} • ${stock > 0 ? stock + " in stock" : "out of stock"}</span>
+      <span class="badge">${escapeHtml(p.category)}${badge}</span>
     </a>
     <div class="body">
       <div class="titleRow">
@@ -76,6 +85,7 @@ function applyFilters(){
 
   let filtered = allProducts.slice();
   if (cat && cat !== "All") filtered = filtered.filter(p => p.category === cat);
+  if (facetIds) filtered = filtered.filter(p => facetIds.has(p.product_id));
   if (q) filtered = filtered.filter(p =>
     (p.product_name||"").toLowerCase().includes(q) ||
     (p.description||"").toLowerCase().includes(q) ||
@@ -83,8 +93,13 @@ function applyFilters(){
   );
 
   renderProducts(filtered);
+  renderRecommended();
+}
 
-  const rec = allProducts.filter(p => p.featured).slice(0,6);
+function renderRecommended(){
+  const rec = recommendedIds
+    ? recommendedIds.map(id => allProducts.find(p => p.product_id === id)).filter(Boolean)
+    : featuredProducts;
   const recWrap = qs("#recommendedGrid");
   if (recWrap) {
     recWrap.innerHTML = rec.map(productCard).join("");
@@ -92,23 +107,109 @@ function applyFilters(){
   }
 }
 
+// Customers get picks from their own purchase history; everyone else keeps featured
+async function loadRecommendations(){
+  const sess = await getSession();
+  if (!sess || sess.type !== "customer") return;
+  try {
+    const res = await API.getRecommendations({ customer: sess.id });
+    if (res.source !== "co-purchase") return;
+    recommendedIds = res.product_ids;
+    renderRecommended();
+  } catch (e) {
+    console.error(e);
+  }
+}
+
+function selectedFacets(){
+  const selected = {};
+  const cat = qs("#categorySelect")?.value;
+  if (cat && cat !== "All") selected.category = [cat];
+  qsa("#facetFilters select[data-facet]").forEach(sel => {
+    if (sel.value) selected[sel.dataset.facet] = [sel.value];
+  });
+  if (qs("#inStockToggle")?.checked) selected.in_stock = ["1"];
+  return selected;
+}
+
+function renderFacetOptions(facets){
+  qsa("#facetFilters select[data-facet]").forEach(sel => {
+    const current = sel.value;
+    const values = facets[sel.dataset.facet] || [];
+    sel.innerHTML = `<option value="">${FACET_PLACEHOLDERS[sel.dataset.facet]}</option>` +
+      values.map(({ value, count }) =>
+        `<option value="${escapeHtml(value)}" ${count ? "" : "disabled"}>${escapeHtml(value)} (${count})</option>`
+      ).join("");
+    sel.value = current;
+  });
+  const stock = (facets.in_stock || [])[0];
+  const label = qs("#inStockCount");
+  if (label) label.textContent = stock ? `(${stock.count})` : "";
+}
+
+// Counts depend on every filter, so any change asks the server again
+async function refreshFacets(render = true){
+  const request = ++facetRequest;
+  const { category, ...filters } = selectedFacets();
+  try {
+    const result = await API.getFacets(category ? { category, ...filters } : filters);
+    if (request !== facetRequest) return;
+    renderFacetOptions(result.facets);
+    facetIds = Object.keys(filters).length ? new Set(result.product_ids) : null;
+  } catch (e) {
+    if (request !== facetRequest) return;
+    console.error(e);
+    facetIds = null;
+  }
+  if (render) applyFilters();
+}
+
+function setProducts(products){
+  allProducts = products;
+  featuredProducts = products.filter(p => p.featured).slice(0,6);
+}
+
+// The server renders the first page of products without stock: after first paint
+// fetch the full list with live availability
+async function loadLiveProducts(boot){
+  if (boot.total === undefined) return;   // bootstrap API data is complete and live
+  try {
+    setProducts(await API.getProducts({ onUpdate: products => { setProducts(products); applyFilters(); } }));
+    applyFilters();
+  } catch (e) {
+    console.error(e);
+  }
+}
+
 export async function initMain(){
+  // Server-rendered page: products are already painted, only the session is missing
+  let boot = readBootData();
+  if (!boot) {
+    try {
+      // Session, products and categories in one request
+      boot = await API.bootstrap("storefront");
+      primeSession(boot.session);
+    } catch (e) {
+      console.error(e);
+    }
+  }
+
   await injectLayout("home");
   wireLogout();
 
   try {
-    // Load products
-    allProducts = await API.getProducts();
-
-    // Load categories
-    const categories = await API.getCategories();
-    const cats = ["All", ...categories];
+    if (!boot) throw new Error("Bootstrap failed");
+    allProducts = boot.products;
+    featuredProducts = boot.featured || boot.products.filter(p => p.featured).slice(0,6);
+    const cats = ["All", ...boot.categories];
 
     // Render category filters
     const chips = qs("#categoryChips");
     const select = qs("#categorySelect");
 
-    if (chips && select) {
+    const rendered = chips && chips.children.length > 0;
+
+    if (chips && select && !rendered) {
       cats.forEach((c, idx)=>{
         const chip = document.createElement("div");
         chip.className = "chip" + (idx===0 ? " active" : "");
@@ -128,7 +229,7 @@ export async function initMain(){
     qs("#categorySelect")?.addEventListener("change", ()=>{
       const v = qs("#categorySelect").value;
       qsa(".chip").forEach(ch => ch.classList.toggle("active", ch.dataset.cat === v));
-      applyFilters();
+      refreshFacets();
     });
     qs("#categoryChips")?.addEventListener("click", (e)=>{
       const chip = e.target.closest(".chip");
@@ -137,10 +238,23 @@ export async function initMain(){
       qsa(".chip").forEach(ch => ch.classList.toggle("active", ch===chip));
       const sel = qs("#categorySelect");
       if (sel) sel.value = v;
-      applyFilters();
+      refreshFacets();
     });
+    qsa("#facetFilters select[data-facet]").forEach(sel => sel.addEventListener("change", ()=>refreshFacets()));
+    qs("#inStockToggle")?.addEventListener("change", ()=>refreshFacets());
 
-    applyFilters();
+    const filtered = (qs("#searchInput")?.value || "").trim() || (select && select.value !== "All");
+    if (rendered && !filtered) {
+      // Hydrate the server-rendered cards instead of re-rendering them
+      wireQuickAdd(qs("#productsGrid"));
+      wireQuickAdd(qs("#recommendedGrid"));
+      refreshFacets(false);
+    } else {
+      applyFilters();
+      refreshFacets(false);
+    }
+    loadLiveProducts(boot);
+    loadRecommendations();
   } catch (e) {
     toast("Error", "Failed to load products", "bad");
     console.error(e);
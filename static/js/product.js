@@ -1,5 +1,5 @@
 import { API } from './api.js';
-import { injectLayout, wireLogout, toast, formatCurrency, getSession, escapeHtml } from "./ui.js";
+import { injectLayout, wireLogout, toast, formatCurrency, getSession, escapeHtml, primeSession, readBootData } from "./ui.js";
 
 function qs(sel, root=document){ return root.querySelector(sel); }
 
@@ -12,25 +12,72 @@ function unique(list){
   return Array.from(new Set(list));
 }
 
+function similarCard(p){
+  return `
+  <article class="card">
+    <a class="img" href="product.html?id=${p.product_id}">
+      <img src="${escapeHtml(p.image_url)}" alt="${escapeHtml(p.product_name)}" onerror="this.src='/assets/img/products/placeholder.jpg'">
+      <span class="badge">${escapeHtml(p.category)}</span>
+    </a>
+    <div class="body">
+      <div class="titleRow">
+        <h3>${escapeHtml(p.product_name)}</h3>
+        <div class="price">${formatCurrency(p.price)}</div>
+      </div>
+      <div class="actions">
+        <a class="btn" href="product.html?id=${p.product_id}">View</a>
+      </div>
+    </div>
+  </article>
+  `;
+}
+
+async function loadSimilar(productId){
+  try {
+    const { products } = await API.getSimilarProducts(productId);
+    if (!products.length) return;
+    qs("#similarGrid").innerHTML = products.map(similarCard).join("");
+    qs("#similar").hidden = false;
+  } catch (e) {
+    console.error(e);
+  }
+}
+
 export async function initProduct(){
+  const id = getParam("id");
+
+  // Server-rendered page carries the product; otherwise fetch it with the session
+  let boot = readBootData();
+  if (!boot) {
+    try {
+      boot = await API.bootstrap("product", { id: id || "" });
+      primeSession(boot.session);
+    } catch (e) {
+      if (e.data && "session" in e.data) primeSession(e.data.session);
+    }
+  }
+
   await injectLayout();
   wireLogout();
 
-  const id = getParam("id");
-
   try {
-    const p = await API.getProduct(id);
+    if (!boot) throw new Error("Product not found");
+    const p = boot.product;
 
     qs("#pName").textContent = p.product_name;
     qs("#pDesc").textContent = p.description || "";
     qs("#pPrice").textContent = formatCurrency(p.price);
     qs("#pCat").textContent = p.category;
+    loadSimilar(p.product_id);
 
     const img = qs("#pImg");
     img.src = p.image_url;
     img.onerror = () => { img.src = "/assets/img/products/placeholder.jpg"; };
 
-    const vars = p.variants;
+    // The server-rendered page is cached without stock; fetch it live
+    let vars = p.variants;
+    const live = vars.some(v => v.available_quantity !== undefined || v.stock_quantity !== undefined);
+
     const sizes = unique(vars.map(v=>v.size));
     const colors = unique(vars.map(v=>v.color));
 
@@ -42,9 +89,10 @@ export async function initProduct(){
 
     function refresh(){
       const v = vars.find(x => x.size === selSize.value && x.color === selColor.value);
-      const stock = v ? v.stock_quantity : 0;
-      qs("#pStock").textContent = stock > 0 ? `${stock} available` : "out of stock";
-      qs("#btnAdd").disabled = !(v && stock > 0);
+      const known = !v || v.available_quantity !== undefined || v.stock_quantity !== undefined;
+      const stock = v ? (v.available_quantity ?? v.stock_quantity) : 0;
+      qs("#pStock").textContent = !known ? "checking…" : stock > 0 ? `${stock} available` : "out of stock";
+      qs("#btnAdd").disabled = !(v && known && stock > 0);
       qs("#btnAdd").dataset.variant = v ? String(v.variant_id) : "";
       qs("#btnAdd").dataset.product = String(p.product_id);
     }
@@ -53,6 +101,11 @@ export async function initProduct(){
     selColor.addEventListener("change", refresh);
     refresh();
 
+    if (!live) {
+      const update = product => { vars = product.variants; refresh(); };
+      API.getProduct(p.product_id, { onUpdate: update }).then(update).catch(e => console.error(e));
+    }
+
     qs("#btnAdd").addEventListener("click", async ()=>{
       const sess = await getSession();
       if (!sess || sess.type !== "customer"){
@@ -0,0 +1,106 @@
+// Service worker, served from /sw.js so it controls every page.
+// The server prepends ASSET_VERSION (a hash of static/js + static/css) and
+// PRECACHE_URLS, so any change to the static files installs a new worker and
+// replaces the old caches. PRECACHE_URLS includes OFFLINE_URL.
+/* global ASSET_VERSION, PRECACHE_URLS */
+
+const SHELL_CACHE = `shell-${ASSET_VERSION}`;
+const DATA_CACHE = `data-${ASSET_VERSION}`;
+const IMAGE_CACHE = 'images-v1';   // product photos do not change with the build
+const MAX_IMAGES = 120;
+const OFFLINE_URL = '/offline.html';
+
+// Catalog reads: network first, last good response when offline
+const NETWORK_FIRST_API = ['/api/products', '/api/categories'];
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(SHELL_CACHE)
+      .then(cache => cache.addAll(PRECACHE_URLS))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  const keep = new Set([SHELL_CACHE, DATA_CACHE, IMAGE_CACHE]);
+  event.waitUntil(
+    caches.keys()
+      .then(names => Promise.all(names.filter(n => !keep.has(n)).map(n => caches.delete(n))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const req = event.request;
+  if (req.method !== 'GET') return;
+
+  const url = new URL(req.url);
+  if (url.origin !== self.location.origin) return;
+
+  if (req.mode === 'navigate') {
+    event.respondWith(networkFirst(req, SHELL_CACHE));
+  } else if (NETWORK_FIRST_API.includes(url.pathname)) {
+    event.respondWith(networkFirst(req, DATA_CACHE));
+  } else if (isProductImage(url)) {
+    event.respondWith(cachedImage(event, req));
+  } else if (url.pathname.startsWith('/static/js/') || url.pathname.startsWith('/static/css/')) {
+    event.respondWith(cacheFirst(req, SHELL_CACHE));
+  }
+  // everything else (other API calls, SSE) goes straight to the network
+});
+
+function isProductImage(url) {
+  return /\/img\/products\/[^/]+\.(jpe?g|png|webp)$/i.test(url.pathname);
+}
+
+async function networkFirst(req, cacheName) {
+  const cache = await caches.open(cacheName);
+  try {
+    const res = await fetch(req);
+    if (res.ok) cache.put(req, res.clone());
+    return res;
+  } catch (e) {
+    // Match the full URL: product.html?id=5 must not get another product's page
+    const hit = await cache.match(req);
+    if (hit) return hit;
+    if (req.mode === 'navigate') {
+      const offline = await caches.match(OFFLINE_URL, { cacheName: SHELL_CACHE });
+      if (offline) return offline;
+    }
+    throw e;
+  }
+}
+
+async function cacheFirst(req, cacheName) {
+  const cache = await caches.open(cacheName);
+  const hit = await cache.match(req);
+  if (hit) return hit;
+  const res = await fetch(req);
+  if (res.ok) cache.put(req, res.clone());
+  return res;
+}
+
+// Cache keys come back in insertion order, so re-inserting on every hit keeps
+// the least recently used image first and trimming drops from the front.
+async function cachedImage(event, req) {
+  const cache = await caches.open(IMAGE_CACHE);
+  const hit = await cache.match(req);
+  if (hit) {
+    const copy = hit.clone();
+    event.waitUntil(cache.delete(req).then(() => cache.put(req, copy)));
+    return hit;
+  }
+
+  const res = await fetch(req);
+  if (res.ok) {
+    event.waitUntil(cache.put(req, res.clone()).then(() => trimImages(cache)));
+  }
+  return res;
+}
+
+async function trimImages(cache) {
+  const keys = await cache.keys();
+  for (let i = 0; i < keys.length - MAX_IMAGES; i++) {
+    await cache.delete(keys[i]);
+  }
+}
@@ -36,12 +36,17 @@ export function escapeHtml(s) {
 }
 
 let currentSession = null;
+let sessionLoaded = false;
 
 export async function getSession() {
-  if (!currentSession) {
+  if (!sessionLoaded) {
     try {
-      const data = await API.getSession();
+      // Served from the client cache; a background revalidation corrects it
+      const data = await API.getSession({
+        onUpdate: (fresh) => { currentSession = fresh.logged_in ? fresh.user : null; }
+      });
       currentSession = data.logged_in ? data.user : null;
+      sessionLoaded = true;
     } catch (e) {
       currentSession = null;
     }
@@ -49,8 +54,27 @@ export async function getSession() {
   return currentSession;
 }
 
+// Seed the session from a bootstrap response so getSession() needs no request
+export function primeSession(user) {
+  currentSession = user || null;
+  sessionLoaded = true;
+}
+
 export function clearSessionCache() {
   currentSession = null;
+  sessionLoaded = false;
+  API.invalidate('/api/session');
+}
+
+// Catalog data embedded by the server alongside the pre-rendered HTML
+export function readBootData(){
+  const el = document.getElementById("bootData");
+  if (!el) return null;
+  try {
+    return JSON.parse(el.textContent);
+  } catch (e) {
+    return null;
+  }
 }
 
 export function roleLabel(sess) {
@@ -60,7 +84,17 @@ export function roleLabel(sess) {
   return "User";
 }
 
+// Service worker (served by the app at /sw.js): app shell, product images and
+// the catalog stay available on repeat visits and flaky connections
+let swRegistered = false;
+function registerServiceWorker() {
+  if (swRegistered || !("serviceWorker" in navigator)) return;
+  swRegistered = true;
+  navigator.serviceWorker.register("/sw.js").catch(e => console.warn("Service worker:", e));
+}
+
 export async function injectLayout(active = "") {
+  registerServiceWorker();
   const sess = await getSession();
   const header = document.getElementById("appHeader");
   const footer = document.getElementById("appFooter");